@@ -0,0 +1,183 @@
+"""
+Admission control. Requests are sorted by their route into classes (cheap point reads, list
+scans, writes, exports), and each class runs at most its limit of requests at once per worker
+with a bounded queue behind it. A request that finds the queue full, or waits in it longer
+than the queue timeout, is answered at once with a 503 and Retry-After instead of waiting on
+the pool, so overload sheds the excess and the admitted requests stay fast. Health checks,
+metrics and change streams are never queued.
+"""
+import asyncio
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Sequence
+import orjson
+from starlette.routing import BaseRoute
+from config import Settings
+
+# Seconds a shed request is asked to wait before retrying
+ADMISSION_RETRY_AFTER = 1
+
+# Path prefixes admitted without limit: probes, metrics and per-worker stats must answer under
+# overload, and change streams hold no connection while they wait for events
+EXEMPT_PREFIXES = (
+    "/health", "/metrics", "/cache/", "/admission/", "/debug/", "/changes",
+    "/static/", "/docs", "/redoc", "/openapi.json"
+)
+
+# GET routes reading whole tables
+EXPORT_ROUTES = {"/inventory/export"}
+
+ADMISSION_CLASSES = ("point", "list", "write", "export")
+
+SHED_BODY = orjson.dumps({"detail": "Server is busy, retry shortly"})
+
+# Path parameters in route templates, and the numeric segments they match in request paths
+_TEMPLATE_PARAMETER = re.compile(r"/\{[^}/]+\}")
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+class Limiter:
+    """At most limit holders at once; up to queue_size more wait in arrival order, for up to queue_timeout seconds"""
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.shed = {"queue_full": 0, "timeout": 0}
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed; False if the request is shed"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.shed["queue_full"] += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.shed["timeout"] += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the client went away: pass it on
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        return True
+
+    def _discard(self, waiter: asyncio.Future):
+        # release() may already have skipped past it while its cancellation completed
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+
+    def release(self):
+        """Hand the slot to the longest-waiting request, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class Admission:
+    """The limiter of each admission class, and the class of each GET route's path shape"""
+
+    def __init__(self):
+        self.enabled = False
+        self.read_classes: Dict[str, str] = {}
+        self.limiters: Dict[str, Limiter] = {}
+
+    def configure(self, settings: Settings, routes: Sequence[BaseRoute]):
+        self.enabled = settings.admission_control
+        self.read_classes = {}
+        for route in routes:
+            if "GET" not in (getattr(route, "methods", None) or ()):
+                continue
+            template = route.path
+            if template in EXPORT_ROUTES:
+                name = "export"
+            else:
+                # /items/{item_id} reads one row; /items and /stations/{station_id}/inventory read pages
+                name = "point" if template.endswith("}") else "list"
+            self.read_classes[_TEMPLATE_PARAMETER.sub("/{}", template)] = name
+        self.limiters = {
+            name: Limiter(
+                getattr(settings, f"admission_{name}_limit"),
+                getattr(settings, f"admission_{name}_queue"),
+                settings.admission_write_queue_timeout if name == "write" else settings.admission_queue_timeout
+            )
+            for name in ADMISSION_CLASSES
+        }
+
+    def classify(self, scope: Dict[str, Any]) -> Optional[str]:
+        """
+        Admission class of a request, or None if it is admitted without limit. GETs are looked
+        up by path shape (ids replaced, as every path parameter is one), so classifying costs
+        one substitution rather than matching the routes the router matches right after.
+        """
+        path = scope["path"]
+        if path.startswith(EXEMPT_PREFIXES):
+            return None
+        if scope["method"] not in ("GET", "HEAD"):
+            return "write"
+        return self.read_classes.get(_ID_SEGMENT.sub("/{}", path), "point")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "limit": limiter.limit,
+                "active": limiter.active,
+                "queued": limiter.queued,
+                "queue_size": limiter.queue_size,
+                "shed": dict(limiter.shed),
+            }
+            for name, limiter in self.limiters.items()
+        }
+
+
+admission = Admission()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware holding each request's class slot until its response is sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not admission.enabled:
+            await self.app(scope, receive, send)
+            return
+        name = admission.classify(scope)
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        limiter = admission.limiters[name]
+        if not await limiter.acquire():
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(SHED_BODY)).encode()),
+                    (b"retry-after", str(ADMISSION_RETRY_AFTER).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": SHED_BODY})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
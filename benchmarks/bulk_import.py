@@ -0,0 +1,89 @@
+"""
+Compare bulk import throughput against the per-row write path.
+
+Inserts the same rows twice into a scratch station: once with the statements the
+single-row endpoints run (POST /items, POST /stations/{id}/inventory) and once through
+the COPY-based bulk importer. Everything created is deleted afterwards.
+
+    python -m benchmarks.bulk_import --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+import asyncpg
+from bulk import import_items, import_station_inventory
+from cli import get_database_url
+from repository import GalacticConnection, Repository, init_connection
+
+
+async def _per_row_items(repo: Repository, names):
+    for name in names:
+        await repo.create("items", name, None, None)
+
+
+async def _per_row_inventory(repo: Repository, station_id: int, item_ids):
+    for item_id in item_ids:
+        await repo.adjust_station_inventory(station_id, item_id, 1)
+
+
+async def _timed(coroutine) -> float:
+    start = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - start
+
+
+def _rate(rows: int, seconds: float) -> dict:
+    return {"seconds": round(seconds, 3), "rows_per_second": round(rows / seconds, 1)}
+
+
+async def run(dsn: str, rows: int) -> dict:
+    conn = await asyncpg.connect(dsn, connection_class=GalacticConnection)
+    await init_connection(conn)
+    repo = Repository(conn)
+    prefix = f"bench-{time.time_ns()}"
+    station_id = await conn.fetchval(
+        "INSERT INTO galactic_stations (name, description) VALUES ($1, NULL) RETURNING id", prefix
+    )
+    try:
+        per_row_names = [f"{prefix}-row-{n}" for n in range(rows)]
+        bulk_names = [f"{prefix}-bulk-{n}" for n in range(rows)]
+        items_per_row = await _timed(_per_row_items(repo, per_row_names))
+        items_bulk = await _timed(import_items(
+            repo, "".join(json.dumps({"name": name}) + "\n" for name in bulk_names), "ndjson"
+        ))
+
+        item_ids = [
+            row["id"] for row in await conn.fetch(
+                "SELECT id FROM galactic_items WHERE name LIKE $1 ORDER BY id LIMIT $2", prefix + "-%", rows
+            )
+        ]
+        inventory_per_row = await _timed(_per_row_inventory(repo, station_id, item_ids))
+        inventory_bulk = await _timed(import_station_inventory(
+            repo, station_id, "".join(json.dumps({"galactic_item_id": i}) + "\n" for i in item_ids), "ndjson"
+        ))
+        return {
+            "rows": rows,
+            "items": {"per_row": _rate(rows, items_per_row), "bulk": _rate(rows, items_bulk)},
+            "station_inventory": {
+                "per_row": _rate(len(item_ids), inventory_per_row),
+                "bulk": _rate(len(item_ids), inventory_bulk),
+            },
+        }
+    finally:
+        await conn.execute("DELETE FROM galactic_stations_inventory WHERE galactic_station_id = $1", station_id)
+        await conn.execute("DELETE FROM galactic_stations WHERE id = $1", station_id)
+        await conn.execute("DELETE FROM galactic_items WHERE name LIKE $1", prefix + "-%")
+        await conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Rows to insert per path (default: 10000)")
+    parser.add_argument("--dsn", default=None, help="Database URL (default: DATABASE_URL)")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args.dsn or get_database_url(), args.rows)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Drive load against a running API and report throughput and latency for every route.
+
+Each route in routers/ is a scenario. Scenarios run one after another, each sending
+--requests requests with --concurrency of them in flight, and the report gives
+requests per second and p50/p95/p99 latency per scenario as JSON. Ids are sampled
+from the database, so seed it first (python -m benchmarks.seed). With the same
+--seed, every run sends the same requests.
+
+Only reads run by default. With --writes the write routes run too: they work on rows
+the driver creates, named with a per-run prefix, and whatever is left of them is
+deleted through the API at the end.
+
+    python -m benchmarks.load --base-url http://localhost:8000 --concurrency 32 --requests 2000
+"""
+import argparse
+import asyncio
+import fnmatch
+import itertools
+import json
+import random
+import sys
+import time
+import asyncpg
+import httpx
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from cli import get_database_url
+from pagination import encode_cursor
+
+# Ids sampled from each table for the read scenarios
+ID_SAMPLE_SIZE = 1000
+
+# Rows per request in the bulk import scenarios
+BULK_ROWS = 100
+
+# Catalogs whose rows the write scenarios create, with their paths
+CREATED_CATALOGS = {
+    "item_types": "/item-types",
+    "items": "/items",
+    "stations": "/stations",
+    "planets": "/planets",
+}
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+class Context:
+    """Ids the scenarios draw from, and the rows created by the write scenarios"""
+
+    def __init__(self, samples: Dict[str, List[Any]], prefix: str):
+        self.samples = samples
+        self.prefix = prefix
+        self.created: Dict[str, List[Any]] = {name: [] for name in CREATED_CATALOGS}
+        self.created["station_inventory"] = []
+        self.created["planet_inventory"] = []
+        self._names = itertools.count(1)
+
+    def sample(self, name: str, rng: random.Random) -> Any:
+        return rng.choice(self.samples[name])
+
+    def name(self, kind: str) -> str:
+        return f"{self.prefix} {kind} {next(self._names)}"
+
+    def created_row(self, name: str, rng: random.Random) -> Optional[Any]:
+        rows = self.created[name]
+        return rng.choice(rows) if rows else None
+
+    def take_created(self, name: str) -> Optional[Any]:
+        rows = self.created[name]
+        return rows.pop() if rows else None
+
+    def record(self, name: str, value: Any):
+        if value not in self.created[name]:
+            self.created[name].append(value)
+
+
+class Scenario(NamedTuple):
+    name: str
+    # Builds the next request, or returns None when the scenario has nothing left to do
+    build: Callable[[Context, random.Random], Optional[Request]]
+    writes: bool = False
+    # Called with each successful response, e.g. to remember a created row
+    record: Optional[Callable[[Context, httpx.Response], None]] = None
+    # Cap on requests for scenarios that read whole tables
+    max_requests: Optional[int] = None
+
+
+def _get(path: str, **params: Any) -> Request:
+    return "GET", path, {"params": params}
+
+
+def _ndjson(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "content": "".join(json.dumps(row) + "\n" for row in rows),
+        "headers": {"Content-Type": "application/x-ndjson"},
+    }
+
+
+def _record_id(name: str) -> Callable[[Context, httpx.Response], None]:
+    return lambda ctx, response: ctx.record(name, response.json()["id"])
+
+
+def _record_inventory(name: str, location_column: str) -> Callable[[Context, httpx.Response], None]:
+    return lambda ctx, response: ctx.record(name, (response.json()[location_column], response.json()["id"]))
+
+
+def _with_created(
+    name: str,
+    build: Callable[[Context, random.Random, Any], Request]
+) -> Callable[[Context, random.Random], Optional[Request]]:
+    """Build requests for rows created by an earlier scenario, stopping if there are none"""
+    def build_request(ctx: Context, rng: random.Random) -> Optional[Request]:
+        row = ctx.created_row(name, rng)
+        return None if row is None else build(ctx, rng, row)
+    return build_request
+
+
+def _delete_created(name: str, path: str) -> Callable[[Context, random.Random], Optional[Request]]:
+    def build_request(ctx: Context, rng: random.Random) -> Optional[Request]:
+        row = ctx.take_created(name)
+        return None if row is None else ("DELETE", path.format(*row if isinstance(row, tuple) else (row,)), {})
+    return build_request
+
+
+def _catalog_body(ctx: Context, kind: str) -> Dict[str, Any]:
+    return {"json": {"name": ctx.name(kind), "description": "Load test"}}
+
+
+def _station_inventory_for_item(ctx: Context, rng: random.Random) -> Request:
+    station_id, item_id = ctx.sample("station_items", rng)
+    return _get(f"/stations/{station_id}/inventory", item_id=item_id)
+
+
+READ_SCENARIOS = [
+    Scenario("GET /health", lambda ctx, rng: _get("/health")),
+    Scenario("GET /items", lambda ctx, rng: _get("/items")),
+    Scenario("GET /items?after", lambda ctx, rng: _get("/items", after=encode_cursor([ctx.sample("items", rng)]))),
+    Scenario("GET /items?item_type_id", lambda ctx, rng: _get("/items", item_type_id=ctx.sample("item_types", rng))),
+    Scenario("GET /items?name", lambda ctx, rng: _get("/items", name=ctx.sample("item_names", rng))),
+    Scenario("GET /items?name_prefix", lambda ctx, rng: _get("/items", name_prefix=ctx.sample("item_names", rng)[:4])),
+    Scenario("GET /items/search", lambda ctx, rng: _get("/items/search", prefix=ctx.sample("item_names", rng)[:6])),
+    Scenario("GET /items/stations", lambda ctx, rng: _get(
+        "/items/stations", item_ids=[ctx.sample("items", rng) for _ in range(5)]
+    )),
+    Scenario("GET /items/{id}", lambda ctx, rng: _get(f"/items/{ctx.sample('items', rng)}")),
+    Scenario("GET /items/{id}/stations", lambda ctx, rng: _get(f"/items/{ctx.sample('items', rng)}/stations")),
+    Scenario("GET /item-types", lambda ctx, rng: _get("/item-types")),
+    Scenario("GET /item-types/{id}", lambda ctx, rng: _get(f"/item-types/{ctx.sample('item_types', rng)}")),
+    Scenario("GET /stations", lambda ctx, rng: _get("/stations", after=encode_cursor([ctx.sample("stations", rng)]))),
+    Scenario("GET /stations?include=inventory", lambda ctx, rng: _get(
+        "/stations", include="inventory", limit=20, inventory_limit=20,
+        after=encode_cursor([ctx.sample("stations", rng)])
+    )),
+    Scenario("GET /stations/{id}", lambda ctx, rng: _get(f"/stations/{ctx.sample('stations', rng)}")),
+    Scenario("GET /stations/{id}/inventory", lambda ctx, rng: _get(
+        f"/stations/{ctx.sample('stations', rng)}/inventory"
+    )),
+    Scenario("GET /stations/{id}/inventory?item_id", _station_inventory_for_item),
+    Scenario("GET /planets", lambda ctx, rng: _get("/planets", after=encode_cursor([ctx.sample("planets", rng)]))),
+    Scenario("GET /planets/{id}", lambda ctx, rng: _get(f"/planets/{ctx.sample('planets', rng)}")),
+    Scenario("GET /planets/{id}/inventory", lambda ctx, rng: _get(f"/planets/{ctx.sample('planets', rng)}/inventory")),
+    Scenario("GET /inventory/export", lambda ctx, rng: _get("/inventory/export"), max_requests=5),
+]
+
+WRITE_SCENARIOS = [
+    Scenario(
+        "POST /item-types", lambda ctx, rng: ("POST", "/item-types", _catalog_body(ctx, "type")),
+        writes=True, record=_record_id("item_types")
+    ),
+    Scenario("PUT /item-types/{id}", _with_created("item_types", lambda ctx, rng, item_type_id: (
+        "PUT", f"/item-types/{item_type_id}", _catalog_body(ctx, "type")
+    )), writes=True),
+    Scenario("POST /items", lambda ctx, rng: ("POST", "/items", {"json": {
+        "name": ctx.name("item"), "description": "Load test", "item_type_id": ctx.sample("item_types", rng)
+    }}), writes=True, record=_record_id("items")),
+    Scenario("PUT /items/{id}", _with_created("items", lambda ctx, rng, item_id: ("PUT", f"/items/{item_id}", {
+        "json": {"name": ctx.name("item"), "description": "Renamed", "item_type_id": None}
+    })), writes=True),
+    Scenario("POST /items/bulk", lambda ctx, rng: ("POST", "/items/bulk", _ndjson(
+        [{"name": ctx.name("item")} for _ in range(BULK_ROWS)]
+    )), writes=True),
+    Scenario(
+        "POST /stations", lambda ctx, rng: ("POST", "/stations", _catalog_body(ctx, "station")),
+        writes=True, record=_record_id("stations")
+    ),
+    Scenario("PUT /stations/{id}", _with_created("stations", lambda ctx, rng, station_id: (
+        "PUT", f"/stations/{station_id}", _catalog_body(ctx, "station")
+    )), writes=True),
+    Scenario("POST /stations/{id}/inventory", _with_created("stations", lambda ctx, rng, station_id: (
+        "POST", f"/stations/{station_id}/inventory",
+        {"params": {"item_id": ctx.sample("items", rng), "quantity": rng.randint(1, 100)}}
+    )), writes=True, record=_record_inventory("station_inventory", "galactic_station_id")),
+    Scenario("PATCH /stations/{id}/inventory/{item_id}", _with_created("stations", lambda ctx, rng, station_id: (
+        "PATCH", f"/stations/{station_id}/inventory/{ctx.sample('items', rng)}", {"json": {"delta": 1}}
+    )), writes=True),
+    Scenario("POST /stations/{id}/inventory/bulk", _with_created("stations", lambda ctx, rng, station_id: (
+        "POST", f"/stations/{station_id}/inventory/bulk",
+        _ndjson([{"galactic_item_id": ctx.sample("items", rng), "quantity": 1} for _ in range(BULK_ROWS)])
+    )), writes=True),
+    Scenario(
+        "DELETE /stations/{id}/inventory/{inventory_id}",
+        _delete_created("station_inventory", "/stations/{}/inventory/{}"), writes=True
+    ),
+    Scenario(
+        "POST /planets", lambda ctx, rng: ("POST", "/planets", _catalog_body(ctx, "planet")),
+        writes=True, record=_record_id("planets")
+    ),
+    Scenario("PUT /planets/{id}", _with_created("planets", lambda ctx, rng, planet_id: (
+        "PUT", f"/planets/{planet_id}", _catalog_body(ctx, "planet")
+    )), writes=True),
+    Scenario("POST /planets/{id}/inventory", _with_created("planets", lambda ctx, rng, planet_id: (
+        "POST", f"/planets/{planet_id}/inventory",
+        {"params": {"item_id": ctx.sample("items", rng), "quantity": rng.randint(1, 100)}}
+    )), writes=True, record=_record_inventory("planet_inventory", "galactic_planet_id")),
+    Scenario("PATCH /planets/{id}/inventory/{item_id}", _with_created("planets", lambda ctx, rng, planet_id: (
+        "PATCH", f"/planets/{planet_id}/inventory/{ctx.sample('items', rng)}", {"json": {"delta": 1}}
+    )), writes=True),
+    Scenario(
+        "DELETE /planets/{id}/inventory/{inventory_id}",
+        _delete_created("planet_inventory", "/planets/{}/inventory/{}"), writes=True
+    ),
+    Scenario("DELETE /items/{id}", _delete_created("items", "/items/{}"), writes=True),
+    Scenario("DELETE /item-types/{id}", _delete_created("item_types", "/item-types/{}"), writes=True),
+    Scenario("DELETE /stations/{id}", _delete_created("stations", "/stations/{}"), writes=True),
+    Scenario("DELETE /planets/{id}", _delete_created("planets", "/planets/{}"), writes=True),
+]
+
+SCENARIOS = READ_SCENARIOS + WRITE_SCENARIOS
+
+
+async def _sample_ids(dsn: str, rng: random.Random) -> Dict[str, List[Any]]:
+    """Sample ids (and existing station/item pairs) to request, reproducibly for a given seed"""
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("SELECT setseed($1)", rng.random() * 2 - 1)
+        samples = {}
+        for name, sql in (
+            ("items", "SELECT id FROM galactic_items"),
+            ("item_types", "SELECT id FROM galactic_item_types"),
+            ("stations", "SELECT id FROM galactic_stations"),
+            ("planets", "SELECT id FROM galactic_planets"),
+            ("item_names", "SELECT name FROM galactic_items"),
+            ("station_items", "SELECT galactic_station_id, galactic_item_id FROM galactic_stations_inventory"),
+        ):
+            rows = await conn.fetch(f"{sql} ORDER BY random() LIMIT $1", ID_SAMPLE_SIZE)
+            if not rows:
+                raise ValueError(f"Nothing to sample for {name}; seed the database first")
+            samples[name] = [row[0] if len(row) == 1 else tuple(row) for row in rows]
+        return samples
+    finally:
+        await conn.close()
+
+
+def _percentile(latencies: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of sorted latencies"""
+    index = max(0, min(len(latencies) - 1, round(percentile / 100 * len(latencies)) - 1))
+    return latencies[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    ctx: Context,
+    requests: int,
+    concurrency: int,
+    rng: random.Random
+) -> Dict[str, Any]:
+    """Send up to requests requests for a scenario with concurrency in flight, returning its statistics"""
+    remaining = min(requests, scenario.max_requests or requests)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            request = scenario.build(ctx, rng)
+            if request is None:
+                return
+            remaining -= 1
+            method, url, options = request
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **options)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] += 1
+            if scenario.record is not None and response.is_success:
+                scenario.record(ctx, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        "requests": sum(statuses.values()),
+        "errors": sum(count for code, count in statuses.items() if not code.isdigit() or int(code) >= 400),
+        "statuses": dict(sorted(statuses.items())),
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1) if seconds else None,
+    }
+    if latencies:
+        result["latency_ms"] = {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p95": round(_percentile(latencies, 95) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+        }
+    return result
+
+
+async def _clean_up(client: httpx.AsyncClient, prefix: str):
+    """Delete every row the write scenarios created (all of their names start with the run prefix)"""
+    for path in CREATED_CATALOGS.values():
+        while True:
+            response = await client.get(path, params={"name_prefix": prefix, "limit": 1000})
+            rows = response.json()
+            if not response.is_success or not rows:
+                break
+            for row in rows:
+                await client.delete(f"{path}/{row['id']}")
+
+
+async def run(
+    base_url: str,
+    dsn: str,
+    requests: int,
+    concurrency: int,
+    patterns: Optional[List[str]] = None,
+    writes: bool = False,
+    warmup: int = 0,
+    seed: int = 0
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    samples = await _sample_ids(dsn, rng)
+    ctx = Context(samples, prefix=f"bench-{time.time_ns()}")
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if (writes or not scenario.writes)
+        and (not patterns or any(fnmatch.fnmatchcase(scenario.name, pattern) for pattern in patterns))
+    ]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = {
+        "base_url": base_url,
+        "concurrency": concurrency,
+        "requests_per_scenario": requests,
+        "seed": seed,
+        "scenarios": {},
+    }
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        try:
+            for scenario in scenarios:
+                if warmup and not scenario.writes:
+                    await run_scenario(client, scenario, ctx, warmup, concurrency, rng)
+                results["scenarios"][scenario.name] = await run_scenario(
+                    client, scenario, ctx, requests, concurrency, rng
+                )
+                print(f"{scenario.name}: {json.dumps(results['scenarios'][scenario.name])}", file=sys.stderr)
+        finally:
+            if writes:
+                await _clean_up(client, ctx.prefix)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000", help="API to load (default: %(default)s)")
+    parser.add_argument("--dsn", default=None, help="Database to sample ids from (default: DATABASE_URL)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight (default: 16)")
+    parser.add_argument("--warmup", type=int, default=100, help="Untimed requests before each read scenario")
+    parser.add_argument(
+        "--scenario", action="append", dest="patterns", metavar="PATTERN",
+        help="Run only scenarios matching this glob, e.g. 'GET /stations*' (repeatable)"
+    )
+    parser.add_argument("--writes", action="store_true", help="Also run the write scenarios")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for ids and request order (default: 0)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name}{' (--writes)' if scenario.writes else ''}")
+        return 0
+    try:
+        results = asyncio.run(run(
+            args.base_url, args.dsn or get_database_url(), args.requests, args.concurrency,
+            args.patterns, args.writes, args.warmup, args.seed
+        ))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
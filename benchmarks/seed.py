@@ -0,0 +1,188 @@
+"""
+Fill a database with a generated galaxy for benchmarking, using COPY.
+
+Applies pending migrations, then copies in item types, items, stations, planets and
+their inventories. The same arguments and --seed always produce the same rows, with
+ids numbered from 1. The tables must be empty unless --reset is given, which
+truncates them first (solar systems are left alone).
+
+    python -m benchmarks.seed --stations 1000 --items 100000 --station-inventory 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import asyncpg
+from typing import Dict, Iterator, Optional, Tuple
+from cli import get_database_url
+from migrate import migrate
+
+# Tables filled by the seeder, in the order they are copied (referenced tables first)
+SEEDED_TABLES = [
+    "galactic_item_types",
+    "galactic_items",
+    "galactic_stations",
+    "galactic_planets",
+    "galactic_stations_inventory",
+    "galactic_planets_inventory",
+]
+
+# Version keys bumped after seeding, so running workers drop cached rows and ETags
+SEEDED_VERSION_KEYS = {
+    "item_types": "galactic_item_types",
+    "items": "galactic_items",
+    "stations": "galactic_stations",
+    "planets": "galactic_planets",
+    "station_inventory": "galactic_stations",
+    "planet_inventory": "galactic_planets",
+}
+
+# Share of items generated without an item type
+UNTYPED_ITEM_SHARE = 0.1
+
+MAX_QUANTITY = 1000
+
+# Keys bumped per galactic_record_change call, keeping each notification under the 8000-byte limit
+VERSION_BATCH_SIZE = 100
+
+
+def _catalog_rows(kind: str, count: int, rng: random.Random) -> Iterator[Tuple[int, str, str]]:
+    for n in range(1, count + 1):
+        yield n, f"{kind} {n}", f"Generated {kind.lower()} {rng.randrange(10 ** 6)}"
+
+
+def _item_rows(count: int, item_types: int, rng: random.Random) -> Iterator[Tuple[int, str, str, Optional[int]]]:
+    for n in range(1, count + 1):
+        untyped = not item_types or rng.random() < UNTYPED_ITEM_SHARE
+        description = f"Generated item {rng.randrange(10 ** 6)}"
+        yield n, f"Item {n}", description, None if untyped else rng.randint(1, item_types)
+
+
+def _inventory_rows(locations: int, items: int, total: int, rng: random.Random) -> Iterator[Tuple[int, int, int, int]]:
+    """Spread total entries evenly over the locations, each holding distinct items"""
+    row_id = 0
+    for location in range(1, locations + 1):
+        count = total // locations + (1 if location <= total % locations else 0)
+        for item_id in sorted(rng.sample(range(1, items + 1), count)):
+            row_id += 1
+            yield row_id, location, item_id, rng.randint(1, MAX_QUANTITY)
+
+
+async def _copy(conn: asyncpg.Connection, table: str, columns, records) -> Dict[str, float]:
+    start = time.perf_counter()
+    result = await conn.copy_records_to_table(table, records=records, columns=columns)
+    seconds = time.perf_counter() - start
+    rows = int(result.split()[-1])
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds) if seconds else None}
+
+
+async def seed(
+    conn: asyncpg.Connection,
+    stations: int,
+    planets: int,
+    items: int,
+    item_types: int,
+    station_inventory: int,
+    planet_inventory: int,
+    random_seed: int = 0,
+    reset: bool = False
+) -> Dict[str, Dict[str, float]]:
+    if station_inventory and station_inventory > stations * items:
+        raise ValueError("station inventory cannot exceed stations x items (one entry per station and item)")
+    if planet_inventory and planet_inventory > planets * items:
+        raise ValueError("planet inventory cannot exceed planets x items (one entry per planet and item)")
+    await migrate(conn)
+    rng = random.Random(random_seed)
+    results = {}
+    async with conn.transaction():
+        if reset:
+            await conn.execute(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY")
+        else:
+            for table in SEEDED_TABLES:
+                if await conn.fetchval(f"SELECT EXISTS (SELECT 1 FROM {table})"):
+                    raise ValueError(f"{table} is not empty; pass --reset to replace its rows")
+
+        catalog_columns = ["id", "name", "description"]
+        results["item_types"] = await _copy(
+            conn, "galactic_item_types", catalog_columns, _catalog_rows("Type", item_types, rng)
+        )
+        results["items"] = await _copy(
+            conn, "galactic_items", catalog_columns + ["item_type_id"], _item_rows(items, item_types, rng)
+        )
+        results["stations"] = await _copy(
+            conn, "galactic_stations", catalog_columns, _catalog_rows("Station", stations, rng)
+        )
+        results["planets"] = await _copy(
+            conn, "galactic_planets", catalog_columns, _catalog_rows("Planet", planets, rng)
+        )
+        results["station_inventory"] = await _copy(
+            conn, "galactic_stations_inventory", ["id", "galactic_station_id", "galactic_item_id", "quantity"],
+            _inventory_rows(stations, items, station_inventory, rng)
+        )
+        results["planet_inventory"] = await _copy(
+            conn, "galactic_planets_inventory", ["id", "galactic_planet_id", "galactic_item_id", "quantity"],
+            _inventory_rows(planets, items, planet_inventory, rng)
+        )
+
+        for table in SEEDED_TABLES:
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence($1, 'id'), COALESCE(max(id), 0) + 1, false) FROM {table}",
+                table
+            )
+        for key, location_table in SEEDED_VERSION_KEYS.items():
+            keys = [key]
+            if key.endswith("_inventory"):
+                prefix = key + ":"
+                keys += [prefix + str(row["id"]) for row in await conn.fetch(f"SELECT id FROM {location_table}")]
+                keys += [row["key"] for row in await conn.fetch(
+                    "SELECT key FROM galactic_versions WHERE starts_with(key, $1)", prefix
+                )]
+            keys = sorted(set(keys))
+            for start in range(0, len(keys), VERSION_BATCH_SIZE):
+                await conn.execute(
+                    "SELECT galactic_record_change($1, $2)",
+                    keys[start:start + VERSION_BATCH_SIZE], json.dumps({"table": key, "op": "seed"})
+                )
+
+    start = time.perf_counter()
+    await conn.execute(f"ANALYZE {', '.join(SEEDED_TABLES)}")
+    results["analyze"] = {"seconds": round(time.perf_counter() - start, 3)}
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--item-types", type=int, default=50)
+    parser.add_argument("--station-inventory", type=int, default=1000000, help="Station inventory entries in total")
+    parser.add_argument("--planet-inventory", type=int, default=100000, help="Planet inventory entries in total")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--reset", action="store_true", help="Truncate the seeded tables first")
+    parser.add_argument("--dsn", default=None, help="Database URL (default: DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    async def run():
+        conn = await asyncpg.connect(args.dsn or get_database_url())
+        try:
+            return await seed(
+                conn, args.stations, args.planets, args.items, args.item_types,
+                args.station_inventory, args.planet_inventory, args.seed, args.reset
+            )
+        finally:
+            await conn.close()
+
+    try:
+        results = asyncio.run(run())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
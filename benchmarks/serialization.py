@@ -0,0 +1,96 @@
+"""
+Compare the two ways a list endpoint can turn database rows into a JSON response body.
+
+validated: what FastAPI does with a returned list of dicts; every row is validated
+against the response model, converted back to JSON-compatible data and encoded.
+fast: responses.rows_response, which encodes the asyncpg records directly with orjson.
+
+Rows are generated by the database in the shape of GET /items and
+GET /stations/{id}/inventory pages, so no data is needed.
+
+    python -m benchmarks.serialization --rows 1000 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import asyncpg
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from typing import List
+from cli import get_database_url
+from models import InventoryItemDetail, ItemWithType
+from responses import RowsResponse
+
+SHAPES = {
+    "items": (
+        List[ItemWithType],
+        """
+        SELECT n as id, 'Item ' || n as name, repeat('x', 40) as description,
+               1 as item_type_id, 'Standard' as item_type_name
+        FROM generate_series(1, $1) n
+        """,
+    ),
+    "station_inventory": (
+        List[InventoryItemDetail],
+        """
+        SELECT n as inventory_id, n * 10 as quantity, n as item_id, 'Item ' || n as item_name,
+               NULL::text as item_description, 'Standard' as item_type_name
+        FROM generate_series(1, $1) n
+        """,
+    ),
+}
+
+
+async def _validated(field, rows) -> bytes:
+    content = await serialize_response(field=field, response_content=[dict(row) for row in rows])
+    return JSONResponse(content).body
+
+
+async def _fast(field, rows) -> bytes:
+    return RowsResponse(rows).body
+
+
+async def _time(encode, field, rows, repeat: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = await encode(field, rows)
+    seconds = time.perf_counter() - start
+    return {
+        "ms_per_response": round(seconds / repeat * 1000, 3),
+        "rows_per_second": round(len(rows) * repeat / seconds),
+        "bytes": len(body),
+    }
+
+
+async def run(dsn: str, rows: int, repeat: int) -> dict:
+    conn = await asyncpg.connect(dsn)
+    try:
+        results = {"rows": rows, "repeat": repeat}
+        for shape, (model, sql) in SHAPES.items():
+            records = await conn.fetch(sql, rows)
+            field = create_response_field(name=f"Response_{shape}", type_=model, mode="serialization")
+            validated = await _time(_validated, field, records, repeat)
+            fast = await _time(_fast, field, records, repeat)
+            results[shape] = {
+                "validated": validated,
+                "fast": fast,
+                "speedup": round(validated["ms_per_response"] / fast["ms_per_response"], 1),
+            }
+        return results
+    finally:
+        await conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per response (default: 1000)")
+    parser.add_argument("--repeat", type=int, default=200, help="Responses encoded per path (default: 200)")
+    parser.add_argument("--dsn", default=None, help="Database URL (default: DATABASE_URL)")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args.dsn or get_database_url(), args.rows, args.repeat)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional, Tuple, Type
+from models import ItemCreate, StationInventoryCreate
+from repository import Repository
+
+BULK_FORMATS = ("ndjson", "csv")
+
+BULK_MEDIA_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+# OpenAPI description of the raw request bodies accepted by the bulk endpoints
+BULK_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/x-ndjson": {"schema": {"type": "string"}},
+            "text/csv": {"schema": {"type": "string"}},
+        },
+    }
+}
+
+
+def format_from_media_type(content_type: Optional[str]) -> str:
+    """Pick the bulk format for a request Content-Type, defaulting to NDJSON"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return BULK_MEDIA_TYPES.get(media_type, "ndjson")
+
+
+async def read_bulk_body(request: Request) -> Tuple[str, str]:
+    """Read a bulk request body, returning its text and format"""
+    try:
+        data = (await request.body()).decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be UTF-8 encoded")
+    return data, format_from_media_type(request.headers.get("content-type"))
+
+
+def parse_records(data: str, bulk_format: str) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Split an NDJSON or CSV document into (row, record) pairs and per-row parse errors.
+    Rows are numbered from 1 in the order records appear; blank NDJSON lines are skipped
+    and empty CSV fields are read as null.
+    """
+    records, errors = [], []
+    if bulk_format == "csv":
+        reader = csv.DictReader(io.StringIO(data))
+        for row, record in enumerate(reader, start=1):
+            if None in record:
+                errors.append({"row": row, "error": "Too many fields"})
+                continue
+            records.append((row, {key: value if value != "" else None for key, value in record.items()}))
+        return records, errors
+
+    lines = (line for line in data.splitlines() if line.strip())
+    for row, line in enumerate(lines, start=1):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            errors.append({"row": row, "error": f"Invalid JSON: {e}"})
+            continue
+        if not isinstance(record, dict):
+            errors.append({"row": row, "error": "Expected a JSON object"})
+            continue
+        records.append((row, record))
+    return records, errors
+
+
+def validate_records(
+    records: List[Tuple[int, Dict[str, Any]]],
+    model: Type[BaseModel]
+) -> Tuple[List[Tuple[int, BaseModel]], List[Dict[str, Any]]]:
+    """Validate parsed records against a model, collecting one error message per invalid row"""
+    valid, errors = [], []
+    for row, record in records:
+        try:
+            valid.append((row, model.model_validate(record)))
+        except ValidationError as e:
+            message = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+                for error in e.errors()
+            )
+            errors.append({"row": row, "error": message})
+    return valid, errors
+
+
+def _result(received: int, inserted: int, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "received": received,
+        "inserted": inserted,
+        "errors": sorted(errors, key=lambda error: error["row"]),
+    }
+
+
+async def import_items(repo: Repository, data: str, bulk_format: str, atomic: bool = False) -> Dict[str, Any]:
+    """
+    Bulk insert items from an NDJSON or CSV document.
+    Valid rows are copied into a session-local staging table, then a single statement checks
+    item type references and name uniqueness and inserts the rows that pass. With atomic,
+    nothing is inserted unless every row is valid.
+    """
+    records, errors = parse_records(data, bulk_format)
+    received = len(records) + len(errors)
+    items, validation_errors = validate_records(records, ItemCreate)
+    errors.extend(validation_errors)
+    if not items or (atomic and errors):
+        return _result(received, 0, errors)
+
+    inserted, rejected = await repo.import_items(
+        [(row, item.name, item.description, item.item_type_id) for row, item in items],
+        atomic
+    )
+    errors.extend(rejected)
+    return _result(received, inserted, errors)
+
+
+async def import_station_inventory(
+    repo: Repository,
+    station_id: int,
+    data: str,
+    bulk_format: str,
+    atomic: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Bulk add items to a station's inventory from an NDJSON or CSV document.
+    Each row names a galactic_item_id and an optional quantity (default 1) to add;
+    galactic_station_id may be omitted but must match the station if given.
+    Returns None if the station does not exist.
+    """
+    records, errors = parse_records(data, bulk_format)
+    received = len(records) + len(errors)
+    for _, record in records:
+        record.setdefault("galactic_station_id", station_id)
+        if record.get("quantity") is None:
+            record.pop("quantity", None)
+    entries, validation_errors = validate_records(records, StationInventoryCreate)
+    errors.extend(validation_errors)
+    for row, entry in list(entries):
+        if entry.galactic_station_id != station_id:
+            errors.append({"row": row, "error": "galactic_station_id does not match the station"})
+    entries = [(row, entry) for row, entry in entries if entry.galactic_station_id == station_id]
+
+    rows = [] if atomic and errors else [(row, entry.galactic_item_id, entry.quantity) for row, entry in entries]
+    station_found, inserted, invalid_rows, overflow_rows = await repo.import_station_inventory(
+        station_id, rows, atomic
+    )
+    if not station_found:
+        return None
+    errors.extend({"row": row, "error": "Item not found"} for row in invalid_rows)
+    errors.extend(
+        {"row": row, "error": "The item's quantity would exceed the largest quantity an entry can hold"}
+        for row in overflow_rows
+    )
+    return _result(received, inserted, errors)
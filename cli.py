@@ -0,0 +1,139 @@
+"""Command-line tools for the Galactic Inventory database"""
+import argparse
+import asyncio
+import json
+import sys
+import asyncpg
+from bulk import BULK_FORMATS, import_items, import_station_inventory
+from migrate import applied_migrations, check_indexes, load_migrations, migrate
+from config import settings
+from repository import GalacticConnection, Repository, init_connection
+
+
+def get_database_url() -> str:
+    return settings.database_url
+
+
+def _read_input(path: str, bulk_format: str):
+    """Read a bulk file, inferring the format from its extension unless given"""
+    if bulk_format is None:
+        bulk_format = "csv" if path.lower().endswith(".csv") else "ndjson"
+    if path == "-":
+        return sys.stdin.read(), bulk_format
+    with open(path, encoding="utf-8") as f:
+        return f.read(), bulk_format
+
+
+async def _connect() -> GalacticConnection:
+    conn = await asyncpg.connect(get_database_url(), connection_class=GalacticConnection)
+    await init_connection(conn, prepare=False)
+    return conn
+
+
+async def _import_items(args) -> int:
+    data, bulk_format = _read_input(args.file, args.format)
+    conn = await _connect()
+    try:
+        result = await import_items(Repository(conn), data, bulk_format, args.atomic)
+    finally:
+        await conn.close()
+    print(json.dumps(result, indent=2))
+    return 1 if result["errors"] else 0
+
+
+async def _import_station_inventory(args) -> int:
+    data, bulk_format = _read_input(args.file, args.format)
+    conn = await _connect()
+    try:
+        result = await import_station_inventory(Repository(conn), args.station_id, data, bulk_format, args.atomic)
+    finally:
+        await conn.close()
+    if result is None:
+        print(f"Station {args.station_id} not found", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 1 if result["errors"] else 0
+
+
+async def _migrate(args) -> int:
+    conn = await asyncpg.connect(get_database_url())
+    try:
+        if args.status:
+            applied = await applied_migrations(conn)
+            for migration in load_migrations():
+                applied_at = applied.get(migration.version)
+                print(f"{migration.version}_{migration.name}: {applied_at.isoformat() if applied_at else 'pending'}")
+            return 0
+        applied = await migrate(conn)
+    finally:
+        await conn.close()
+    for migration in applied:
+        print(f"Applied {migration.version}_{migration.name}")
+    if not applied:
+        print("Database is up to date")
+    return 0
+
+
+async def _rebuild_totals(args) -> int:
+    conn = await _connect()
+    try:
+        await Repository(conn).rebuild_inventory_totals()
+    finally:
+        await conn.close()
+    print("Inventory totals rebuilt")
+    return 0
+
+
+async def _check_indexes(args) -> int:
+    conn = await _connect()
+    try:
+        results = await check_indexes(conn)
+    finally:
+        await conn.close()
+    for label, scans in results.items():
+        print(f"{'FULL SCAN ' + ', '.join(scans) if scans else 'ok'}: {label}")
+    return 1 if any(results.values()) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    items_parser = commands.add_parser("import-items", help="Bulk import items from an NDJSON or CSV file")
+    items_parser.add_argument("file", help="Input file, or - for stdin")
+    items_parser.set_defaults(handler=_import_items)
+
+    inventory_parser = commands.add_parser(
+        "import-station-inventory",
+        help="Bulk add items to a station's inventory from an NDJSON or CSV file"
+    )
+    inventory_parser.add_argument("station_id", type=int)
+    inventory_parser.add_argument("file", help="Input file, or - for stdin")
+    inventory_parser.set_defaults(handler=_import_station_inventory)
+
+    for import_parser in (items_parser, inventory_parser):
+        import_parser.add_argument("--format", choices=BULK_FORMATS, help="Input format (default: from file extension)")
+        import_parser.add_argument("--atomic", action="store_true", help="Insert nothing unless every row is valid")
+
+    migrate_parser = commands.add_parser("migrate", help="Apply pending schema migrations")
+    migrate_parser.add_argument("--status", action="store_true", help="List migrations and when each was applied")
+    migrate_parser.set_defaults(handler=_migrate)
+
+    rebuild_parser = commands.add_parser(
+        "rebuild-totals",
+        help="Recompute the inventory totals behind /reports from the inventory tables"
+    )
+    rebuild_parser.set_defaults(handler=_rebuild_totals)
+
+    check_parser = commands.add_parser(
+        "check-indexes",
+        help="EXPLAIN every API lookup and fail if any still reads a whole table or index"
+    )
+    check_parser.set_defaults(handler=_check_indexes)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Request coalescing (single-flight) for hot GET handlers. Identical requests in flight at once
+share one database read and one JSON encoding, and the encoded response is reused for a
+fraction of a second after it is read. Requests are identical when they have the same path,
+query parameters and ETag: the ETag carries the versions of every table the response is read
+from, so a shared response is never older than the versions the requester was promised.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from fastapi import Request, Response
+import metrics
+from config import settings
+from database import db
+from responses import RowsResponse, encode_rows, rows_response
+
+# Encoded body and headers of a response
+Encoded = Tuple[bytes, Dict[str, str]]
+
+
+class SingleFlight:
+    """In-flight loads by key, and recently loaded results kept for cache_ttl seconds"""
+
+    def __init__(self, enabled: bool = True, cache_ttl: float = 0.25, cache_size: int = 256):
+        self.enabled = enabled
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        # key -> (time.monotonic() when it expires, result); oldest first, as every entry has the same ttl
+        self._recent: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    async def run(self, route: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        The result of load for key: a recent result, the one being loaded, or a new load.
+        The load runs in its own task, so a requester going away does not cancel it for the others.
+        """
+        entry = self._recent.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                metrics.coalesced_requests.inc(route, "cached")
+                return entry[1]
+            del self._recent[key]
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._load(key, load))
+            # Nobody may be left to await a failed load
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            metrics.coalesced_requests.inc(route, "leader")
+        else:
+            metrics.coalesced_requests.inc(route, "shared")
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await load()
+        finally:
+            del self._in_flight[key]
+        if self.cache_ttl > 0 and self.cache_size > 0:
+            now = time.monotonic()
+            while self._recent:
+                oldest_key, (expires_at, _) = next(iter(self._recent.items()))
+                if expires_at > now and len(self._recent) < self.cache_size:
+                    break
+                del self._recent[oldest_key]
+            self._recent[key] = (now + self.cache_ttl, result)
+        return result
+
+
+coalescer = SingleFlight(settings.coalesce_reads, settings.coalesce_cache_ttl, settings.coalesce_cache_size)
+
+
+async def coalesced_response(
+    request: Request,
+    response: Response,
+    load: Callable[[], Awaitable[Any]]
+) -> RowsResponse:
+    """
+    JSON response of rows read by load, shared with identical concurrent requests.
+    Call after check_etag, which puts the ETag in the key. Headers load sets on response
+    (the next-page cursor) are shared too. Requests in a batch are not coalesced: their
+    pinned connection may see the batch's uncommitted writes.
+    """
+    etag = response.headers.get("etag")
+    if not coalescer.enabled or etag is None or db.pinned_repository() is not None:
+        return rows_response(response, await load())
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    # Parameters sorted by name only: repeated values keep their order, which some routes depend on
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items(), key=itemgetter(0))), etag)
+
+    async def load_encoded() -> Encoded:
+        body = encode_rows(await load())
+        return body, dict(response.headers)
+
+    body, headers = await coalescer.run(route, key, load_encoded)
+    response.headers.update(headers)
+    return rows_response(response, body)
@@ -0,0 +1,100 @@
+"""
+Read-your-writes across read replicas. A response to a request that wrote carries a token,
+the primary's WAL position (LSN) after the write; reads that send it back are only served by
+a replica that has replayed that far.
+"""
+import contextvars
+from typing import Optional
+
+# Token in responses (header and cookie) and requests (header, else cookie)
+TOKEN_HEADER = "X-Consistency-Token"
+TOKEN_COOKIE = "galactic_lsn"
+# Seconds a token cookie is kept; replicas that lag longer are not used anyway
+TOKEN_COOKIE_MAX_AGE = 60
+
+
+def parse_lsn(text: Optional[str]) -> Optional[int]:
+    """Postgres LSN text ('16/B374D848') as an integer, or None if it is not one"""
+    if not text:
+        return None
+    high, _, low = text.strip().partition("/")
+    try:
+        return (int(high, 16) << 32) | int(low, 16)
+    except ValueError:
+        return None
+
+
+def format_lsn(lsn: int) -> str:
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+class RequestConsistency:
+    """Routing state of one request, shared by ConsistencyMiddleware and Database"""
+
+    def __init__(self, min_lsn: Optional[int] = None):
+        # Position a replica must have replayed to serve this request's reads
+        self.min_lsn = min_lsn
+        # Primary position after this request's writes, returned as the new token
+        self.written_lsn: Optional[int] = None
+        # Replica serving this request's reads, chosen on the first read so they all see one timeline
+        self.replica = None
+        # Set when reads go to the primary (no replica available, or none caught up in time)
+        self.on_primary = False
+
+    def wrote(self, lsn: Optional[int]):
+        if lsn is not None:
+            self.written_lsn = max(self.written_lsn or 0, lsn)
+
+
+_current: contextvars.ContextVar[Optional[RequestConsistency]] = contextvars.ContextVar(
+    "galactic_request_consistency", default=None
+)
+
+
+def current() -> Optional[RequestConsistency]:
+    """State of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+def _request_token(headers) -> Optional[int]:
+    header_name = TOKEN_HEADER.lower().encode()
+    cookie_prefix = TOKEN_COOKIE + "="
+    for name, value in headers:
+        if name == header_name:
+            return parse_lsn(value.decode("latin-1"))
+    for name, value in headers:
+        if name == b"cookie":
+            for cookie in value.decode("latin-1").split(";"):
+                cookie = cookie.strip()
+                if cookie.startswith(cookie_prefix):
+                    return parse_lsn(cookie[len(cookie_prefix):])
+    return None
+
+
+class ConsistencyMiddleware:
+    """ASGI middleware reading the token of a request and returning the token of its writes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = RequestConsistency(_request_token(scope["headers"]))
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and state.written_lsn is not None:
+                token = format_lsn(state.written_lsn)
+                cookie = f"{TOKEN_COOKIE}={token}; Max-Age={TOKEN_COOKIE_MAX_AGE}; Path=/; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [
+                    (TOKEN_HEADER.lower().encode(), token.encode()),
+                    (b"set-cookie", cookie.encode()),
+                ]
+            await send(message)
+
+        reset = _current.set(state)
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            _current.reset(reset)
@@ -1,24 +1,213 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
 import asyncpg
-from typing import Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import consistency
+import metrics
+import tracing
+from config import Settings
+from repository import GalacticConnection, Repository, init_connection
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel used to broadcast changes (with the new table versions) to every worker process;
+# galactic_record_change() in the schema notifies on it
+CHANGES_CHANNEL = "galactic_changes"
+
+# Cached namespaces whose entries embed data from another namespace
+CACHE_DEPENDENTS = {
+    "item_types": ("items",),
+}
+
+LISTENER_RECONNECT_DELAY = 1.0
+
+# A readiness probe result older than this many probe intervals counts as failing
+READINESS_STALE_INTERVALS = 3
+
+# Seconds between replay position checks while a read waits for its replica to catch up
+REPLICA_POLL_INTERVAL = 0.01
+
+
+class DatabaseBusyError(Exception):
+    """No pooled connection became free within the acquire timeout"""
+
+
+# Repository that db.repository() hands out instead of acquiring a connection (see Database.pinned)
+_pinned_repository: contextvars.ContextVar[Optional[Repository]] = contextvars.ContextVar(
+    "galactic_pinned_repository", default=None
+)
+
+
+class CatalogCache:
+    """
+    Bounded in-process cache for catalog lookups (item types and single entities).
+    Every entry is stored with the version its namespace had when the value was loaded;
+    invalidating a namespace bumps that version, so entries loaded before a change are
+    never returned afterwards, even if the load finished after the invalidation.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[int, float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    def version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: Hashable) -> Tuple[bool, Any]:
+        """Return (True, value) for a fresh entry, or (False, None) on a miss"""
+        entry = self._entries.get((namespace, key)) if self.enabled else None
+        if entry is not None:
+            version, expires_at, value = entry
+            if version == self.version(namespace) and expires_at > time.monotonic():
+                self._entries.move_to_end((namespace, key))
+                self.hits += 1
+                return True, value
+            del self._entries[(namespace, key)]
+        self.misses += 1
+        return False, None
+
+    def set(self, namespace: str, key: Hashable, value: Any, version: int):
+        """Store a value loaded while the namespace was at the given version"""
+        if not self.enabled or version != self.version(namespace):
+            return
+        self._entries[(namespace, key)] = (version, time.monotonic() + self.ttl, value)
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str):
+        """Drop every entry of a namespace and of the namespaces that depend on it"""
+        self.invalidations += 1
+        for name in (namespace, *CACHE_DEPENDENTS.get(namespace, ())):
+            self._versions[name] = self.version(name) + 1
+            for key in [key for key in self._entries if key[0] == name]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry, e.g. after missing notifications"""
+        for namespace in {key[0] for key in self._entries} | set(self._versions):
+            self._versions[namespace] = self.version(namespace) + 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+class Replica:
+    """A streaming replica's pool and what the last probe saw of its replay position"""
+
+    def __init__(self, name: str, pool: asyncpg.Pool):
+        self.name = name
+        self.pool = pool
+        self.replay_lsn: Optional[int] = None
+        self.lag_bytes: Optional[int] = None
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = "not probed yet"
+        # time.monotonic() of the first probe that found it behind the primary, None while caught up
+        self.behind_since: Optional[float] = None
+
+    def available(self, max_lag: float) -> bool:
+        return self.error is None and self.lag_seconds is not None and self.lag_seconds <= max_lag
+
+    def status(self, max_lag: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "available": self.available(max_lag),
+            "replay_lsn": consistency.format_lsn(self.replay_lsn) if self.replay_lsn is not None else None,
+            "lag_bytes": self.lag_bytes,
+            "lag_seconds": None if self.lag_seconds is None else round(self.lag_seconds, 3),
+            "error": self.error,
+        }
 
 
 class Database:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        self.replicas: List[Replica] = []
+        self.replica_max_lag = 5.0
+        self.replica_wait_timeout = 0.1
+        self._next_replica = 0
+        self.cache = CatalogCache()
+        self._dsn: Optional[str] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._versions: Dict[str, int] = {}
+        self._listener_generation = 0
+        self.waiting_for_connection = 0
+        self.acquire_timeout: Optional[float] = None
+        self.max_connection_lifetime = 0.0
+        self._probe_interval = 5.0
+        self._probe_timeout = 2.0
+        self._probe_task: Optional[asyncio.Task] = None
+        # Last readiness probe: (succeeded, error message, time.monotonic() when it finished)
+        self._probe_result: Optional[Tuple[bool, Optional[str], float]] = None
+        self._change_callbacks: List[Callable[[Optional[Dict[str, Any]]], None]] = []
+        self.slow_queries = tracing.SlowQueryLog()
 
-    async def connect(self, dsn: str):
-        """Create database connection pool"""
-        self.pool = await asyncpg.create_pool(
-            dsn,
-            min_size=5,
-            max_size=20,
-            command_timeout=60
+    async def connect(self, settings: Settings):
+        """Create database connection pool, start listening for catalog changes and probing readiness"""
+        self._dsn = settings.database_url
+        self._closing = False
+        self.cache = CatalogCache(max_size=settings.catalog_cache_size, ttl=settings.catalog_cache_ttl)
+        self.acquire_timeout = settings.db_acquire_timeout
+        self.max_connection_lifetime = settings.db_max_connection_lifetime
+        self._probe_interval = settings.readiness_probe_interval
+        self._probe_timeout = settings.readiness_probe_timeout
+        self.replica_max_lag = settings.replica_max_lag
+        self.replica_wait_timeout = settings.replica_wait_timeout
+        self.pool = await self._create_pool(settings.database_url, settings)
+        self.slow_queries = tracing.SlowQueryLog(
+            self.pool, settings.slow_query_threshold, settings.slow_query_explain_rate
         )
+        self.replicas = []
+        for number, url in enumerate(settings.replica_urls, 1):
+            try:
+                pool = await self._create_pool(url, settings)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                # Serve from the primary until the probe finds the replica reachable
+                logger.warning("Replica %d is unavailable at startup: %s", number, e)
+                pool = await self._create_pool(url, settings, min_size=0)
+            self.replicas.append(Replica(f"replica-{number}", pool))
+        await self._start_listener()
+        await self._probe()
+        self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop())
 
     async def disconnect(self):
         """Close database connection pool"""
+        self._closing = True
+        if self._probe_task:
+            self._probe_task.cancel()
+            self._probe_task = None
+        if self._listener_task:
+            self._listener_task.cancel()
+            self._listener_task = None
+        if self._listener:
+            listener, self._listener = self._listener, None
+            await listener.close()
         if self.pool:
             await self.pool.close()
+        for replica in self.replicas:
+            await replica.pool.close()
 
     def get_pool(self) -> asyncpg.Pool:
         """Get the database pool"""
@@ -26,5 +215,302 @@ class Database:
             raise RuntimeError("Database pool is not initialized")
         return self.pool
 
+    async def cached(self, namespace: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a cached catalog value, loading and caching it on a miss (None is not cached)"""
+        pinned = _pinned_repository.get()
+        if pinned is not None and pinned.conn.is_in_transaction():
+            # The transaction may see its own uncommitted writes: neither serve nor store cached rows
+            return await load()
+        found, value = self.cache.get(namespace, key)
+        if found:
+            return value
+        version = self.cache.version(namespace)
+        value = await load()
+        if value is not None:
+            self.cache.set(namespace, key, value, version)
+        return value
+
+    async def _create_pool(self, dsn: str, settings: Settings, min_size: Optional[int] = None) -> asyncpg.Pool:
+        if min_size is None:
+            min_size = min(settings.db_pool_min_size, settings.db_pool_max_size)
+        return await asyncpg.create_pool(
+            dsn,
+            min_size=min_size,
+            max_size=settings.db_pool_max_size,
+            max_queries=settings.db_max_queries,
+            max_inactive_connection_lifetime=settings.db_max_inactive_connection_lifetime,
+            command_timeout=settings.db_command_timeout,
+            statement_cache_size=settings.db_statement_cache_size,
+            connection_class=GalacticConnection,
+            init=init_connection
+        )
+
+    @asynccontextmanager
+    async def repository(self, read_only: bool = False) -> AsyncIterator[Repository]:
+        """
+        Acquire one pooled connection for a run of repository operations.
+        With read_only, and replicas configured, a request's reads go to one replica that has
+        replayed the client's consistency token, or to the primary if none catches up in time.
+        Raises DatabaseBusyError if no connection becomes free within the acquire timeout.
+        """
+        pinned = _pinned_repository.get()
+        if pinned is not None:
+            yield pinned
+            return
+        request = consistency.current()
+        replica = self._replica_for(request) if read_only else None
+        if replica is not None:
+            async with self._connection(replica.pool) as conn:
+                if await self._caught_up(replica, conn, request.min_lsn):
+                    yield Repository(conn, None, self._observe_statement)
+                    return
+            metrics.replica_fallbacks.inc()
+            request.on_primary = True
+        if request is None or not self.replicas:
+            async with self._connection(self.get_pool()) as conn:
+                yield Repository(conn, self.apply_change, self._observe_statement)
+            return
+
+        wrote = False
+
+        def on_change(table: str, versions: Dict[str, int]):
+            nonlocal wrote
+            wrote = True
+            self.apply_change(table, versions)
+
+        async with self._connection(self.get_pool()) as conn:
+            repo = Repository(conn, on_change, self._observe_statement)
+            yield repo
+            if wrote:
+                request.wrote(consistency.parse_lsn(await repo.wal_lsn()))
+
+    @contextmanager
+    def pinned(self, repo: Repository):
+        """Serve every db.repository() in this context from one repository, e.g. for a batch of operations"""
+        token = _pinned_repository.set(repo)
+        try:
+            yield repo
+        finally:
+            _pinned_repository.reset(token)
+
+    def pinned_repository(self) -> Optional[Repository]:
+        """The repository pinned in this context, if any"""
+        return _pinned_repository.get()
+
+    def _replica_for(self, request: Optional[consistency.RequestConsistency]) -> Optional[Replica]:
+        """The replica serving a request's reads, or None for the primary"""
+        if request is None or request.on_primary or not self.replicas:
+            return None
+        if request.replica is None:
+            candidates = [replica for replica in self.replicas if replica.available(self.replica_max_lag)]
+            if not candidates:
+                request.on_primary = True
+                return None
+            self._next_replica = (self._next_replica + 1) % len(candidates)
+            request.replica = candidates[self._next_replica]
+        return request.replica
+
+    async def _caught_up(self, replica: Replica, conn: GalacticConnection, min_lsn: Optional[int]) -> bool:
+        """Whether the replica has replayed min_lsn, waiting up to replica_wait_timeout for it"""
+        if min_lsn is None or (replica.replay_lsn is not None and replica.replay_lsn >= min_lsn):
+            return True
+        repo = Repository(conn, None, self._observe_statement)
+        deadline = time.monotonic() + self.replica_wait_timeout
+        while True:
+            replay_lsn = consistency.parse_lsn((await repo.replay_status())["replay_lsn"])
+            if replay_lsn is not None:
+                replica.replay_lsn = max(replica.replay_lsn or 0, replay_lsn)
+                if replay_lsn >= min_lsn:
+                    return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(REPLICA_POLL_INTERVAL)
+
+    @asynccontextmanager
+    async def _connection(self, pool: asyncpg.Pool) -> AsyncIterator[GalacticConnection]:
+        start = time.perf_counter()
+        self.waiting_for_connection += 1
+        try:
+            conn = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            metrics.pool_acquire_timeouts.inc()
+            raise DatabaseBusyError(f"No database connection available within {self.acquire_timeout}s") from None
+        finally:
+            self.waiting_for_connection -= 1
+        waited = time.perf_counter() - start
+        metrics.pool_acquire_wait.observe(waited)
+        tracing.add_acquire(waited)
+        try:
+            yield conn
+        finally:
+            if self.max_connection_lifetime and time.monotonic() - conn.opened_at > self.max_connection_lifetime:
+                # Closing releases it; the pool opens a fresh connection on a later acquire
+                await conn.close()
+            await pool.release(conn)
+
+    def _observe_statement(self, name: str, sql: str, args: Sequence[Any], seconds: float, rows: Optional[int]):
+        """Record a repository statement in metrics, the request's timing and the slow query log"""
+        metrics.observe_statement(name, seconds, rows)
+        tracing.add_statement(seconds)
+        self.slow_queries.observe(name, sql, args, seconds, rows)
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Connection counts of the pool, plus requests waiting for a connection"""
+        pool = self.pool
+        if pool is None:
+            return {}
+        return {
+            "size": pool.get_size(),
+            "idle": pool.get_idle_size(),
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+            "waiting": self.waiting_for_connection,
+        }
+
+    def readiness(self) -> Dict[str, Any]:
+        """Result of the last background probe, with replica lag; never touches the database"""
+        if self._probe_result is None:
+            result = {"ready": False, "database": "unknown", "error": "not connected", "checked_seconds_ago": None}
+        else:
+            succeeded, error, checked_at = self._probe_result
+            age = time.monotonic() - checked_at
+            if succeeded and age > self._probe_interval * READINESS_STALE_INTERVALS:
+                succeeded, error = False, "readiness probe is not running"
+            result = {
+                "ready": succeeded,
+                "database": "connected" if succeeded else "unavailable",
+                "error": error,
+                "checked_seconds_ago": round(age, 3),
+            }
+        if self.replicas:
+            # Replicas do not affect readiness: reads fall back to the primary without them
+            result["replicas"] = [replica.status(self.replica_max_lag) for replica in self.replicas]
+        return result
+
+    async def _probe(self):
+        primary_lsn = None
+        try:
+            async with self._connection(self.get_pool()) as conn:
+                repo = Repository(conn, None, self._observe_statement)
+                if self.replicas:
+                    primary_lsn = consistency.parse_lsn(await asyncio.wait_for(repo.wal_lsn(), self._probe_timeout))
+                else:
+                    await asyncio.wait_for(repo.ping(), self._probe_timeout)
+            self._probe_result = (True, None, time.monotonic())
+        except (asyncio.TimeoutError, DatabaseBusyError, OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            self._probe_result = (False, str(e) or type(e).__name__, time.monotonic())
+        await asyncio.gather(*(self._probe_replica(replica, primary_lsn) for replica in self.replicas))
+
+    async def _probe_replica(self, replica: Replica, primary_lsn: Optional[int]):
+        try:
+            async with self._connection(replica.pool) as conn:
+                status = await asyncio.wait_for(
+                    Repository(conn, None, self._observe_statement).replay_status(), self._probe_timeout
+                )
+        except (asyncio.TimeoutError, DatabaseBusyError, OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            replica.error = str(e) or type(e).__name__
+            return
+        replay_lsn = consistency.parse_lsn(status["replay_lsn"])
+        if replay_lsn is None:
+            replica.error = "not a streaming replica (not in recovery)"
+            return
+        replica.replay_lsn = max(replica.replay_lsn or 0, replay_lsn)
+        if primary_lsn is None:
+            # Primary unreachable: lag unknown, keep serving reads from what the replica has
+            replica.lag_bytes = None
+            replica.lag_seconds = status["replay_age"] or 0.0
+        else:
+            replica.lag_bytes = max(primary_lsn - replay_lsn, 0)
+            if not replica.lag_bytes:
+                replica.behind_since = None
+                replica.lag_seconds = 0.0
+            else:
+                # The last replayed transaction may be old after an idle spell, so lag is also capped
+                # by how long the replica has been seen behind
+                now = time.monotonic()
+                replica.behind_since = replica.behind_since or now
+                replica.lag_seconds = min(status["replay_age"] or 0.0, now - replica.behind_since)
+        replica.error = None
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self._probe_interval)
+            await self._probe()
+
+    async def current_versions(self, keys: Sequence[str], read_only: bool = False) -> List[int]:
+        """
+        Current version of each key (0 if never written).
+        Served from memory while the change listener is connected, from the database otherwise.
+        With read_only, when the request's reads go to a replica, they are read from that replica,
+        so a response is never tagged with versions newer than the data it was read from.
+        """
+        if read_only and _pinned_repository.get() is None and self._replica_for(consistency.current()) is not None:
+            async with self.repository(read_only=True) as repo:
+                fetched = await repo.versions(keys)
+            return [fetched.get(key, 0) for key in keys]
+        if self._listener is not None and all(key in self._versions for key in keys):
+            return [self._versions[key] for key in keys]
+        generation = self._listener_generation if self._listener is not None else None
+        async with self.repository() as repo:
+            fetched = await repo.versions(keys)
+        if generation is not None and generation == self._listener_generation and self._listener is not None:
+            # Versions only grow, so a notification processed meanwhile is never undone
+            for key in keys:
+                self._versions[key] = max(self._versions.get(key, 0), fetched.get(key, 0))
+        return [fetched.get(key, 0) for key in keys]
+
+    def on_change(self, callback: Callable[[Optional[Dict[str, Any]]], None]):
+        """
+        Call back with every change notification received (from any worker), or with None
+        when the listener disconnected and notifications may have been missed
+        """
+        self._change_callbacks.append(callback)
+
+    def apply_change(self, table: str, versions: Dict[str, int]):
+        """Invalidate cached entries of a written table and remember its new versions"""
+        self.cache.invalidate(table)
+        for key, version in versions.items():
+            self._versions[key] = max(self._versions.get(key, 0), version)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+            table, versions = change["table"], change.get("versions", {})
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed change notification: %r", payload)
+            return
+        self.apply_change(table, versions)
+        for callback in self._change_callbacks:
+            callback(change)
+
+    def _on_listener_terminated(self, connection):
+        # Notifications may have been missed: stop caching until listening again
+        self.cache.enabled = False
+        self.cache.clear()
+        self._versions.clear()
+        self._listener = None
+        for callback in self._change_callbacks:
+            callback(None)
+        if not self._closing:
+            self._listener_task = asyncio.get_running_loop().create_task(self._reconnect_listener())
+
+    async def _start_listener(self):
+        listener = await asyncpg.connect(self._dsn)
+        listener.add_termination_listener(self._on_listener_terminated)
+        await listener.add_listener(CHANGES_CHANNEL, self._on_notification)
+        self._listener = listener
+        self._listener_generation += 1
+        self.cache.clear()
+        self._versions.clear()
+        self.cache.enabled = True
+
+    async def _reconnect_listener(self):
+        while self._listener is None:
+            try:
+                await self._start_listener()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Change listener reconnect failed: %s", e)
+                await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+
 
 db = Database()
@@ -0,0 +1,33 @@
+from fastapi import Request, Response, status
+from typing import Optional
+from database import db
+
+
+def make_etag(versions) -> str:
+    """Build a strong ETag from the versions of the tables a response was read from"""
+    return '"' + "-".join(str(version) for version in versions) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as RFC 9110 requires"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+async def check_etag(request: Request, response: Response, *keys: str, read_only: bool = False) -> Optional[Response]:
+    """
+    Tag a GET response with an ETag built from the current versions of the given keys.
+    Returns a 304 response to send instead when the client already has this version;
+    the row data is not read in that case. Pass read_only when the data is then read
+    with db.repository(read_only=True), so both come from the same replica.
+    """
+    etag = make_etag(await db.current_versions(keys, read_only=read_only))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
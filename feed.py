@@ -0,0 +1,186 @@
+"""
+Live change feed. Every API write already notifies the galactic_changes channel; each worker's
+one change listener hands those notifications to the feed, which loads the changed row once
+and fans the event out to every Server-Sent Events subscriber it matches.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set
+import orjson
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+FEED_TABLES = ("items", "item_types", "stations", "planets", "station_inventory", "planet_inventory")
+
+# Event field carrying the notification's scope, per inventory table
+SCOPE_FIELDS = {
+    "station_inventory": "station_id",
+    "planet_inventory": "planet_id",
+}
+
+# Events buffered per subscriber; one that falls further behind gets a reset event instead
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Notifications waiting to be loaded and fanned out; beyond this every subscriber is reset
+PENDING_QUEUE_SIZE = 10000
+
+# Seconds between keep-alive comments, so idle streams survive proxies
+KEEPALIVE_INTERVAL = 15.0
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RECONNECT_DELAY_MS = 2000
+
+# Sent when events may have been lost (listener reconnect, slow subscriber): reload everything
+RESET_EVENT = "event: reset\ndata: {}\n\n"
+
+
+class Subscription:
+    """One client's filter and its queue of encoded events"""
+
+    def __init__(
+        self,
+        tables: Optional[Iterable[str]] = None,
+        station_ids: Optional[Iterable[int]] = None,
+        planet_ids: Optional[Iterable[int]] = None
+    ):
+        self.tables = set(tables) if tables else set(FEED_TABLES)
+        self.scopes = {
+            "station_inventory": set(station_ids) if station_ids else None,
+            "planet_inventory": set(planet_ids) if planet_ids else None,
+        }
+        # Encoded events, then None once the feed stops
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        table = event["table"]
+        if table not in self.tables:
+            return False
+        scopes = self.scopes.get(table)
+        return scopes is None or event.get(SCOPE_FIELDS[table]) in scopes
+
+    def put(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind to catch up event by event
+            self._clear()
+            self.queue.put_nowait(RESET_EVENT)
+
+    def close(self):
+        self._clear()
+        self.queue.put_nowait(None)
+
+    def _clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class ChangeFeed:
+    def __init__(self, database: Database):
+        self.database = database
+        self.subscriptions: Set[Subscription] = set()
+        self._pending: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        database.on_change(self._on_change)
+
+    def start(self):
+        """Start fanning out changes; call from the running event loop"""
+        self._pending = asyncio.Queue(PENDING_QUEUE_SIZE)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Stop fanning out and end every open stream (clients reconnect to another worker)"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for subscription in self.subscriptions:
+            subscription.close()
+
+    @asynccontextmanager
+    async def subscribe(self, subscription: Subscription) -> AsyncIterator[Subscription]:
+        self.subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self.subscriptions.discard(subscription)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        """Server-Sent Events text for one subscriber, until the client goes away"""
+        async with self.subscribe(subscription):
+            yield f"retry: {RECONNECT_DELAY_MS}\nevent: ready\ndata: {{}}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+
+    def _on_change(self, change: Optional[Dict[str, Any]]):
+        if not self.subscriptions or self._pending is None:
+            return
+        if change is not None and change.get("table") not in FEED_TABLES:
+            return
+        try:
+            self._pending.put_nowait(change)
+        except asyncio.QueueFull:
+            self._broadcast_reset()
+
+    def _broadcast_reset(self):
+        if self._pending is not None:
+            while not self._pending.empty():
+                self._pending.get_nowait()
+        for subscription in self.subscriptions:
+            subscription.put(RESET_EVENT)
+
+    async def _run(self):
+        while True:
+            change = await self._pending.get()
+            if change is None:
+                self._broadcast_reset()
+                continue
+            try:
+                event = await self._event(change)
+            except Exception:
+                logger.exception("Could not load the row of change %r", change)
+                event = self._base_event(change)
+            message = "event: change\ndata: " + orjson.dumps(event).decode() + "\n\n"
+            for subscription in self.subscriptions:
+                if subscription.matches(event):
+                    subscription.put(message)
+
+    def _base_event(self, change: Dict[str, Any]) -> Dict[str, Any]:
+        table = change["table"]
+        event = {"table": table, "op": change.get("op"), "id": change.get("id")}
+        if table in SCOPE_FIELDS:
+            event[SCOPE_FIELDS[table]] = change.get("scope")
+        if "count" in change:
+            event["count"] = change["count"]
+        return event
+
+    async def _event(self, change: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The event for a change, with the row as the API returns it for inserts and updates.
+        Changes without an id (bulk imports) carry no row: clients reload what they show.
+        The row is None if it was deleted again before it could be read.
+        """
+        event = self._base_event(change)
+        if event["op"] == "delete" or event["id"] is None:
+            return event
+        table = event["table"]
+        async with self.database.repository() as repo:
+            if table == "station_inventory":
+                row = await repo.get_station_inventory_entry(event["id"])
+            elif table == "planet_inventory":
+                row = await repo.get_planet_inventory_entry(event["id"])
+            else:
+                row = await repo.get(table, event["id"])
+        event["row"] = dict(row) if row else None
+        return event
+
+
+feed = ChangeFeed(db)
@@ -1,3 +1,6 @@
+-- The schema as originally deployed. Everything added since (item types, keys, foreign keys,
+-- indexes, quantities, change tracking) lives in the versioned steps under migrations/,
+-- which the application applies at startup or `python cli.py migrate` applies on demand.
 
 CREATE TABLE public.galactic_items (
     id integer NOT NULL,
@@ -0,0 +1,272 @@
+"""In-process metrics in the Prometheus text format, kept cheap enough to leave on"""
+import bisect
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Content type of the Prometheus text exposition format (the response adds the charset)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ACQUIRE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Route label for requests that matched no API route (static files, 404s), so unknown
+# paths cannot create unbounded label values
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Histogram with fixed buckets; an observation is one bisect and two additions"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = HTTP_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label values: a count per bucket (the last one is +Inf), not yet cumulative, and the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total[0])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge:
+    """Gauge read when metrics are rendered, from a callback returning (label values, value) pairs"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge"
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self) -> Iterable[str]:
+        samples = list(self.collect())
+        if not samples:
+            return
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in samples:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "galactic_http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "galactic_http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of the response",
+    ("method", "route"), HTTP_BUCKETS
+))
+statement_duration = registry.register(Histogram(
+    "galactic_db_statement_duration_seconds", "Execution time of repository statements, by statement name",
+    ("statement",), STATEMENT_BUCKETS
+))
+statement_rows = registry.register(Counter(
+    "galactic_db_statement_rows_total", "Rows returned by repository statements", ("statement",)
+))
+statement_errors = registry.register(Counter(
+    "galactic_db_statement_errors_total", "Repository statements that raised an error", ("statement",)
+))
+pool_acquire_wait = registry.register(Histogram(
+    "galactic_db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection", (), ACQUIRE_BUCKETS
+))
+pool_acquire_timeouts = registry.register(Counter(
+    "galactic_db_pool_acquire_timeouts_total",
+    "Pool acquires that gave up because no connection became free within the acquire timeout"
+))
+slow_statements = registry.register(Counter(
+    "galactic_db_slow_statements_total", "Repository statements slower than the slow query threshold", ("statement",)
+))
+replica_fallbacks = registry.register(Counter(
+    "galactic_db_replica_fallbacks_total",
+    "Reads sent to the primary because their replica had not replayed the client's last write in time"
+))
+
+coalesced_requests = registry.register(Counter(
+    "galactic_coalesced_requests_total",
+    "Coalesced GET requests by route: leader (ran the query), shared (joined one in flight) "
+    "or cached (micro-cache hit)",
+    ("route", "outcome")
+))
+
+
+def observe_statement(name: str, seconds: float, rows: Optional[int]):
+    """Record one repository statement; rows is None if it raised"""
+    statement_duration.observe(seconds, name)
+    if rows is None:
+        statement_errors.inc(name)
+    else:
+        statement_rows.inc(name, amount=rows)
+
+
+def register_admission(admission):
+    """Report admission control state per route class, read whenever metrics are rendered"""
+    def per_class(key):
+        return [((name,), stats[key]) for name, stats in admission.stats().items()]
+
+    registry.register(Gauge(
+        "galactic_admission_active_requests", "Requests running, per admission class",
+        lambda: per_class("active"), ("class",)
+    ))
+    registry.register(Gauge(
+        "galactic_admission_queued_requests", "Requests waiting for an admission slot, per class",
+        lambda: per_class("queued"), ("class",)
+    ))
+    registry.register(Gauge(
+        "galactic_admission_shed_requests_total",
+        "Requests answered with a 503 because their class queue was full or their wait timed out",
+        lambda: [((name, reason), count) for name, stats in admission.stats().items()
+                 for reason, count in stats["shed"].items()],
+        ("class", "reason"), kind="counter"
+    ))
+
+
+def register_database(database):
+    """Report a Database's pool and catalog cache state, read whenever metrics are rendered"""
+    def pool(key):
+        stats = database.pool_stats()
+        return [((), stats[key])] if stats else []
+
+    def cache(key):
+        return [((), database.cache.stats()[key])]
+
+    for key, name, documentation in (
+        ("size", "galactic_db_pool_connections", "Open connections in the pool"),
+        ("idle", "galactic_db_pool_idle_connections", "Pooled connections not in use"),
+        ("max_size", "galactic_db_pool_max_connections", "Maximum size of the pool"),
+        ("waiting", "galactic_db_pool_waiting_requests", "Requests waiting for a pooled connection"),
+    ):
+        registry.register(Gauge(name, documentation, lambda key=key: pool(key)))
+    def replicas(key):
+        return [((replica.name,), value) for replica in database.replicas
+                for value in [replica.status(database.replica_max_lag)[key]] if value is not None]
+
+    for key, name, documentation in (
+        ("lag_bytes", "galactic_db_replica_lag_bytes", "WAL bytes the replica had still to replay at the last probe"),
+        ("lag_seconds", "galactic_db_replica_lag_seconds", "Replication delay of the replica at the last probe"),
+        (
+            "available", "galactic_db_replica_available",
+            "1 if the replica serves reads, 0 if it is down or too far behind"
+        ),
+    ):
+        registry.register(Gauge(name, documentation, lambda key=key: replicas(key), ("replica",)))
+    for key, documentation in (
+        ("hits", "Catalog cache hits"),
+        ("misses", "Catalog cache misses"),
+        ("invalidations", "Catalog cache namespace invalidations"),
+    ):
+        registry.register(Gauge(
+            f"galactic_catalog_cache_{key}_total", documentation, lambda key=key: cache(key), kind="counter"
+        ))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them per route template
+    (e.g. /stations/{station_id}/inventory), so ids in paths do not become labels
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_request_duration.observe(time.perf_counter() - start, method, path)
+            http_requests.inc(method, path, str(status_code))
@@ -0,0 +1,272 @@
+"""Versioned schema migrations and the index coverage check for repository statements"""
+import asyncio
+import json
+import logging
+import re
+import asyncpg
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from repository import STATEMENTS, Repository
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+MIGRATIONS_TABLE = "galactic_schema_migrations"
+
+# Steps whose first line is this marker run outside a transaction (e.g. CREATE INDEX CONCURRENTLY),
+# one statement at a time; they must be safe to re-run after a failure and must not use $$ bodies
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# Advisory lock held while migrating, so workers starting together apply each step once
+MIGRATION_LOCK_ID = 0x67616c6d  # "galm"
+
+MIGRATION_LOCK_POLL_INTERVAL = 0.5
+
+_MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+_CONCURRENT_INDEX = re.compile(
+    r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:public\.)?\"?(\w+)\"?",
+    re.IGNORECASE
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self) -> List[str]:
+        """Split a no-transaction step into statements (each ends with ; at the end of a line)"""
+        statements = []
+        for chunk in re.split(r";[ \t]*$", self.sql, flags=re.MULTILINE):
+            lines = [line for line in chunk.strip().splitlines() if not line.lstrip().startswith("--")]
+            if any(line.strip() for line in lines):
+                statements.append("\n".join(lines).strip())
+        return statements
+
+    def concurrent_indexes(self) -> List[str]:
+        """Names of the indexes a no-transaction step builds with CREATE INDEX CONCURRENTLY"""
+        return [match.group(1) for match in map(_CONCURRENT_INDEX.match, self.statements()) if match]
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Read the NNNN_name.sql steps in version order"""
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = _MIGRATION_FILE.match(path.name)
+        if not match:
+            raise ValueError(f"Migration file name must look like 0001_name.sql: {path.name}")
+        migrations.append(Migration(match.group(1), match.group(2), path.read_text(encoding="utf-8")))
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Duplicate migration versions")
+    return migrations
+
+
+async def applied_migrations(conn: asyncpg.Connection) -> Dict[str, Any]:
+    """Applied versions with the time each was applied"""
+    await conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version text PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamp with time zone DEFAULT now() NOT NULL
+        )
+        """
+    )
+    rows = await conn.fetch(f"SELECT version, applied_at FROM {MIGRATIONS_TABLE}")
+    return {row["version"]: row["applied_at"] for row in rows}
+
+
+async def _drop_invalid_indexes(conn: asyncpg.Connection, names: Sequence[str]):
+    """
+    Drop the named indexes if an interrupted CREATE INDEX CONCURRENTLY left them invalid, so
+    the step can rebuild them; invalid indexes of other names may still be building elsewhere
+    """
+    invalid = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_index x
+        JOIN pg_class c ON c.oid = x.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND NOT x.indisvalid AND c.relname = ANY($1::text[])
+        """,
+        list(names)
+    )
+    for row in invalid:
+        logger.warning("Dropping invalid index %s", row["relname"])
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS public."{row["relname"]}"')
+
+
+async def _apply(conn: asyncpg.Connection, migration: Migration):
+    record = f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES ($1, $2)"
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute(record, migration.version, migration.name)
+        return
+    await _drop_invalid_indexes(conn, migration.concurrent_indexes())
+    for statement in migration.statements():
+        await conn.execute(statement)
+    await conn.execute(record, migration.version, migration.name)
+
+
+async def migrate(conn: asyncpg.Connection, migrations: Optional[Sequence[Migration]] = None) -> List[Migration]:
+    """Apply every pending migration in version order, returning the ones applied"""
+    migrations = load_migrations() if migrations is None else migrations
+    # Poll rather than block: a session waiting in pg_advisory_lock holds a snapshot that
+    # CREATE INDEX CONCURRENTLY in the session holding the lock would wait for
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+        await asyncio.sleep(MIGRATION_LOCK_POLL_INTERVAL)
+    try:
+        applied = await applied_migrations(conn)
+        pending = [migration for migration in migrations if migration.version not in applied]
+        for migration in pending:
+            logger.info("Applying migration %s_%s", migration.version, migration.name)
+            await _apply(conn, migration)
+        return pending
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def migrate_database(dsn: str) -> List[Migration]:
+    """Connect, apply pending migrations and disconnect"""
+    conn = await asyncpg.connect(dsn)
+    try:
+        return await migrate(conn)
+    finally:
+        await conn.close()
+
+
+class _StatementRecorder(Repository):
+    """Repository that records the statements its methods would run instead of running them"""
+
+    def __init__(self):
+        super().__init__(None)
+        self.statements: List[Tuple[str, Sequence[Any]]] = []
+
+    async def fetch(self, name: str, *args: Any, sql: Optional[str] = None):
+        self.statements.append((sql or STATEMENTS[name], args))
+        return []
+
+    async def fetchrow(self, name: str, *args: Any, sql: Optional[str] = None):
+        self.statements.append((sql or STATEMENTS[name], args))
+        return None
+
+
+# Every lookup the routers make, with sample arguments; the export deliberately reads
+# whole tables and is not listed
+INDEX_CHECKS = [
+    ("list items", lambda repo: repo.list_items(100)),
+    ("list items after cursor", lambda repo: repo.list_items(100, after_id=1)),
+    ("list items by type", lambda repo: repo.list_items(100, item_type_id=1)),
+    ("list items by name", lambda repo: repo.list_items(100, name="ore")),
+    ("list items by name prefix", lambda repo: repo.list_items(100, name_prefix="or")),
+    ("search items", lambda repo: repo.search_items("or", 10)),
+    ("stations for items", lambda repo: repo.stations_for_items([1, 2])),
+    ("item stations", lambda repo: repo.item_stations(1)),
+    ("list item types", lambda repo: repo.list_item_types(100)),
+    ("list item types after cursor", lambda repo: repo.list_item_types(100, after=("a", 1))),
+    ("list item types by name prefix", lambda repo: repo.list_item_types(100, name_prefix="a")),
+    ("list planets", lambda repo: repo.list_planets(100, after_id=1)),
+    ("list planets by name prefix", lambda repo: repo.list_planets(100, name_prefix="a")),
+    ("list stations", lambda repo: repo.list_stations(100, after_id=1)),
+    ("list stations by name prefix", lambda repo: repo.list_stations(100, name_prefix="a")),
+    ("list stations with inventory", lambda repo: repo.list_stations_with_inventory(100, after_id=1)),
+    ("get items by ids", lambda repo: repo.list_items(2, ids=[1, 2])),
+    ("get item types by ids", lambda repo: repo.list_item_types(2, ids=[1, 2])),
+    ("get planets by ids", lambda repo: repo.list_planets(2, ids=[1, 2])),
+    ("get stations by ids", lambda repo: repo.list_stations(2, ids=[1, 2])),
+    ("get stations with inventory by ids", lambda repo: repo.list_stations_with_inventory(2, ids=[1, 2])),
+    ("list station inventory", lambda repo: repo.list_station_inventory(1, 100, after_id=1)),
+    ("list station inventory by item", lambda repo: repo.list_station_inventory(1, 100, item_id=1)),
+    ("adjust station inventory", lambda repo: repo.adjust_station_inventory(1, 1, 1)),
+    ("remove station inventory", lambda repo: repo.remove_station_inventory(1, 1)),
+    ("list planet inventory", lambda repo: repo.list_planet_inventory(1, 100, after_id=1)),
+    ("adjust planet inventory", lambda repo: repo.adjust_planet_inventory(1, 1, 1)),
+    ("remove planet inventory", lambda repo: repo.remove_planet_inventory(1, 1)),
+    ("station item type totals", lambda repo: repo.station_item_type_totals(1)),
+    ("item type station totals", lambda repo: repo.list_item_type_station_totals(1, 100, after_id=1)),
+    ("item totals", lambda repo: repo.item_totals(1)),
+    ("list item totals", lambda repo: repo.list_item_totals(100, after_id=1)),
+    ("list item totals by type", lambda repo: repo.list_item_totals(100, item_type_id=1)),
+    ("search", lambda repo: repo.search("ore", 20)),
+    ("search stations after cursor", lambda repo: repo.search("ore", 20, ["station"], (0.5, "station", 1))),
+    ("versions", lambda repo: repo.versions(["items"])),
+    *[
+        (f"{action} {entity}", lambda repo, action=action, entity=entity: getattr(repo, action)(entity, *args))
+        for entity in ("items", "item_types", "planets", "stations")
+        for action, args in (("get", (1,)), ("delete", (1,)))
+    ],
+]
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _full_scans(plan: Dict[str, Any], leading_columns: Dict[str, str], limited: bool = False) -> List[str]:
+    """
+    Tables a plan reads in full: sequential scans, index scans whose condition does not
+    constrain the index's leading column, and whole-index scans that are filtered or
+    not stopped early by a LIMIT (reading an index in ORDER BY order up to a LIMIT is a page read)
+    """
+    found = []
+    node = plan.get("Node Type")
+    if node == "Seq Scan":
+        found.append(plan["Relation Name"])
+    elif node in INDEX_SCANS:
+        condition = plan.get("Index Cond")
+        leading = leading_columns.get(plan["Index Name"])
+        if condition is None:
+            if not limited or plan.get("Filter") is not None:
+                found.append(f"{plan['Index Name']} (full index scan)")
+        elif leading is not None and not re.search(rf"\b{re.escape(leading)}\b", condition):
+            found.append(f"{plan['Index Name']} (leading column not used)")
+    for child in plan.get("Plans", ()):
+        found.extend(_full_scans(child, leading_columns, limited or node == "Limit"))
+    return found
+
+
+async def _leading_columns(conn: asyncpg.Connection) -> Dict[str, str]:
+    """Leading column of each index on a plain column (expression indexes are left out)"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, a.attname
+        FROM pg_index x
+        JOIN pg_class c ON c.oid = x.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]
+        WHERE n.nspname = 'public'
+        """
+    )
+    return {row["relname"]: row["attname"] for row in rows}
+
+
+async def check_indexes(conn: asyncpg.Connection) -> Dict[str, List[str]]:
+    """
+    EXPLAIN every repository lookup with sequential scans, hash joins and merge joins
+    disabled, so the planner uses an index wherever one applies whatever the table sizes
+    in this database. Returns what each lookup still reads in full; an empty
+    list means the lookup is fully index-backed.
+    """
+    results = {}
+    leading_columns = await _leading_columns(conn)
+    async with conn.transaction():
+        for setting in ("enable_seqscan", "enable_hashjoin", "enable_mergejoin"):
+            await conn.execute(f"SET LOCAL {setting} = off")
+        for label, call in INDEX_CHECKS:
+            recorder = _StatementRecorder()
+            await call(recorder)
+            scans = []
+            for sql, args in recorder.statements:
+                plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans.extend(_full_scans(plan[0]["Plan"], leading_columns))
+            results[label] = sorted(set(scans))
+    return results
@@ -0,0 +1,10 @@
+-- Item types, referenced by galactic_items.item_type_id
+
+CREATE TABLE IF NOT EXISTS public.galactic_item_types (
+    id integer NOT NULL,
+    name character varying(255) NOT NULL,
+    description text
+);
+
+ALTER TABLE public.galactic_items
+    ADD COLUMN IF NOT EXISTS item_type_id integer;
@@ -0,0 +1,24 @@
+-- migrate: no-transaction
+-- Unique indexes on every id column, built without blocking writes;
+-- 0003 turns them into primary keys
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_item_types_pkey
+    ON public.galactic_item_types USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_items_pkey
+    ON public.galactic_items USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_pkey
+    ON public.galactic_planets USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_inventory_pkey
+    ON public.galactic_planets_inventory USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_solar_systems_pkey
+    ON public.galactic_solar_systems USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_pkey
+    ON public.galactic_stations USING btree (id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_inventory_pkey
+    ON public.galactic_stations_inventory USING btree (id);
@@ -0,0 +1,30 @@
+-- Primary keys (from the indexes built by 0002) and id sequences for every table.
+-- Tables that already have a primary key or an id default are left as they are.
+
+DO $$
+DECLARE
+    t text;
+    seq text;
+BEGIN
+    FOREACH t IN ARRAY ARRAY[
+        'galactic_item_types', 'galactic_items', 'galactic_planets', 'galactic_planets_inventory',
+        'galactic_solar_systems', 'galactic_stations', 'galactic_stations_inventory'
+    ] LOOP
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint WHERE conrelid = format('public.%I', t)::regclass AND contype = 'p'
+        ) THEN
+            EXECUTE format('ALTER TABLE public.%I ADD CONSTRAINT %I PRIMARY KEY USING INDEX %I', t, t || '_pkey', t || '_pkey');
+        END IF;
+
+        IF pg_get_serial_sequence(format('public.%I', t), 'id') IS NULL AND NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = t AND column_name = 'id' AND column_default IS NOT NULL
+        ) THEN
+            seq := t || '_id_seq';
+            EXECUTE format('CREATE SEQUENCE public.%I AS integer OWNED BY public.%I.id', seq, t);
+            EXECUTE format('SELECT setval(%L, COALESCE(max(id), 0) + 1, false) FROM public.%I', 'public.' || seq, t);
+            EXECUTE format('ALTER TABLE public.%I ALTER COLUMN id SET DEFAULT nextval(%L)', t, 'public.' || seq);
+        END IF;
+    END LOOP;
+END
+$$;
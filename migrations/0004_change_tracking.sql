@@ -0,0 +1,27 @@
+-- Version counters bumped by every API write, per table and per station/planet inventory
+-- (e.g. 'items', 'station_inventory', 'station_inventory:42'); used for ETags
+CREATE TABLE IF NOT EXISTS public.galactic_versions (
+    key text PRIMARY KEY,
+    version bigint NOT NULL
+);
+
+-- Records an API write: bumps the version of every key and notifies the galactic_changes
+-- channel with the change details plus the new versions, which it also returns.
+-- Called from the write statement itself, so the notification is sent only if it commits.
+CREATE OR REPLACE FUNCTION public.galactic_record_change(keys text[], change jsonb) RETURNS jsonb
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    versions jsonb;
+BEGIN
+    WITH bumped AS (
+        INSERT INTO public.galactic_versions AS v (key, version)
+        SELECT unnest(keys), 1
+        ON CONFLICT (key) DO UPDATE SET version = v.version + 1
+        RETURNING v.key, v.version
+    )
+    SELECT jsonb_object_agg(bumped.key, bumped.version) INTO versions FROM bumped;
+    PERFORM pg_notify('galactic_changes', (change || jsonb_build_object('versions', versions))::text);
+    RETURN versions;
+END
+$$;
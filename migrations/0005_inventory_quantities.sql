@@ -0,0 +1,56 @@
+-- Move an existing database to quantity-based inventory:
+-- one entry per (station, item) and per (planet, item), holding a quantity.
+-- Duplicate station inventory rows are collapsed into the lowest id, which keeps their count.
+
+ALTER TABLE public.galactic_stations_inventory
+    ADD COLUMN IF NOT EXISTS quantity integer DEFAULT 1 NOT NULL CHECK (quantity >= 0);
+
+ALTER TABLE public.galactic_planets_inventory
+    ADD COLUMN IF NOT EXISTS galactic_item_id integer,
+    ADD COLUMN IF NOT EXISTS quantity integer DEFAULT 1 NOT NULL CHECK (quantity >= 0);
+
+CREATE TEMP TABLE galactic_stations_inventory_collapsed ON COMMIT DROP AS
+SELECT
+    min(id) as keep_id,
+    sum(quantity) as quantity
+FROM public.galactic_stations_inventory
+WHERE galactic_station_id IS NOT NULL AND galactic_item_id IS NOT NULL
+GROUP BY galactic_station_id, galactic_item_id
+HAVING count(*) > 1;
+
+UPDATE public.galactic_stations_inventory si
+SET quantity = c.quantity
+FROM galactic_stations_inventory_collapsed c
+WHERE si.id = c.keep_id;
+
+DELETE FROM public.galactic_stations_inventory si
+USING galactic_stations_inventory_collapsed c, public.galactic_stations_inventory kept
+WHERE kept.id = c.keep_id
+  AND si.galactic_station_id = kept.galactic_station_id
+  AND si.galactic_item_id = kept.galactic_item_id
+  AND si.id <> c.keep_id;
+
+DROP INDEX IF EXISTS public.galactic_stations_inventory_station_id_item_id_idx;
+
+CREATE UNIQUE INDEX IF NOT EXISTS galactic_stations_inventory_station_id_item_id_key
+    ON public.galactic_stations_inventory USING btree (galactic_station_id, galactic_item_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS galactic_planets_inventory_planet_id_item_id_key
+    ON public.galactic_planets_inventory USING btree (galactic_planet_id, galactic_item_id);
+
+-- Inventory responses now carry quantities: bump every inventory version so no client
+-- revalidates an old response with its ETag. Keys are bumped 100 at a time, which keeps
+-- each change notification under the 8000-byte payload limit.
+SELECT public.galactic_record_change(
+    array_agg(key),
+    jsonb_build_object('table', 'station_inventory', 'op', 'migrate')
+)
+FROM (
+    SELECT key, (row_number() OVER () - 1) / 100 as batch
+    FROM unnest(
+        ARRAY['station_inventory', 'planet_inventory']
+            || ARRAY(SELECT 'station_inventory:' || id FROM public.galactic_stations)
+            || ARRAY(SELECT 'planet_inventory:' || id FROM public.galactic_planets)
+    ) key
+) keys
+GROUP BY batch;
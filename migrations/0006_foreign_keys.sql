@@ -0,0 +1,35 @@
+-- Foreign keys from items to item types and from inventory to locations and items.
+-- Added NOT VALID so existing rows are not checked while the tables are locked; 0007
+-- validates them. Deleting a station, planet or item now deletes its inventory entries,
+-- and deleting an item type clears it from its items.
+
+-- Rows already pointing at deleted locations, items or types could never be shown
+DELETE FROM public.galactic_stations_inventory si
+WHERE NOT EXISTS (SELECT 1 FROM public.galactic_stations s WHERE s.id = si.galactic_station_id)
+   OR NOT EXISTS (SELECT 1 FROM public.galactic_items i WHERE i.id = si.galactic_item_id);
+
+DELETE FROM public.galactic_planets_inventory pi
+WHERE NOT EXISTS (SELECT 1 FROM public.galactic_planets p WHERE p.id = pi.galactic_planet_id)
+   OR (pi.galactic_item_id IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM public.galactic_items i WHERE i.id = pi.galactic_item_id));
+
+UPDATE public.galactic_items i
+SET item_type_id = NULL
+WHERE item_type_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM public.galactic_item_types it WHERE it.id = i.item_type_id);
+
+ALTER TABLE public.galactic_items
+    ADD CONSTRAINT galactic_items_item_type_id_fkey FOREIGN KEY (item_type_id)
+    REFERENCES public.galactic_item_types (id) ON DELETE SET NULL NOT VALID;
+
+ALTER TABLE public.galactic_stations_inventory
+    ADD CONSTRAINT galactic_stations_inventory_station_id_fkey FOREIGN KEY (galactic_station_id)
+    REFERENCES public.galactic_stations (id) ON DELETE CASCADE NOT VALID,
+    ADD CONSTRAINT galactic_stations_inventory_item_id_fkey FOREIGN KEY (galactic_item_id)
+    REFERENCES public.galactic_items (id) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE public.galactic_planets_inventory
+    ADD CONSTRAINT galactic_planets_inventory_planet_id_fkey FOREIGN KEY (galactic_planet_id)
+    REFERENCES public.galactic_planets (id) ON DELETE CASCADE NOT VALID,
+    ADD CONSTRAINT galactic_planets_inventory_item_id_fkey FOREIGN KEY (galactic_item_id)
+    REFERENCES public.galactic_items (id) ON DELETE CASCADE NOT VALID;
@@ -0,0 +1,8 @@
+-- Check existing rows against the foreign keys from 0006; validation only takes a
+-- SHARE UPDATE EXCLUSIVE lock, so reads and writes continue meanwhile
+
+ALTER TABLE public.galactic_items VALIDATE CONSTRAINT galactic_items_item_type_id_fkey;
+ALTER TABLE public.galactic_stations_inventory VALIDATE CONSTRAINT galactic_stations_inventory_station_id_fkey;
+ALTER TABLE public.galactic_stations_inventory VALIDATE CONSTRAINT galactic_stations_inventory_item_id_fkey;
+ALTER TABLE public.galactic_planets_inventory VALIDATE CONSTRAINT galactic_planets_inventory_planet_id_fkey;
+ALTER TABLE public.galactic_planets_inventory VALIDATE CONSTRAINT galactic_planets_inventory_item_id_fkey;
@@ -0,0 +1,29 @@
+-- migrate: no-transaction
+-- Indexes for the API's lookups, built without blocking writes.
+-- Inventory location columns are covered by the unique (location, item) indexes from 0005.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_inventory_item_id_idx
+    ON public.galactic_stations_inventory USING btree (galactic_item_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_inventory_item_id_idx
+    ON public.galactic_planets_inventory USING btree (galactic_item_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_items_item_type_id_id_idx
+    ON public.galactic_items USING btree (item_type_id, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_item_types_name_id_idx
+    ON public.galactic_item_types USING btree (name, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_item_types_lower_name_idx
+    ON public.galactic_item_types USING btree (lower((name)::text) text_pattern_ops);
+
+-- Item names are unique ignoring case; also serves name prefix searches.
+-- Rename or merge duplicates first: SELECT lower(name), count(*) FROM galactic_items GROUP BY 1 HAVING count(*) > 1
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS galactic_items_lower_name_key
+    ON public.galactic_items USING btree (lower((name)::text) text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_lower_name_idx
+    ON public.galactic_planets USING btree (lower((name)::text) text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_lower_name_idx
+    ON public.galactic_stations USING btree (lower((name)::text) text_pattern_ops);
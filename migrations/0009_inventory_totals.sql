@@ -0,0 +1,291 @@
+-- Inventory totals for reports, kept current by triggers so no report reads inventory rows:
+-- per station and item type (untyped items under a null type), and per item across all
+-- stations and planets. Every write path (API, bulk import, cascading deletes, item type
+-- changes, direct SQL) goes through the triggers. galactic_rebuild_inventory_totals()
+-- recomputes both tables from scratch (python cli.py rebuild-totals).
+
+CREATE TABLE IF NOT EXISTS public.galactic_station_item_type_totals (
+    galactic_station_id integer NOT NULL
+        REFERENCES public.galactic_stations (id) ON DELETE CASCADE,
+    item_type_id integer,
+    items integer NOT NULL,
+    quantity bigint NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS galactic_station_item_type_totals_key
+    ON public.galactic_station_item_type_totals USING btree (galactic_station_id, (COALESCE(item_type_id, 0)));
+
+CREATE INDEX IF NOT EXISTS galactic_station_item_type_totals_item_type_id_idx
+    ON public.galactic_station_item_type_totals USING btree (item_type_id, galactic_station_id);
+
+CREATE TABLE IF NOT EXISTS public.galactic_item_totals (
+    galactic_item_id integer PRIMARY KEY
+        REFERENCES public.galactic_items (id) ON DELETE CASCADE,
+    stations integer NOT NULL,
+    station_quantity bigint NOT NULL,
+    planets integer NOT NULL,
+    planet_quantity bigint NOT NULL
+);
+
+-- Adds inventory changes to the totals: per (location, item), the change in quantity and in
+-- the number of entries (+1 inserted, -1 deleted). Changes for an item or station deleted
+-- in the same statement are skipped: their totals rows go with them (the station's type
+-- totals for a deleted item are taken off by the galactic_items_delete_totals trigger).
+-- Rows are upserted in key order so concurrent writers lock them in the same order.
+CREATE OR REPLACE FUNCTION public.galactic_apply_inventory_deltas(
+    location text,
+    location_ids integer[],
+    item_ids integer[],
+    quantities bigint[],
+    entries integer[]
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF location = 'station' THEN
+        INSERT INTO public.galactic_station_item_type_totals AS t (galactic_station_id, item_type_id, items, quantity)
+        SELECT d.location_id, i.item_type_id, sum(d.entries), sum(d.quantity)
+        FROM unnest(location_ids, item_ids, quantities, entries) AS d(location_id, item_id, quantity, entries)
+        JOIN public.galactic_items i ON i.id = d.item_id
+        JOIN public.galactic_stations s ON s.id = d.location_id
+        GROUP BY d.location_id, i.item_type_id
+        ORDER BY d.location_id, COALESCE(i.item_type_id, 0)
+        ON CONFLICT (galactic_station_id, (COALESCE(item_type_id, 0)))
+        DO UPDATE SET items = t.items + EXCLUDED.items, quantity = t.quantity + EXCLUDED.quantity;
+
+        DELETE FROM public.galactic_station_item_type_totals
+        WHERE galactic_station_id = ANY(location_ids) AND items = 0;
+    END IF;
+
+    INSERT INTO public.galactic_item_totals AS t (galactic_item_id, stations, station_quantity, planets, planet_quantity)
+    SELECT
+        d.item_id,
+        CASE WHEN location = 'station' THEN sum(d.entries) ELSE 0 END,
+        CASE WHEN location = 'station' THEN sum(d.quantity) ELSE 0 END,
+        CASE WHEN location = 'planet' THEN sum(d.entries) ELSE 0 END,
+        CASE WHEN location = 'planet' THEN sum(d.quantity) ELSE 0 END
+    FROM unnest(item_ids, quantities, entries) AS d(item_id, quantity, entries)
+    JOIN public.galactic_items i ON i.id = d.item_id
+    GROUP BY d.item_id
+    ORDER BY d.item_id
+    ON CONFLICT (galactic_item_id) DO UPDATE SET
+        stations = t.stations + EXCLUDED.stations,
+        station_quantity = t.station_quantity + EXCLUDED.station_quantity,
+        planets = t.planets + EXCLUDED.planets,
+        planet_quantity = t.planet_quantity + EXCLUDED.planet_quantity;
+
+    DELETE FROM public.galactic_item_totals
+    WHERE galactic_item_id = ANY(item_ids) AND stations = 0 AND planets = 0;
+END
+$$;
+
+-- Statement-level trigger on galactic_stations_inventory: one update of the totals per statement,
+-- however many rows it wrote. An update counts as its old rows removed and its new rows added.
+CREATE OR REPLACE FUNCTION public.galactic_stations_inventory_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    old_locations integer[];
+    old_items integer[];
+    old_quantities bigint[];
+    old_entries integer[];
+    new_locations integer[];
+    new_items integer[];
+    new_quantities bigint[];
+    new_entries integer[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT array_agg(galactic_station_id), array_agg(galactic_item_id), array_agg(-quantity::bigint), array_agg(-1)
+        INTO old_locations, old_items, old_quantities, old_entries
+        FROM old_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT array_agg(galactic_station_id), array_agg(galactic_item_id), array_agg(quantity::bigint), array_agg(1)
+        INTO new_locations, new_items, new_quantities, new_entries
+        FROM new_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF old_items IS NOT NULL OR new_items IS NOT NULL THEN
+        PERFORM public.galactic_apply_inventory_deltas(
+            'station',
+            old_locations || new_locations,
+            old_items || new_items,
+            old_quantities || new_quantities,
+            old_entries || new_entries
+        );
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- Statement-level trigger on galactic_planets_inventory: one update of the totals per statement,
+-- however many rows it wrote. An update counts as its old rows removed and its new rows added.
+CREATE OR REPLACE FUNCTION public.galactic_planets_inventory_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    old_locations integer[];
+    old_items integer[];
+    old_quantities bigint[];
+    old_entries integer[];
+    new_locations integer[];
+    new_items integer[];
+    new_quantities bigint[];
+    new_entries integer[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT array_agg(galactic_planet_id), array_agg(galactic_item_id), array_agg(-quantity::bigint), array_agg(-1)
+        INTO old_locations, old_items, old_quantities, old_entries
+        FROM old_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT array_agg(galactic_planet_id), array_agg(galactic_item_id), array_agg(quantity::bigint), array_agg(1)
+        INTO new_locations, new_items, new_quantities, new_entries
+        FROM new_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF old_items IS NOT NULL OR new_items IS NOT NULL THEN
+        PERFORM public.galactic_apply_inventory_deltas(
+            'planet',
+            old_locations || new_locations,
+            old_items || new_items,
+            old_quantities || new_quantities,
+            old_entries || new_entries
+        );
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- Transition tables are only allowed on single-event triggers, hence one trigger per event
+
+DROP TRIGGER IF EXISTS galactic_stations_inventory_totals_insert ON public.galactic_stations_inventory;
+CREATE TRIGGER galactic_stations_inventory_totals_insert
+    AFTER INSERT ON public.galactic_stations_inventory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_stations_inventory_totals();
+
+DROP TRIGGER IF EXISTS galactic_stations_inventory_totals_update ON public.galactic_stations_inventory;
+CREATE TRIGGER galactic_stations_inventory_totals_update
+    AFTER UPDATE ON public.galactic_stations_inventory
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_stations_inventory_totals();
+
+DROP TRIGGER IF EXISTS galactic_stations_inventory_totals_delete ON public.galactic_stations_inventory;
+CREATE TRIGGER galactic_stations_inventory_totals_delete
+    AFTER DELETE ON public.galactic_stations_inventory
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_stations_inventory_totals();
+
+DROP TRIGGER IF EXISTS galactic_planets_inventory_totals_insert ON public.galactic_planets_inventory;
+CREATE TRIGGER galactic_planets_inventory_totals_insert
+    AFTER INSERT ON public.galactic_planets_inventory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_planets_inventory_totals();
+
+DROP TRIGGER IF EXISTS galactic_planets_inventory_totals_update ON public.galactic_planets_inventory;
+CREATE TRIGGER galactic_planets_inventory_totals_update
+    AFTER UPDATE ON public.galactic_planets_inventory
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_planets_inventory_totals();
+
+DROP TRIGGER IF EXISTS galactic_planets_inventory_totals_delete ON public.galactic_planets_inventory;
+CREATE TRIGGER galactic_planets_inventory_totals_delete
+    AFTER DELETE ON public.galactic_planets_inventory
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.galactic_planets_inventory_totals();
+
+-- Moves an item's station quantities between type totals when its type changes
+-- (including to null when its item type is deleted)
+CREATE OR REPLACE FUNCTION public.galactic_items_type_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE public.galactic_station_item_type_totals t
+    SET items = t.items - 1, quantity = t.quantity - si.quantity
+    FROM public.galactic_stations_inventory si
+    WHERE si.galactic_item_id = OLD.id
+      AND t.galactic_station_id = si.galactic_station_id
+      AND COALESCE(t.item_type_id, 0) = COALESCE(OLD.item_type_id, 0);
+
+    DELETE FROM public.galactic_station_item_type_totals t
+    USING public.galactic_stations_inventory si
+    WHERE si.galactic_item_id = OLD.id
+      AND t.galactic_station_id = si.galactic_station_id
+      AND COALESCE(t.item_type_id, 0) = COALESCE(OLD.item_type_id, 0)
+      AND t.items = 0;
+
+    IF TG_OP = 'UPDATE' THEN
+        INSERT INTO public.galactic_station_item_type_totals AS t (galactic_station_id, item_type_id, items, quantity)
+        SELECT si.galactic_station_id, NEW.item_type_id, 1, si.quantity
+        FROM public.galactic_stations_inventory si
+        WHERE si.galactic_item_id = NEW.id
+        ORDER BY si.galactic_station_id
+        ON CONFLICT (galactic_station_id, (COALESCE(item_type_id, 0)))
+        DO UPDATE SET items = t.items + 1, quantity = t.quantity + EXCLUDED.quantity;
+        RETURN NULL;
+    END IF;
+    -- Before a delete: the inventory rows it cascades to are skipped by the inventory triggers
+    RETURN OLD;
+END
+$$;
+
+DROP TRIGGER IF EXISTS galactic_items_type_totals ON public.galactic_items;
+CREATE TRIGGER galactic_items_type_totals
+    AFTER UPDATE OF item_type_id ON public.galactic_items
+    FOR EACH ROW
+    WHEN (OLD.item_type_id IS DISTINCT FROM NEW.item_type_id)
+    EXECUTE FUNCTION public.galactic_items_type_totals();
+
+DROP TRIGGER IF EXISTS galactic_items_delete_totals ON public.galactic_items;
+CREATE TRIGGER galactic_items_delete_totals
+    BEFORE DELETE ON public.galactic_items
+    FOR EACH ROW EXECUTE FUNCTION public.galactic_items_type_totals();
+
+-- Recomputes both totals tables from the inventory. Inventory and item writes wait until it
+-- commits, so none is missed or counted twice. Records an inventory_totals change, so report
+-- ETags change if the totals had drifted.
+CREATE OR REPLACE FUNCTION public.galactic_rebuild_inventory_totals() RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    LOCK TABLE public.galactic_items, public.galactic_stations_inventory, public.galactic_planets_inventory
+        IN SHARE MODE;
+    TRUNCATE public.galactic_station_item_type_totals, public.galactic_item_totals;
+
+    INSERT INTO public.galactic_station_item_type_totals (galactic_station_id, item_type_id, items, quantity)
+    SELECT si.galactic_station_id, i.item_type_id, count(*), sum(si.quantity)
+    FROM public.galactic_stations_inventory si
+    JOIN public.galactic_items i ON i.id = si.galactic_item_id
+    GROUP BY si.galactic_station_id, i.item_type_id;
+
+    INSERT INTO public.galactic_item_totals (galactic_item_id, stations, station_quantity, planets, planet_quantity)
+    SELECT
+        item_id,
+        sum(stations),
+        sum(station_quantity),
+        sum(planets),
+        sum(planet_quantity)
+    FROM (
+        SELECT galactic_item_id AS item_id, count(*) AS stations, sum(quantity) AS station_quantity,
+               0 AS planets, 0 AS planet_quantity
+        FROM public.galactic_stations_inventory
+        GROUP BY galactic_item_id
+        UNION ALL
+        SELECT galactic_item_id, 0, 0, count(*), sum(quantity)
+        FROM public.galactic_planets_inventory
+        WHERE galactic_item_id IS NOT NULL
+        GROUP BY galactic_item_id
+    ) totals
+    GROUP BY item_id;
+
+    PERFORM public.galactic_record_change(
+        ARRAY['inventory_totals'],
+        jsonb_build_object('table', 'inventory_totals', 'op', 'rebuild')
+    );
+END
+$$;
+
+SELECT public.galactic_rebuild_inventory_totals();
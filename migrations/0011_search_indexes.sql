@@ -0,0 +1,27 @@
+-- migrate: no-transaction
+-- GIN indexes for GET /search, built without blocking writes: word matches on the search
+-- vectors from 0010, and trigram matches on names for misspelled or partial words.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_items_search_vector_idx
+    ON public.galactic_items USING gin (search_vector);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_items_name_trgm_idx
+    ON public.galactic_items USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_item_types_search_vector_idx
+    ON public.galactic_item_types USING gin (search_vector);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_item_types_name_trgm_idx
+    ON public.galactic_item_types USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_search_vector_idx
+    ON public.galactic_stations USING gin (search_vector);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_stations_name_trgm_idx
+    ON public.galactic_stations USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_search_vector_idx
+    ON public.galactic_planets USING gin (search_vector);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS galactic_planets_name_trgm_idx
+    ON public.galactic_planets USING gin (name gin_trgm_ops);
@@ -0,0 +1,177 @@
+-- Inventory totals count an entry only while its quantity is above zero. An entry decremented
+-- to 0 stays in the inventory, but the station or planet no longer holds the item, as the
+-- /items/{item_id}/stations lookup already assumes. Redefines the 0009 trigger functions so
+-- an entry counts as (quantity > 0) instead of 1, then rebuilds the totals.
+
+-- Statement-level trigger on galactic_stations_inventory: one update of the totals per statement,
+-- however many rows it wrote. An update counts as its old rows removed and its new rows added.
+CREATE OR REPLACE FUNCTION public.galactic_stations_inventory_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    old_locations integer[];
+    old_items integer[];
+    old_quantities bigint[];
+    old_entries integer[];
+    new_locations integer[];
+    new_items integer[];
+    new_quantities bigint[];
+    new_entries integer[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT
+            array_agg(galactic_station_id), array_agg(galactic_item_id),
+            array_agg(-quantity::bigint), array_agg(-(quantity > 0)::int)
+        INTO old_locations, old_items, old_quantities, old_entries
+        FROM old_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT
+            array_agg(galactic_station_id), array_agg(galactic_item_id),
+            array_agg(quantity::bigint), array_agg((quantity > 0)::int)
+        INTO new_locations, new_items, new_quantities, new_entries
+        FROM new_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF old_items IS NOT NULL OR new_items IS NOT NULL THEN
+        PERFORM public.galactic_apply_inventory_deltas(
+            'station',
+            old_locations || new_locations,
+            old_items || new_items,
+            old_quantities || new_quantities,
+            old_entries || new_entries
+        );
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- Statement-level trigger on galactic_planets_inventory: one update of the totals per statement,
+-- however many rows it wrote. An update counts as its old rows removed and its new rows added.
+CREATE OR REPLACE FUNCTION public.galactic_planets_inventory_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    old_locations integer[];
+    old_items integer[];
+    old_quantities bigint[];
+    old_entries integer[];
+    new_locations integer[];
+    new_items integer[];
+    new_quantities bigint[];
+    new_entries integer[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT
+            array_agg(galactic_planet_id), array_agg(galactic_item_id),
+            array_agg(-quantity::bigint), array_agg(-(quantity > 0)::int)
+        INTO old_locations, old_items, old_quantities, old_entries
+        FROM old_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT
+            array_agg(galactic_planet_id), array_agg(galactic_item_id),
+            array_agg(quantity::bigint), array_agg((quantity > 0)::int)
+        INTO new_locations, new_items, new_quantities, new_entries
+        FROM new_rows
+        WHERE galactic_item_id IS NOT NULL;
+    END IF;
+    IF old_items IS NOT NULL OR new_items IS NOT NULL THEN
+        PERFORM public.galactic_apply_inventory_deltas(
+            'planet',
+            old_locations || new_locations,
+            old_items || new_items,
+            old_quantities || new_quantities,
+            old_entries || new_entries
+        );
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- Moves an item's station quantities between type totals when its type changes
+-- (including to null when its item type is deleted)
+CREATE OR REPLACE FUNCTION public.galactic_items_type_totals() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE public.galactic_station_item_type_totals t
+    SET items = t.items - 1, quantity = t.quantity - si.quantity
+    FROM public.galactic_stations_inventory si
+    WHERE si.galactic_item_id = OLD.id
+      AND si.quantity > 0
+      AND t.galactic_station_id = si.galactic_station_id
+      AND COALESCE(t.item_type_id, 0) = COALESCE(OLD.item_type_id, 0);
+
+    DELETE FROM public.galactic_station_item_type_totals t
+    USING public.galactic_stations_inventory si
+    WHERE si.galactic_item_id = OLD.id
+      AND si.quantity > 0
+      AND t.galactic_station_id = si.galactic_station_id
+      AND COALESCE(t.item_type_id, 0) = COALESCE(OLD.item_type_id, 0)
+      AND t.items = 0;
+
+    IF TG_OP = 'UPDATE' THEN
+        INSERT INTO public.galactic_station_item_type_totals AS t (galactic_station_id, item_type_id, items, quantity)
+        SELECT si.galactic_station_id, NEW.item_type_id, 1, si.quantity
+        FROM public.galactic_stations_inventory si
+        WHERE si.galactic_item_id = NEW.id AND si.quantity > 0
+        ORDER BY si.galactic_station_id
+        ON CONFLICT (galactic_station_id, (COALESCE(item_type_id, 0)))
+        DO UPDATE SET items = t.items + 1, quantity = t.quantity + EXCLUDED.quantity;
+        RETURN NULL;
+    END IF;
+    -- Before a delete: the inventory rows it cascades to are skipped by the inventory triggers
+    RETURN OLD;
+END
+$$;
+
+-- Recomputes both totals tables from the inventory. Inventory and item writes wait until it
+-- commits, so none is missed or counted twice. Records an inventory_totals change, so report
+-- ETags change if the totals had drifted.
+CREATE OR REPLACE FUNCTION public.galactic_rebuild_inventory_totals() RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    LOCK TABLE public.galactic_items, public.galactic_stations_inventory, public.galactic_planets_inventory
+        IN SHARE MODE;
+    TRUNCATE public.galactic_station_item_type_totals, public.galactic_item_totals;
+
+    INSERT INTO public.galactic_station_item_type_totals (galactic_station_id, item_type_id, items, quantity)
+    SELECT si.galactic_station_id, i.item_type_id, count(*), sum(si.quantity)
+    FROM public.galactic_stations_inventory si
+    JOIN public.galactic_items i ON i.id = si.galactic_item_id
+    WHERE si.quantity > 0
+    GROUP BY si.galactic_station_id, i.item_type_id;
+
+    INSERT INTO public.galactic_item_totals (galactic_item_id, stations, station_quantity, planets, planet_quantity)
+    SELECT
+        item_id,
+        sum(stations),
+        sum(station_quantity),
+        sum(planets),
+        sum(planet_quantity)
+    FROM (
+        SELECT galactic_item_id AS item_id, count(*) AS stations, sum(quantity) AS station_quantity,
+               0 AS planets, 0 AS planet_quantity
+        FROM public.galactic_stations_inventory
+        WHERE quantity > 0
+        GROUP BY galactic_item_id
+        UNION ALL
+        SELECT galactic_item_id, 0, 0, count(*), sum(quantity)
+        FROM public.galactic_planets_inventory
+        WHERE galactic_item_id IS NOT NULL AND quantity > 0
+        GROUP BY galactic_item_id
+    ) totals
+    GROUP BY item_id;
+
+    PERFORM public.galactic_record_change(
+        ARRAY['inventory_totals'],
+        jsonb_build_object('table', 'inventory_totals', 'op', 'rebuild')
+    );
+END
+$$;
+
+SELECT public.galactic_rebuild_inventory_totals();
@@ -1,5 +1,8 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Literal, Optional
+
+# Largest quantity an inventory entry can hold (a Postgres integer)
+MAX_QUANTITY = 2**31 - 1
 
 
 class ItemTypeBase(BaseModel):
@@ -79,6 +82,12 @@ class Station(StationBase):
         from_attributes = True
 
 
+class ItemStations(BaseModel):
+    """Stations holding a given item"""
+    item_id: int
+    stations: List[Station]
+
+
 class SolarSystemBase(BaseModel):
     name: str = Field(..., max_length=255)
     description: Optional[str] = None
@@ -101,11 +110,12 @@ class StationInventoryBase(BaseModel):
 
 
 class StationInventoryCreate(StationInventoryBase):
-    pass
+    quantity: int = Field(1, ge=1, le=MAX_QUANTITY)
 
 
 class StationInventory(StationInventoryBase):
     id: int
+    quantity: int
 
     class Config:
         from_attributes = True
@@ -121,6 +131,8 @@ class PlanetInventoryCreate(PlanetInventoryBase):
 
 class PlanetInventory(PlanetInventoryBase):
     id: int
+    galactic_item_id: Optional[int] = None
+    quantity: int
 
     class Config:
         from_attributes = True
@@ -129,7 +141,147 @@ class PlanetInventory(PlanetInventoryBase):
 class InventoryItemDetail(BaseModel):
     """Detailed inventory entry with item information"""
     inventory_id: int
+    quantity: int
     item_id: int
     item_name: str
     item_description: Optional[str] = None
     item_type_name: Optional[str] = None
+
+
+class InventoryAdjustment(BaseModel):
+    """Change in the quantity of an item held at a station or planet"""
+    delta: int = Field(..., ge=-MAX_QUANTITY, le=MAX_QUANTITY)
+
+    @field_validator("delta")
+    @classmethod
+    def delta_not_zero(cls, delta: int) -> int:
+        if delta == 0:
+            raise ValueError("delta must not be zero")
+        return delta
+
+
+class StationWithInventory(Station):
+    """Station with its inventory entries embedded"""
+    inventory: Optional[List[InventoryItemDetail]] = None
+
+
+class BulkRowError(BaseModel):
+    """Error for a single row of a bulk import"""
+    row: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    """Outcome of a bulk import"""
+    received: int
+    inserted: int
+    errors: List[BulkRowError]
+
+
+class StationItemTypeTotal(BaseModel):
+    """How many different items of a type a station holds, and their total quantity"""
+    item_type_id: Optional[int] = None
+    item_type_name: Optional[str] = None
+    items: int
+    quantity: int
+
+
+class ItemTypeStationTotal(BaseModel):
+    """A station holding items of a type: how many different items, and their total quantity"""
+    station_id: int
+    station_name: str
+    items: int
+    quantity: int
+
+
+class ItemTotal(BaseModel):
+    """Stock of an item across the galaxy: entries and quantities at stations and on planets"""
+    item_id: int
+    item_name: str
+    item_type_id: Optional[int] = None
+    stations: int
+    station_quantity: int
+    planets: int
+    planet_quantity: int
+    quantity: int
+
+
+class SearchHit(BaseModel):
+    """An item, item type, station or planet matching a search, with its relevance"""
+    kind: Literal["item", "item_type", "station", "planet"]
+    id: int
+    name: str
+    description: Optional[str] = None
+    rank: float
+
+
+# Most items or inventory entries one transfer may list
+MAX_TRANSFER_IDS = 100000
+
+
+class InventoryLocation(BaseModel):
+    """A station or planet"""
+    kind: Literal["station", "planet"]
+    id: int
+
+
+class InventoryTransfer(BaseModel):
+    """
+    Entries to move from source to target, chosen by exactly one of: items, the source's
+    inventory entry ids, or an item type (everything of that type the source holds)
+    """
+    source: InventoryLocation
+    target: InventoryLocation
+    item_ids: Optional[List[int]] = Field(None, min_length=1, max_length=MAX_TRANSFER_IDS)
+    inventory_ids: Optional[List[int]] = Field(None, min_length=1, max_length=MAX_TRANSFER_IDS)
+    item_type_id: Optional[int] = None
+
+
+class TransferredEntry(BaseModel):
+    """An item moved by a transfer: its quantity, the source entry it left and the target entry it joined"""
+    item_id: int
+    quantity: int
+    source_inventory_id: int
+    target_inventory_id: int
+    target_quantity: int
+
+
+class TransferResult(BaseModel):
+    """What a transfer moved, by item"""
+    entries: int
+    quantity: int
+    moved: List[TransferredEntry]
+
+
+# Most operations one batch request may carry
+MAX_BATCH_OPERATIONS = 100
+
+
+class BatchOperation(BaseModel):
+    """
+    One API call inside a batch, e.g.
+    {"method": "PATCH", "path": "/stations/1/inventory/3", "body": {"delta": -2}}
+    """
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+    path: str = Field(..., pattern=r"^/", max_length=2048)
+    body: Optional[Any] = None
+    headers: Dict[str, str] = {}
+
+
+class BatchRequest(BaseModel):
+    """Operations run in order on one connection; with transaction, all commit or none do"""
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+    transaction: bool = False
+
+
+class BatchResult(BaseModel):
+    """Status and body an operation would have returned on its own, with its ETag and X-Next-Cursor headers"""
+    status: int
+    body: Optional[Any] = None
+    headers: Dict[str, str] = {}
+
+
+class BatchResponse(BaseModel):
+    """Results in operation order. committed is false if a transaction was rolled back"""
+    committed: bool
+    results: List[BatchResult]
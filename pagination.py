@@ -0,0 +1,77 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException, Response, status
+from typing import Any, List, Optional, Sequence
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor into values of the given types.
+    Malformed cursors are rejected with a 400.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        values = None
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(isinstance(value, kind) for value, kind in zip(values, types))
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def name_prefix_pattern(prefix: str) -> str:
+    """Build a LIKE pattern matching lower(name) against a literal prefix"""
+    escaped = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def add_condition(conditions: List[str], args: List[Any], clause: str, *values: Any):
+    """
+    Append a WHERE condition, numbering its placeholders after the existing arguments.
+    The clause uses {} for each value, e.g. add_condition(conditions, args, "id > {}", 10).
+    """
+    placeholders = []
+    for value in values:
+        args.append(value)
+        placeholders.append(f"${len(args)}")
+    conditions.append(clause.format(*placeholders))
+
+
+def where_clause(conditions: List[str], keyword: str = "WHERE") -> str:
+    """Join conditions into a WHERE (or AND) clause, or an empty string if there are none"""
+    if not conditions:
+        return ""
+    return f"{keyword} " + " AND ".join(conditions)
+
+
+def ids_page_size(ids: Optional[Sequence[int]], limit: int) -> int:
+    """Page size for a list request: with ids, a page holds every requested row"""
+    return len(set(ids)) if ids else limit
+
+
+def paginate(response: Response, rows: list, limit: int, key: Optional[Sequence[str]] = None) -> list:
+    """
+    Trim a page fetched with LIMIT limit + 1 and set the next-page cursor header.
+    The cursor holds the key columns of the last row returned (defaults to id).
+    """
+    if len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    last = rows[-1]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor([last[column] for column in key or ("id",)])
+    return rows
@@ -0,0 +1,1098 @@
+"""Data access for the API: every SQL statement the application runs, by name"""
+import json
+import time
+import asyncpg
+from contextlib import asynccontextmanager
+from itertools import repeat
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from models import MAX_QUANTITY
+from pagination import add_condition, name_prefix_pattern, where_clause
+
+# Catalog tables written through the generic create/update/delete statements:
+# change table name -> (SQL table, writable columns)
+ENTITIES = {
+    "items": ("galactic_items", ("name", "description", "item_type_id")),
+    "item_types": ("galactic_item_types", ("name", "description")),
+    "planets": ("galactic_planets", ("name", "description")),
+    "stations": ("galactic_stations", ("name", "description")),
+}
+
+ITEM_COLUMNS = """
+    i.id,
+    i.name,
+    i.description,
+    i.item_type_id,
+    it.name as item_type_name
+"""
+
+ITEM_FROM = """
+    FROM galactic_items i
+    LEFT JOIN galactic_item_types it ON i.item_type_id = it.id
+"""
+
+# Inventory entry columns (matching InventoryItemDetail) and the joins that produce them,
+# shared by every query that returns station inventory
+STATION_INVENTORY_COLUMNS = """
+    si.id as inventory_id,
+    si.quantity,
+    i.id as item_id,
+    i.name as item_name,
+    i.description as item_description,
+    it.name as item_type_name
+"""
+
+STATION_INVENTORY_FROM = """
+    FROM galactic_stations_inventory si
+    JOIN galactic_items i ON si.galactic_item_id = i.id
+    LEFT JOIN galactic_item_types it ON i.item_type_id = it.id
+"""
+
+# Per-item totals across stations and planets (matching ItemTotal), zero for items held nowhere
+ITEM_TOTALS_COLUMNS = """
+    i.id as item_id,
+    i.name as item_name,
+    i.item_type_id,
+    COALESCE(t.stations, 0) as stations,
+    COALESCE(t.station_quantity, 0) as station_quantity,
+    COALESCE(t.planets, 0) as planets,
+    COALESCE(t.planet_quantity, 0) as planet_quantity,
+    COALESCE(t.station_quantity + t.planet_quantity, 0) as quantity
+"""
+
+ITEM_TOTALS_FROM = """
+    FROM galactic_items i
+    LEFT JOIN galactic_item_totals t ON t.galactic_item_id = i.id
+"""
+
+
+def record_change_sql(
+    table: str,
+    op: str,
+    id_column: Optional[str] = "id",
+    scope: Optional[str] = None,
+    count: Optional[str] = None
+) -> str:
+    """
+    SQL expression recording a write in the statement that makes it: bumps the versions of
+    table (and table:scope) and notifies every worker, returning the new versions as jsonb.
+    id_column names the written row's id in the statement's FROM list; scope and count
+    (rows written, for writes without a single id) are SQL expressions such as a parameter.
+    """
+    keys = f"ARRAY['{table}']" if scope is None else f"ARRAY['{table}', '{table}:' || {scope}]"
+    details = f"'table', '{table}', 'op', '{op}'"
+    if id_column is not None:
+        details += f", 'id', {id_column}"
+    if scope is not None:
+        details += f", 'scope', {scope}"
+    if count is not None:
+        details += f", 'count', {count}"
+    return f"galactic_record_change({keys}, jsonb_build_object({details}))"
+
+
+def _adjust_inventory_statement(location_table: str, inventory_table: str, location_column: str, table: str) -> str:
+    """
+    Change the quantity of an item at a station or planet by $3 in one statement: a positive
+    delta is an upsert that creates the entry if needed, and a negative one a plain update of
+    an existing entry that is skipped if it would go below zero (an upsert could re-create an
+    entry deleted meanwhile). The result always has location_found and item_found; the entry
+    columns are null unless the adjustment was made.
+    """
+    return f"""
+        WITH location AS (
+            SELECT EXISTS(SELECT 1 FROM {location_table} WHERE id = $1) as found
+        ), item AS (
+            SELECT EXISTS(SELECT 1 FROM galactic_items WHERE id = $2) as found
+        ), incremented AS (
+            INSERT INTO {inventory_table} AS inv ({location_column}, galactic_item_id, quantity)
+            SELECT $1, $2, $3::int
+            WHERE $3 >= 0
+              AND (SELECT found FROM location)
+              AND (SELECT found FROM item)
+            ON CONFLICT ({location_column}, galactic_item_id)
+            DO UPDATE SET quantity = inv.quantity + $3
+            RETURNING inv.id, inv.{location_column}, inv.galactic_item_id, inv.quantity
+        ), decremented AS (
+            UPDATE {inventory_table} inv
+            SET quantity = inv.quantity + $3
+            WHERE $3 < 0
+              AND inv.{location_column} = $1
+              AND inv.galactic_item_id = $2
+              AND inv.quantity + $3 >= 0
+            RETURNING inv.id, inv.{location_column}, inv.galactic_item_id, inv.quantity
+        ), adjusted AS (
+            SELECT * FROM incremented
+            UNION ALL
+            SELECT * FROM decremented
+        )
+        SELECT
+            location.found as location_found,
+            item.found as item_found,
+            adjusted.*,
+            CASE WHEN adjusted.id IS NOT NULL
+                THEN {record_change_sql(table, "adjust", "adjusted.id", "$1::int")}
+            END as versions
+        FROM location
+        CROSS JOIN item
+        LEFT JOIN adjusted ON true
+    """
+
+
+# Catalog tables GET /search reads (search vectors and trigram indexes from migrations 0010
+# and 0011), by the kind of hit each gives
+SEARCH_SOURCES = {
+    "item": "galactic_items",
+    "item_type": "galactic_item_types",
+    "station": "galactic_stations",
+    "planet": "galactic_planets",
+}
+
+
+def _search_sql(kinds: Sequence[str]) -> str:
+    """
+    Hits for query $1 across the catalog tables of the given kinds, as one query: rows whose
+    name or description has the query's words (websearch syntax: "quoted phrases", or, -not),
+    and rows whose name is similar to the query by trigrams, for typos and partial words.
+    rank adds the full-text rank (names weigh more than descriptions) to the name's word
+    similarity, so hits matching both ways come first. Leaves {where} and {limit} for _page.
+    """
+    branches = [
+        f"""
+            SELECT '{kind}' as kind, c.id, c.name, c.description,
+                (
+                    ts_rank(c.search_vector, websearch_to_tsquery('english', $1)) + word_similarity($1, c.name)
+                )::real as rank
+            FROM {table} c
+            WHERE c.search_vector @@ websearch_to_tsquery('english', $1) OR $1 <% c.name
+        """
+        for kind, table in SEARCH_SOURCES.items()
+        if kind in kinds
+    ]
+    return f"""
+        SELECT kind, id, name, description, rank
+        FROM ({"UNION ALL".join(branches)}) hits
+        {{where}}
+        ORDER BY rank DESC, kind, id
+        LIMIT {{limit}}
+    """
+
+
+# Inventory locations a transfer moves between:
+# kind -> (location table, inventory table, location column, change table)
+TRANSFER_LOCATIONS = {
+    "station": ("galactic_stations", "galactic_stations_inventory", "galactic_station_id", "station_inventory"),
+    "planet": ("galactic_planets", "galactic_planets_inventory", "galactic_planet_id", "planet_inventory"),
+}
+
+# Source entries a transfer moves, by how they are chosen ($3)
+TRANSFER_SELECTIONS = {
+    "item_ids": "s.galactic_item_id = ANY($3::int[])",
+    "inventory_ids": "s.id = ANY($3::int[])",
+    "item_type_id": "s.galactic_item_id IN (SELECT id FROM galactic_items WHERE item_type_id = $3)",
+}
+
+# Advisory lock class per location kind; a transfer locks both its locations, in key order
+TRANSFER_LOCK_CLASSES = {
+    "station": 0x67737461,  # "gsta"
+    "planet": 0x67706c61,  # "gpla"
+}
+
+# How long a transfer waits for another transfer or a locked entry before giving up
+TRANSFER_LOCK_TIMEOUT = "5s"
+
+# Entries a transfer moves per transaction, so its locks are held for tens of milliseconds
+TRANSFER_CHUNK_SIZE = 2000
+
+
+class TransferInterrupted(Exception):
+    """A transfer stopped on an error (its __cause__) after committing the chunks in result"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(f"Transfer stopped after moving {result['entries']} entries")
+        self.result = result
+
+
+def _transfer_sql(source: str, target: str, selection: str) -> str:
+    """
+    Move up to $4 whole entries from location $1 of kind source to location $2 of kind target
+    in one statement: the entries are deleted from the source, and their quantities added to
+    the target's entries for the same items (created if needed). Nothing moves unless the
+    target exists. Returns one row: whether each location exists, how many entries and units
+    moved, the moved items as jsonb, and the versions of both inventories if anything moved.
+    """
+    source_locations, source_inventory, source_column, source_table = TRANSFER_LOCATIONS[source]
+    target_locations, target_inventory, target_column, target_table = TRANSFER_LOCATIONS[target]
+    return f"""
+        WITH source AS (
+            SELECT EXISTS(SELECT 1 FROM {source_locations} WHERE id = $1) as found
+        ), target AS (
+            SELECT EXISTS(SELECT 1 FROM {target_locations} WHERE id = $2) as found
+        ), taken AS (
+            DELETE FROM {source_inventory}
+            WHERE id IN (
+                SELECT s.id
+                FROM {source_inventory} s
+                WHERE s.{source_column} = $1
+                  AND s.galactic_item_id IS NOT NULL
+                  AND {TRANSFER_SELECTIONS[selection]}
+                  AND (SELECT found FROM target)
+                LIMIT $4
+                FOR UPDATE
+            )
+            RETURNING id, galactic_item_id, quantity
+        ), added AS (
+            INSERT INTO {target_inventory} AS t ({target_column}, galactic_item_id, quantity)
+            SELECT $2, galactic_item_id, quantity
+            FROM taken
+            ORDER BY galactic_item_id
+            ON CONFLICT ({target_column}, galactic_item_id)
+            DO UPDATE SET quantity = t.quantity + EXCLUDED.quantity
+            RETURNING t.id, t.galactic_item_id, t.quantity
+        ), summary AS (
+            SELECT count(*) as entries, COALESCE(sum(quantity), 0) as quantity FROM taken
+        )
+        SELECT
+            source.found as source_found,
+            target.found as target_found,
+            summary.entries,
+            summary.quantity,
+            COALESCE((
+                SELECT jsonb_agg(jsonb_build_object(
+                    'item_id', taken.galactic_item_id,
+                    'quantity', taken.quantity,
+                    'source_inventory_id', taken.id,
+                    'target_inventory_id', added.id,
+                    'target_quantity', added.quantity
+                ) ORDER BY taken.galactic_item_id)
+                FROM taken
+                JOIN added USING (galactic_item_id)
+            ), '[]') as moved,
+            CASE WHEN summary.entries > 0
+                THEN {record_change_sql(source_table, "transfer", None, "$1::int", "summary.entries")}
+            END as source_versions,
+            CASE WHEN summary.entries > 0
+                THEN {record_change_sql(target_table, "transfer", None, "$2::int", "summary.entries")}
+            END as target_versions
+        FROM source, target, summary
+    """
+
+
+def _entity_statements() -> Dict[str, str]:
+    statements = {}
+    for entity, (table, columns) in ENTITIES.items():
+        column_list = ", ".join(columns)
+        returning = f"id, {column_list}"
+        placeholders = ", ".join(f"${n}" for n in range(1, len(columns) + 1))
+        assignments = ", ".join(f"{column} = ${n}" for n, column in enumerate(columns, start=1))
+        statements[f"{entity}.get"] = f"SELECT {returning} FROM {table} WHERE id = $1"
+        statements[f"{entity}.create"] = f"""
+            WITH created AS (
+                INSERT INTO {table} ({column_list})
+                VALUES ({placeholders})
+                RETURNING {returning}
+            )
+            SELECT created.*, {record_change_sql(entity, "insert")} as versions
+            FROM created
+        """
+        statements[f"{entity}.update"] = f"""
+            WITH updated AS (
+                UPDATE {table}
+                SET {assignments}
+                WHERE id = ${len(columns) + 1}
+                RETURNING {returning}
+            )
+            SELECT updated.*, {record_change_sql(entity, "update")} as versions
+            FROM updated
+        """
+        statements[f"{entity}.delete"] = f"""
+            WITH deleted AS (
+                DELETE FROM {table} WHERE id = $1 RETURNING id
+            )
+            SELECT deleted.id, {record_change_sql(entity, "delete")} as versions
+            FROM deleted
+        """
+    return statements
+
+
+STATEMENTS: Dict[str, str] = {
+    **_entity_statements(),
+    "items.get": f"SELECT {ITEM_COLUMNS} {ITEM_FROM} WHERE i.id = $1",
+    "items.search": f"""
+        SELECT {ITEM_COLUMNS}
+        {ITEM_FROM}
+        WHERE lower(i.name) LIKE $1
+          AND ($3::int IS NULL OR i.item_type_id = $3)
+        ORDER BY lower(i.name) = lower($2) DESC, length(i.name), lower(i.name), i.id
+        LIMIT $4
+    """,
+    "items.stations_for_items": """
+        SELECT DISTINCT
+            si.galactic_item_id as item_id,
+            s.id,
+            s.name,
+            s.description
+        FROM galactic_stations_inventory si
+        JOIN galactic_stations s ON si.galactic_station_id = s.id
+        WHERE si.galactic_item_id = ANY($1::int[]) AND si.quantity > 0
+        ORDER BY si.galactic_item_id, s.name, s.id
+    """,
+    "items.stations": """
+        SELECT s.id, s.name, s.description
+        FROM galactic_stations s
+        JOIN (
+            SELECT DISTINCT galactic_station_id
+            FROM galactic_stations_inventory
+            WHERE galactic_item_id = $1 AND quantity > 0
+        ) si ON si.galactic_station_id = s.id
+        ORDER BY s.name, s.id
+    """,
+    "station_inventory.adjust": _adjust_inventory_statement(
+        "galactic_stations", "galactic_stations_inventory", "galactic_station_id", "station_inventory"
+    ),
+    "station_inventory.remove": f"""
+        WITH deleted AS (
+            DELETE FROM galactic_stations_inventory
+            WHERE id = $1 AND galactic_station_id = $2
+            RETURNING id
+        )
+        SELECT deleted.id, {record_change_sql("station_inventory", "delete", scope="$2::int")} as versions
+        FROM deleted
+    """,
+    "station_inventory.get": f"""
+        SELECT {STATION_INVENTORY_COLUMNS}
+        {STATION_INVENTORY_FROM}
+        WHERE si.id = $1
+    """,
+    "station_inventory.export": f"""
+        SELECT si.galactic_station_id as station_id, {STATION_INVENTORY_COLUMNS}
+        {STATION_INVENTORY_FROM}
+    """,
+    "planet_inventory.add": f"""
+        WITH inserted AS (
+            INSERT INTO galactic_planets_inventory (galactic_planet_id)
+            SELECT id FROM galactic_planets WHERE id = $1
+            RETURNING id, galactic_planet_id, galactic_item_id, quantity
+        )
+        SELECT inserted.*, {record_change_sql("planet_inventory", "insert", scope="$1::int")} as versions
+        FROM inserted
+    """,
+    "planet_inventory.get": """
+        SELECT id, galactic_planet_id, galactic_item_id, quantity
+        FROM galactic_planets_inventory
+        WHERE id = $1
+    """,
+    "planet_inventory.adjust": _adjust_inventory_statement(
+        "galactic_planets", "galactic_planets_inventory", "galactic_planet_id", "planet_inventory"
+    ),
+    "planet_inventory.remove": f"""
+        WITH deleted AS (
+            DELETE FROM galactic_planets_inventory
+            WHERE id = $1 AND galactic_planet_id = $2
+            RETURNING id
+        )
+        SELECT deleted.id, {record_change_sql("planet_inventory", "delete", scope="$2::int")} as versions
+        FROM deleted
+    """,
+    # Reports read the totals that triggers keep (migration 0009), never the inventory itself.
+    # A station that exists has one row, with null totals if it holds nothing.
+    "reports.station_item_types": """
+        SELECT t.item_type_id, it.name as item_type_name, t.items, t.quantity
+        FROM galactic_stations s
+        LEFT JOIN galactic_station_item_type_totals t ON t.galactic_station_id = s.id
+        LEFT JOIN galactic_item_types it ON it.id = t.item_type_id
+        WHERE s.id = $1
+        ORDER BY t.item_type_id NULLS FIRST
+    """,
+    "reports.item": f"SELECT {ITEM_TOTALS_COLUMNS} {ITEM_TOTALS_FROM} WHERE i.id = $1",
+    "reports.rebuild": "SELECT galactic_rebuild_inventory_totals()",
+    # Takes the advisory locks of a transfer's two locations ($1, $2 and $3, $4, in key order)
+    # with lock_timeout $5 for the rest of the transaction
+    "inventory.transfer_lock": """
+        SELECT
+            set_config('lock_timeout', $5, true),
+            pg_advisory_xact_lock($1, $2),
+            pg_advisory_xact_lock($3, $4)
+    """,
+    "ping": "SELECT 1",
+    "versions.get": "SELECT key, version FROM galactic_versions WHERE key = ANY($1::text[])",
+    # WAL position on the primary, and how far a streaming replica has replayed (null on a primary)
+    "replication.wal_lsn": "SELECT pg_current_wal_lsn()::text as lsn",
+    "replication.replay_status": """
+        SELECT
+            pg_last_wal_replay_lsn()::text as replay_lsn,
+            extract(epoch from now() - pg_last_xact_replay_timestamp())::float8 as replay_age
+    """,
+    # Bulk imports read session temp tables that only exist once an import has run,
+    # so they are prepared on first use rather than when the connection opens
+    "import.items": """
+        WITH checked AS (
+            SELECT
+                st.*,
+                CASE
+                    WHEN st.item_type_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM galactic_item_types it WHERE it.id = st.item_type_id
+                    ) THEN 'Item type not found'
+                    WHEN EXISTS (
+                        SELECT 1 FROM galactic_items i WHERE lower(i.name) = lower(st.name)
+                    ) THEN 'An item with this name already exists'
+                    WHEN row_number() OVER (PARTITION BY lower(st.name) ORDER BY st.row_number) > 1
+                        THEN 'Duplicate name earlier in this import'
+                END as error
+            FROM galactic_items_staging st
+        ), proceed AS (
+            SELECT NOT ($1 AND EXISTS (SELECT 1 FROM checked WHERE error IS NOT NULL)) as ok
+        ), inserted AS (
+            INSERT INTO galactic_items (name, description, item_type_id)
+            SELECT name, description, item_type_id
+            FROM checked
+            WHERE error IS NULL AND (SELECT ok FROM proceed)
+            ORDER BY row_number
+            ON CONFLICT DO NOTHING
+            RETURNING lower(name) as lower_name
+        ), summary AS (
+            SELECT count(*) as inserted FROM inserted
+        )
+        SELECT
+            summary.inserted,
+            (
+                SELECT json_agg(json_build_object(
+                    'row', c.row_number,
+                    'error', COALESCE(c.error, 'An item with this name already exists')
+                ))
+                FROM checked c
+                WHERE c.error IS NOT NULL
+                   OR ((SELECT ok FROM proceed)
+                       AND NOT EXISTS (SELECT 1 FROM inserted WHERE inserted.lower_name = lower(c.name)))
+            ) as rejected,
+            CASE WHEN summary.inserted > 0
+                THEN galactic_record_change(
+                    ARRAY['items'],
+                    jsonb_build_object('table', 'items', 'op', 'insert', 'count', summary.inserted)
+                )
+            END as versions
+        FROM summary
+    """,
+    "import.station_inventory": f"""
+        WITH station AS (
+            SELECT EXISTS(SELECT 1 FROM galactic_stations WHERE id = $1) as found
+        ), checked AS (
+            SELECT
+                st.*,
+                EXISTS (SELECT 1 FROM galactic_items i WHERE i.id = st.galactic_item_id) as valid
+            FROM galactic_stations_inventory_staging st
+        ), grouped AS (
+            SELECT galactic_item_id, sum(quantity) as quantity, min(row_number) as first_row
+            FROM checked
+            WHERE valid
+            GROUP BY galactic_item_id
+        ), overflowing AS (
+            SELECT g.galactic_item_id
+            FROM grouped g
+            WHERE g.quantity + COALESCE((
+                SELECT si.quantity
+                FROM galactic_stations_inventory si
+                WHERE si.galactic_station_id = $1 AND si.galactic_item_id = g.galactic_item_id
+            ), 0) > {MAX_QUANTITY}
+        ), upserted AS (
+            INSERT INTO galactic_stations_inventory AS si (galactic_station_id, galactic_item_id, quantity)
+            SELECT $1, galactic_item_id, quantity
+            FROM grouped
+            WHERE galactic_item_id NOT IN (SELECT galactic_item_id FROM overflowing)
+              AND (SELECT found FROM station)
+              AND NOT ($2 AND (EXISTS (SELECT 1 FROM checked WHERE NOT valid) OR EXISTS (SELECT 1 FROM overflowing)))
+            ORDER BY first_row
+            ON CONFLICT (galactic_station_id, galactic_item_id)
+            DO UPDATE SET quantity = si.quantity + EXCLUDED.quantity
+            RETURNING si.id
+        ), summary AS (
+            SELECT CASE
+                WHEN EXISTS (SELECT 1 FROM upserted) THEN (
+                    SELECT count(*)
+                    FROM checked
+                    WHERE valid AND galactic_item_id NOT IN (SELECT galactic_item_id FROM overflowing)
+                )
+                ELSE 0
+            END as inserted
+        )
+        SELECT
+            (SELECT found FROM station) as station_found,
+            summary.inserted,
+            ARRAY(SELECT row_number FROM checked WHERE NOT valid ORDER BY row_number) as invalid_rows,
+            ARRAY(
+                SELECT row_number
+                FROM checked
+                WHERE valid AND galactic_item_id IN (SELECT galactic_item_id FROM overflowing)
+                ORDER BY row_number
+            ) as overflow_rows,
+            CASE WHEN summary.inserted > 0
+                THEN galactic_record_change(
+                    ARRAY['station_inventory', 'station_inventory:' || $1::int],
+                    jsonb_build_object(
+                        'table', 'station_inventory', 'op', 'insert', 'count', summary.inserted, 'scope', $1::int
+                    )
+                )
+            END as versions
+        FROM summary
+    """,
+}
+
+# Staging tables for bulk imports, emptied before each COPY: ON COMMIT DELETE ROWS only clears
+# them at the top-level commit, and a transactional batch runs several imports in one transaction
+STAGING_TABLES = {
+    "galactic_items_staging": """
+        CREATE TEMP TABLE IF NOT EXISTS galactic_items_staging (
+            row_number integer NOT NULL,
+            name character varying(255) NOT NULL,
+            description text,
+            item_type_id integer
+        ) ON COMMIT DELETE ROWS;
+        TRUNCATE galactic_items_staging
+    """,
+    "galactic_stations_inventory_staging": """
+        CREATE TEMP TABLE IF NOT EXISTS galactic_stations_inventory_staging (
+            row_number integer NOT NULL,
+            galactic_item_id integer NOT NULL,
+            quantity integer NOT NULL
+        ) ON COMMIT DELETE ROWS;
+        TRUNCATE galactic_stations_inventory_staging
+    """,
+}
+
+
+class GalacticConnection(asyncpg.Connection):
+    """Connection that can fill its statement cache ahead of the first query"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # time.monotonic() when the connection was opened, for lifetime-based recycling
+        self.opened_at = time.monotonic()
+
+    async def prepare_cached(self, query: str):
+        """
+        Prepare a statement into this connection's statement cache, where fetch() and friends
+        find it by its text. Unlike prepare(), the statement outlives pool release.
+        """
+        await self._prepare(query, use_cache=True)
+
+
+async def init_connection(conn: GalacticConnection, prepare: bool = True):
+    """
+    Set up a new connection: decode json/jsonb columns to Python values and, with prepare,
+    prepare every named statement up front so requests never pay for parsing and planning.
+    """
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(typename, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    if prepare:
+        for name, sql in STATEMENTS.items():
+            if not name.startswith("import."):
+                await conn.prepare_cached(sql)
+
+
+class Repository:
+    """
+    The queries the API runs, bound to one acquired connection so a request can run several
+    of them without going back to the pool. Writes record their change (version bump and
+    notification) in the same statement; on_change is then called with the new versions,
+    or after commit when the write ran inside transaction(). on_statement, if given, is called
+    after each named statement with its name, sql, arguments, duration in seconds and row count
+    (None if it raised).
+    """
+
+    def __init__(
+        self,
+        conn: GalacticConnection,
+        on_change: Optional[Callable[[str, Dict[str, int]], None]] = None,
+        on_statement: Optional[Callable[[str, str, Sequence[Any], float, Optional[int]], None]] = None
+    ):
+        self.conn = conn
+        self._on_change = on_change
+        self._on_statement = on_statement
+        self._pending_changes: List[Tuple[str, Dict[str, int]]] = []
+
+    @asynccontextmanager
+    async def transaction(self, **options: Any) -> AsyncIterator[None]:
+        """Run the enclosed operations in a transaction (options as for Connection.transaction)"""
+        try:
+            async with self.conn.transaction(**options):
+                yield
+        except BaseException:
+            if not self.conn.is_in_transaction():
+                self._pending_changes.clear()
+            raise
+        if not self.conn.is_in_transaction():
+            pending, self._pending_changes = self._pending_changes, []
+            for table, versions in pending:
+                self._changed(table, versions)
+
+    async def fetch(self, name: str, *args: Any, sql: Optional[str] = None) -> List[asyncpg.Record]:
+        """
+        Run a named statement (or a variant with its own sql) and return all rows.
+        Statements live in the connection's statement cache, which re-prepares them
+        after schema changes.
+        """
+        return await self._run(name, self.conn.fetch, sql, args)
+
+    async def fetchrow(self, name: str, *args: Any, sql: Optional[str] = None) -> Optional[asyncpg.Record]:
+        return await self._run(name, self.conn.fetchrow, sql, args)
+
+    async def _run(self, name: str, method: Callable, sql: Optional[str], args: Sequence[Any]):
+        sql = sql or STATEMENTS[name]
+        if self._on_statement is None:
+            return await method(sql, *args)
+        start = time.perf_counter()
+        try:
+            result = await method(sql, *args)
+        except BaseException:
+            self._on_statement(name, sql, args, time.perf_counter() - start, None)
+            raise
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        self._on_statement(name, sql, args, time.perf_counter() - start, rows)
+        return result
+
+    def _changed(self, table: str, versions: Optional[Dict[str, int]]):
+        if versions is None or self._on_change is None:
+            return
+        if self.conn.is_in_transaction():
+            self._pending_changes.append((table, versions))
+        else:
+            self._on_change(table, versions)
+
+    async def _write(self, table: str, name: str, *args: Any) -> Optional[Dict[str, Any]]:
+        """Run a write statement that returns a versions column, returning the row without it"""
+        row = await self.fetchrow(name, *args)
+        if row is None:
+            return None
+        result = dict(row)
+        self._changed(table, result.pop("versions"))
+        return result
+
+    async def _page(self, name: str, template: str, conditions: List[str], args: List[Any], limit: int):
+        """
+        Fetch limit + 1 rows from a list query. Each combination of filters is its own
+        statement text, prepared on first use and then served from the statement cache.
+        """
+        args.append(limit + 1)
+        sql = template.format(where=where_clause(conditions), limit=f"${len(args)}")
+        return await self.fetch(name, *args, sql=sql)
+
+    # Catalog entities
+
+    async def get(self, entity: str, entity_id: int) -> Optional[asyncpg.Record]:
+        """Get one row of a catalog entity (items come with their type name)"""
+        return await self.fetchrow(f"{entity}.get", entity_id)
+
+    async def create(self, entity: str, *values: Any) -> Dict[str, Any]:
+        """Insert a catalog row from values in ENTITIES column order"""
+        return await self._write(entity, f"{entity}.create", *values)
+
+    async def update(self, entity: str, entity_id: int, *values: Any) -> Optional[Dict[str, Any]]:
+        """Update a catalog row, returning None if it does not exist"""
+        return await self._write(entity, f"{entity}.update", *values, entity_id)
+
+    async def delete(self, entity: str, entity_id: int) -> bool:
+        """Delete a catalog row, returning whether it existed"""
+        return await self._write(entity, f"{entity}.delete", entity_id) is not None
+
+    # Items
+
+    async def list_items(
+        self,
+        limit: int,
+        after_id: Optional[int] = None,
+        item_type_id: Optional[int] = None,
+        name: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        if ids:
+            add_condition(conditions, args, "i.id = ANY({}::int[])", list(ids))
+        if after_id is not None:
+            add_condition(conditions, args, "i.id > {}", after_id)
+        if item_type_id is not None:
+            add_condition(conditions, args, "i.item_type_id = {}", item_type_id)
+        if name is not None:
+            add_condition(conditions, args, "lower(i.name) = lower({})", name)
+        if name_prefix is not None:
+            add_condition(conditions, args, "lower(i.name) LIKE {}", name_prefix_pattern(name_prefix))
+        return await self._page(
+            "items.list",
+            f"SELECT {ITEM_COLUMNS} {ITEM_FROM} {{where}} ORDER BY i.id LIMIT {{limit}}",
+            conditions, args, limit
+        )
+
+    async def search_items(self, prefix: str, limit: int, item_type_id: Optional[int] = None) -> List[asyncpg.Record]:
+        return await self.fetch("items.search", name_prefix_pattern(prefix), prefix, item_type_id, limit)
+
+    async def stations_for_items(self, item_ids: Sequence[int]) -> List[asyncpg.Record]:
+        return await self.fetch("items.stations_for_items", list(item_ids))
+
+    async def item_stations(self, item_id: int) -> List[asyncpg.Record]:
+        return await self.fetch("items.stations", item_id)
+
+    async def import_items(self, rows: Sequence[Tuple[int, str, Optional[str], Optional[int]]], atomic: bool):
+        """
+        Copy (row, name, description, item_type_id) tuples into the staging table and insert
+        the valid ones in one statement. Returns (inserted, rejected rows).
+        """
+        async with self.transaction():
+            await self.conn.execute(STAGING_TABLES["galactic_items_staging"])
+            await self.conn.copy_records_to_table(
+                "galactic_items_staging",
+                records=rows,
+                columns=["row_number", "name", "description", "item_type_id"]
+            )
+            result = await self._write("items", "import.items", atomic)
+        return result["inserted"], result["rejected"] or []
+
+    # Item types, planets and stations
+
+    async def list_item_types(
+        self,
+        limit: int,
+        after: Optional[Tuple[str, int]] = None,
+        name_prefix: Optional[str] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        if ids:
+            add_condition(conditions, args, "id = ANY({}::int[])", list(ids))
+        if after is not None:
+            add_condition(conditions, args, "(name, id) > ({}, {})", *after)
+        if name_prefix is not None:
+            add_condition(conditions, args, "lower(name) LIKE {}", name_prefix_pattern(name_prefix))
+        return await self._page(
+            "item_types.list",
+            "SELECT id, name, description FROM galactic_item_types {where} ORDER BY name, id LIMIT {limit}",
+            conditions, args, limit
+        )
+
+    async def list_planets(
+        self,
+        limit: int,
+        after_id: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        if ids:
+            add_condition(conditions, args, "id = ANY({}::int[])", list(ids))
+        if after_id is not None:
+            add_condition(conditions, args, "id > {}", after_id)
+        if name_prefix is not None:
+            add_condition(conditions, args, "lower(name) LIKE {}", name_prefix_pattern(name_prefix))
+        return await self._page(
+            "planets.list",
+            "SELECT id, name, description FROM galactic_planets {where} ORDER BY id LIMIT {limit}",
+            conditions, args, limit
+        )
+
+    async def list_stations(
+        self,
+        limit: int,
+        after_id: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        if ids:
+            add_condition(conditions, args, "s.id = ANY({}::int[])", list(ids))
+        if after_id is not None:
+            add_condition(conditions, args, "s.id > {}", after_id)
+        if name_prefix is not None:
+            add_condition(conditions, args, "lower(s.name) LIKE {}", name_prefix_pattern(name_prefix))
+        return await self._page(
+            "stations.list",
+            "SELECT s.id, s.name, s.description FROM galactic_stations s {where} ORDER BY s.id LIMIT {limit}",
+            conditions, args, limit
+        )
+
+    async def list_stations_with_inventory(
+        self,
+        limit: int,
+        after_id: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+        item_types: Optional[List[str]] = None,
+        include_untyped: bool = True,
+        inventory_limit: Optional[int] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        """A page of stations, each with its (optionally filtered and capped) inventory as a list"""
+        conditions, args = [], [item_types, include_untyped, inventory_limit]
+        if ids:
+            add_condition(conditions, args, "s.id = ANY({}::int[])", list(ids))
+        if after_id is not None:
+            add_condition(conditions, args, "s.id > {}", after_id)
+        if name_prefix is not None:
+            add_condition(conditions, args, "lower(s.name) LIKE {}", name_prefix_pattern(name_prefix))
+        return await self._page(
+            "stations.list_with_inventory",
+            f"""
+            SELECT
+                s.id,
+                s.name,
+                s.description,
+                COALESCE(inv.entries, '[]'::json) as inventory
+            FROM galactic_stations s
+            LEFT JOIN LATERAL (
+                SELECT json_agg(entry ORDER BY entry.inventory_id) as entries
+                FROM (
+                    SELECT {STATION_INVENTORY_COLUMNS}
+                    {STATION_INVENTORY_FROM}
+                    WHERE si.galactic_station_id = s.id
+                      AND (
+                          (it.name IS NULL AND $2)
+                          OR (it.name IS NOT NULL AND ($1::text[] IS NULL OR it.name = ANY($1::text[])))
+                      )
+                    ORDER BY si.id
+                    LIMIT $3
+                ) entry
+            ) inv ON true
+            {{where}}
+            ORDER BY s.id
+            LIMIT {{limit}}
+            """,
+            conditions, args, limit
+        )
+
+    # Station inventory
+
+    async def list_station_inventory(
+        self,
+        station_id: int,
+        limit: int,
+        after_id: Optional[int] = None,
+        item_id: Optional[int] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        add_condition(conditions, args, "si.galactic_station_id = {}", station_id)
+        if after_id is not None:
+            add_condition(conditions, args, "si.id > {}", after_id)
+        if item_id is not None:
+            add_condition(conditions, args, "si.galactic_item_id = {}", item_id)
+        return await self._page(
+            "station_inventory.list",
+            f"SELECT {STATION_INVENTORY_COLUMNS} {STATION_INVENTORY_FROM} {{where}} ORDER BY si.id LIMIT {{limit}}",
+            conditions, args, limit
+        )
+
+    async def adjust_station_inventory(self, station_id: int, item_id: int, delta: int) -> Dict[str, Any]:
+        """
+        Add delta (possibly negative) to the quantity of an item at a station in one statement.
+        The result always has location_found and item_found; the entry columns are null
+        if either is missing or the quantity would go below zero.
+        """
+        return await self._write("station_inventory", "station_inventory.adjust", station_id, item_id, delta)
+
+    async def remove_station_inventory(self, station_id: int, inventory_id: int) -> bool:
+        return await self._write("station_inventory", "station_inventory.remove", inventory_id, station_id) is not None
+
+    async def import_station_inventory(self, station_id: int, rows: Sequence[Tuple[int, int, int]], atomic: bool):
+        """
+        Copy (row, galactic_item_id, quantity) tuples into the staging table and add the rows
+        naming existing items to the station's quantities in one statement. Rows of an item
+        whose quantity would pass MAX_QUANTITY are not applied.
+        Returns (station found, rows applied, rows naming unknown items, rows that would overflow).
+        """
+        async with self.transaction():
+            await self.conn.execute(STAGING_TABLES["galactic_stations_inventory_staging"])
+            if rows:
+                await self.conn.copy_records_to_table(
+                    "galactic_stations_inventory_staging",
+                    records=rows,
+                    columns=["row_number", "galactic_item_id", "quantity"]
+                )
+            result = await self._write("station_inventory", "import.station_inventory", station_id, atomic)
+        return result["station_found"], result["inserted"], result["invalid_rows"], result["overflow_rows"]
+
+    async def get_station_inventory_entry(self, inventory_id: int) -> Optional[asyncpg.Record]:
+        """One station inventory entry with its item details (as in list_station_inventory)"""
+        return await self.fetchrow("station_inventory.get", inventory_id)
+
+    def export_station_inventory(self) -> asyncpg.cursor.CursorFactory:
+        """Cursor over every station inventory entry; open and read it inside a transaction"""
+        return self.conn.cursor(STATEMENTS["station_inventory.export"])
+
+    # Planet inventory
+
+    async def list_planet_inventory(
+        self,
+        planet_id: int,
+        limit: int,
+        after_id: Optional[int] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        add_condition(conditions, args, "galactic_planet_id = {}", planet_id)
+        if after_id is not None:
+            add_condition(conditions, args, "id > {}", after_id)
+        return await self._page(
+            "planet_inventory.list",
+            """
+            SELECT id, galactic_planet_id, galactic_item_id, quantity
+            FROM galactic_planets_inventory
+            {where}
+            ORDER BY id
+            LIMIT {limit}
+            """,
+            conditions, args, limit
+        )
+
+    async def get_planet_inventory_entry(self, inventory_id: int) -> Optional[asyncpg.Record]:
+        return await self.fetchrow("planet_inventory.get", inventory_id)
+
+    async def add_planet_inventory(self, planet_id: int) -> Optional[Dict[str, Any]]:
+        """Add an inventory entry without an item for a planet, returning None if the planet does not exist"""
+        return await self._write("planet_inventory", "planet_inventory.add", planet_id)
+
+    async def adjust_planet_inventory(self, planet_id: int, item_id: int, delta: int) -> Dict[str, Any]:
+        """Add delta to the quantity of an item on a planet; see adjust_station_inventory"""
+        return await self._write("planet_inventory", "planet_inventory.adjust", planet_id, item_id, delta)
+
+    async def remove_planet_inventory(self, planet_id: int, inventory_id: int) -> bool:
+        return await self._write("planet_inventory", "planet_inventory.remove", inventory_id, planet_id) is not None
+
+    # Transfers
+
+    async def transfer_inventory(
+        self,
+        source: Tuple[str, int],
+        target: Tuple[str, int],
+        selection: str,
+        value: Any
+    ) -> Dict[str, Any]:
+        """
+        Move the source's entries chosen by selection (a TRANSFER_SELECTIONS key) and value to
+        the target, where source and target are (kind, id), in transactions of up to
+        TRANSFER_CHUNK_SIZE entries. Each entry moves atomically, and a retry moves whatever
+        is left. Each transaction locks both locations first, in key order, so opposite
+        transfers between the same locations queue instead of deadlocking.
+        Returns source_found, target_found, entries, quantity and moved (one dict per item).
+        Raises TransferInterrupted, with what already moved, from the error that stopped it
+        (asyncpg.LockNotAvailableError after TRANSFER_LOCK_TIMEOUT, or a quantity overflow).
+        """
+        locks = sorted((TRANSFER_LOCK_CLASSES[kind], location_id) for kind, location_id in (source, target))
+        sql = _transfer_sql(source[0], target[0], selection)
+        by_type = selection == "item_type_id"
+        if by_type:
+            # Every chunk takes the next entries of the type, until one comes up short
+            chunks = repeat(value)
+        else:
+            ids = sorted(set(value))
+            chunks = (ids[start:start + TRANSFER_CHUNK_SIZE] for start in range(0, len(ids), TRANSFER_CHUNK_SIZE))
+        result = {"source_found": True, "target_found": True, "entries": 0, "quantity": 0, "moved": []}
+        for chunk in chunks:
+            try:
+                async with self.transaction():
+                    await self.fetchrow("inventory.transfer_lock", *locks[0], *locks[1], TRANSFER_LOCK_TIMEOUT)
+                    row = dict(await self.fetchrow(
+                        "inventory.transfer", source[1], target[1], chunk, TRANSFER_CHUNK_SIZE, sql=sql
+                    ))
+                    self._changed(TRANSFER_LOCATIONS[source[0]][3], row["source_versions"])
+                    self._changed(TRANSFER_LOCATIONS[target[0]][3], row["target_versions"])
+            except asyncpg.PostgresError as exc:
+                raise TransferInterrupted(result) from exc
+            if not (row["source_found"] and row["target_found"]):
+                return {**result, "source_found": row["source_found"], "target_found": row["target_found"]}
+            result["entries"] += row["entries"]
+            result["quantity"] += row["quantity"]
+            result["moved"].extend(row["moved"])
+            if by_type and row["entries"] < TRANSFER_CHUNK_SIZE:
+                break
+        result["moved"].sort(key=lambda entry: entry["item_id"])
+        return result
+
+    # Search
+
+    async def search(
+        self,
+        query: str,
+        limit: int,
+        kinds: Optional[Sequence[str]] = None,
+        after: Optional[Tuple[float, str, int]] = None
+    ) -> List[asyncpg.Record]:
+        """
+        Ranked hits for query across items, item types, stations and planets (or the given
+        kinds of them), best first; after is the (rank, kind, id) of the last hit of a page
+        """
+        conditions, args = [], [query]
+        if after is not None:
+            add_condition(conditions, args, "(rank < {0} OR (rank = {0} AND (kind, id) > ({1}, {2})))", *after)
+        return await self._page("search", _search_sql(kinds or list(SEARCH_SOURCES)), conditions, args, limit)
+
+    # Reports
+
+    async def station_item_type_totals(self, station_id: int) -> Optional[List[asyncpg.Record]]:
+        """Quantity and number of items held per item type at a station, or None if it does not exist"""
+        rows = await self.fetch("reports.station_item_types", station_id)
+        if not rows:
+            return None
+        return [row for row in rows if row["items"] is not None]
+
+    async def list_item_type_station_totals(
+        self,
+        item_type_id: int,
+        limit: int,
+        after_id: Optional[int] = None
+    ) -> List[asyncpg.Record]:
+        """A page of the stations holding items of a type, with how many and how much"""
+        conditions, args = [], []
+        add_condition(conditions, args, "t.item_type_id = {}", item_type_id)
+        if after_id is not None:
+            add_condition(conditions, args, "t.galactic_station_id > {}", after_id)
+        return await self._page(
+            "reports.item_type_stations",
+            """
+            SELECT t.galactic_station_id as station_id, s.name as station_name, t.items, t.quantity
+            FROM galactic_station_item_type_totals t
+            JOIN galactic_stations s ON s.id = t.galactic_station_id
+            {where}
+            ORDER BY t.galactic_station_id
+            LIMIT {limit}
+            """,
+            conditions, args, limit
+        )
+
+    async def item_totals(self, item_id: int) -> Optional[asyncpg.Record]:
+        return await self.fetchrow("reports.item", item_id)
+
+    async def list_item_totals(
+        self,
+        limit: int,
+        after_id: Optional[int] = None,
+        item_type_id: Optional[int] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> List[asyncpg.Record]:
+        conditions, args = [], []
+        if ids:
+            add_condition(conditions, args, "i.id = ANY({}::int[])", list(ids))
+        if after_id is not None:
+            add_condition(conditions, args, "i.id > {}", after_id)
+        if item_type_id is not None:
+            add_condition(conditions, args, "i.item_type_id = {}", item_type_id)
+        return await self._page(
+            "reports.items",
+            f"SELECT {ITEM_TOTALS_COLUMNS} {ITEM_TOTALS_FROM} {{where}} ORDER BY i.id LIMIT {{limit}}",
+            conditions, args, limit
+        )
+
+    async def rebuild_inventory_totals(self):
+        """Recompute the report totals from the inventory; inventory writes wait until it commits"""
+        async with self.transaction():
+            await self.fetchrow("reports.rebuild")
+
+    # Versions and health
+
+    async def ping(self):
+        await self.fetchrow("ping")
+
+    async def versions(self, keys: Sequence[str]) -> Dict[str, int]:
+        """Stored version of each key that has one"""
+        rows = await self.fetch("versions.get", list(keys))
+        return {row["key"]: row["version"] for row in rows}
+
+    async def wal_lsn(self) -> str:
+        """The primary's current WAL position, e.g. '16/B374D848'"""
+        return (await self.fetchrow("replication.wal_lsn"))["lsn"]
+
+    async def replay_status(self) -> asyncpg.Record:
+        """replay_lsn (null unless in recovery) and replay_age, seconds since the last replayed transaction"""
+        return await self.fetchrow("replication.replay_status")
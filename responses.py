@@ -0,0 +1,42 @@
+"""Fast JSON responses for rows read from the database"""
+import time
+import asyncpg
+import orjson
+import tracing
+from fastapi import Response, status
+from typing import Any
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, asyncpg.Record):
+        return dict(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def encode_rows(content: Any) -> bytes:
+    """JSON for rows (and anything else orjson encodes); asyncpg records are encoded as objects"""
+    start = time.perf_counter()
+    body = orjson.dumps(content, default=_encode_default)
+    tracing.add_serialize(time.perf_counter() - start)
+    return body
+
+
+class RowsResponse(Response):
+    """JSON response encoded with orjson; asyncpg records are encoded as objects"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            # Already encoded, e.g. shared by coalesced requests
+            return content
+        return encode_rows(content)
+
+
+def rows_response(response: Response, content: Any) -> RowsResponse:
+    """
+    Encode database rows straight to JSON, skipping FastAPI's response_model validation.
+    For GET handlers whose rows already have exactly the response model's columns; the
+    route keeps its response_model, so the OpenAPI schema is unchanged. Headers set on
+    the handler's response parameter (ETag, next-page cursor) are carried over.
+    """
+    return RowsResponse(content, status_code=response.status_code or status.HTTP_200_OK, headers=response.headers)
@@ -0,0 +1,147 @@
+import logging
+from fastapi import APIRouter, Request, status
+from starlette.exceptions import HTTPException
+from typing import List
+from urllib.parse import urlsplit
+import orjson
+import consistency
+from database import db
+from models import BatchOperation, BatchRequest, BatchResponse, BatchResult
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+# Paths that cannot run inside a batch: streams, and batches themselves
+UNBATCHABLE_PATHS = ("/batch", "/changes", "/inventory/export")
+
+# Response headers passed back with each result (ETags only outside a transaction, whose
+# uncommitted writes they would not reflect)
+RESULT_HEADERS = ("etag", "x-next-cursor")
+
+
+class _RollBack(Exception):
+    """Raised inside the batch transaction to roll it back after an operation failed"""
+
+
+def _batchable(path: str) -> bool:
+    return not any(path == prefix or path.startswith(prefix + "/") for prefix in UNBATCHABLE_PATHS)
+
+
+async def _run_operation(request: Request, operation: BatchOperation, with_etag: bool) -> BatchResult:
+    """Run one operation through the application's routes, as if it had been sent on its own"""
+    url = urlsplit(operation.path)
+    if url.scheme or url.netloc or not _batchable(url.path):
+        return BatchResult(
+            status=status.HTTP_400_BAD_REQUEST, body={"detail": "This path cannot be used in a batch"}
+        )
+    body = b"" if operation.body is None else orjson.dumps(operation.body)
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in operation.headers.items()
+        if name.lower() not in ("content-length", "content-type")
+    ]
+    if operation.body is not None:
+        headers.append((b"content-type", b"application/json"))
+    headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": operation.method,
+        "scheme": request.scope.get("scheme", "http"),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": request.scope.get("root_path", ""),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        "app": request.app,
+        "state": request.scope.get("state", {}),
+        # Lets each route turn HTTPException and friends into responses, as for a top-level request
+        "starlette.exception_handlers": request.scope["starlette.exception_handlers"],
+    }
+    body_sent = False
+    response = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "headers": [], "body": []}
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            return {"type": "http.disconnect"}
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except HTTPException as exc:
+        # Raised outside any route (unknown path, wrong method)
+        return BatchResult(status=exc.status_code, body={"detail": exc.detail})
+    except Exception:
+        logger.exception("Batch operation %s %s failed", operation.method, operation.path)
+        return BatchResult(status=status.HTTP_500_INTERNAL_SERVER_ERROR, body={"detail": "Internal Server Error"})
+
+    result_headers = {}
+    content_type = ""
+    for name, value in response["headers"]:
+        name = name.decode("latin-1").lower()
+        if name == "content-type":
+            content_type = value.decode("latin-1")
+        elif name in RESULT_HEADERS and (with_etag or name != "etag"):
+            result_headers[name] = value.decode("latin-1")
+    raw = b"".join(response["body"])
+    if not raw:
+        result_body = None
+    elif content_type.startswith("application/json"):
+        result_body = orjson.loads(raw)
+    else:
+        result_body = raw.decode("utf-8", "replace")
+    return BatchResult(status=response["status"], body=result_body, headers=result_headers)
+
+
+@router.post("", response_model=BatchResponse)
+async def run_batch(batch: BatchRequest, request: Request):
+    """
+    Run up to 100 API operations in order on one database connection, in one round trip.
+    Each result holds the status and body the operation would have returned on its own.
+    With transaction, the operations run in one transaction: the first one answering with
+    a 4xx or 5xx status rolls every operation back, the rest are not run (424), and committed
+    is false. Without it, each operation commits on its own. Streams (/changes, /inventory/export)
+    cannot be batched.
+    """
+    state = consistency.current()
+    if state is not None:
+        # Reads must see the batch's own writes, so everything runs on the primary connection
+        state.on_primary = True
+    results: List[BatchResult] = []
+    async with db.repository() as repo:
+        with db.pinned(repo):
+            if not batch.transaction:
+                for operation in batch.operations:
+                    results.append(await _run_operation(request, operation, with_etag=True))
+                return BatchResponse(committed=True, results=results)
+            try:
+                async with repo.transaction():
+                    for operation in batch.operations:
+                        result = await _run_operation(request, operation, with_etag=False)
+                        results.append(result)
+                        if result.status >= status.HTTP_400_BAD_REQUEST:
+                            raise _RollBack()
+            except _RollBack:
+                failed = len(results) - 1
+                results += [
+                    BatchResult(
+                        status=status.HTTP_424_FAILED_DEPENDENCY,
+                        body={"detail": f"Not run: operation {failed} failed"}
+                    )
+                    for _ in batch.operations[len(results):]
+                ]
+                return BatchResponse(committed=False, results=results)
+    return BatchResponse(committed=True, results=results)
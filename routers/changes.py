@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from feed import Subscription, feed
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+FeedTable = Literal["items", "item_types", "stations", "planets", "station_inventory", "planet_inventory"]
+
+
+@router.get(
+    "",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}}
+)
+async def stream_changes(
+    table: Optional[List[FeedTable]] = Query(None),
+    station_id: Optional[List[int]] = Query(None),
+    planet_id: Optional[List[int]] = Query(None)
+):
+    """
+    Stream changes made through the API as Server-Sent Events.
+    Each `change` event carries table, op (insert, update, adjust, delete, transfer or migrate),
+    id and, for inventory, station_id or planet_id; inserts and updates also carry the row as
+    the API returns it. Bulk imports, and transfers (one event for each location), send one event
+    without an id: reload the inventory of the station or planet it names. A migrate event, also
+    without an id, means a schema migration changed every inventory response. Narrow the stream
+    to some tables, and inventory events to some stations or planets, by repeating table,
+    station_id and planet_id.
+    A `reset` event means events were lost: reload what is displayed.
+    """
+    subscription = Subscription(table, station_id, planet_id)
+    return StreamingResponse(
+        feed.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+import asyncpg
+from contextlib import AsyncExitStack
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Literal
+from models import InventoryTransfer, TransferResult
+from database import db
+from repository import TransferInterrupted
+
+router = APIRouter(prefix="/inventory", tags=["inventory"])
+
+# Rows fetched per cursor round trip and written per response chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = [
+    "station_id", "inventory_id", "quantity", "item_id", "item_name", "item_description", "item_type_name"
+]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _encode_ndjson(rows: list) -> str:
+    return "".join(json.dumps(dict(row)) + "\n" for row in rows)
+
+
+def _encode_csv(rows: list, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def _stream_station_inventory(
+    cursor: asyncpg.cursor.Cursor, export_format: str, stack: AsyncExitStack
+) -> AsyncIterator[str]:
+    """
+    Yield the rows of an open export cursor one chunk per batch, so memory stays flat
+    regardless of table size, then close its transaction and release its connection.
+    """
+    try:
+        header = export_format == "csv"
+        while True:
+            batch = await cursor.fetch(EXPORT_BATCH_SIZE)
+            if batch or header:
+                yield _encode_csv(batch, header) if export_format == "csv" else _encode_ndjson(batch)
+            header = False
+            if len(batch) < EXPORT_BATCH_SIZE:
+                return
+    finally:
+        await stack.aclose()
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}}
+)
+async def export_station_inventory(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format")
+):
+    """
+    Export every station inventory entry with item and item type names, as NDJSON or CSV.
+    Rows are streamed as they are read, in no particular order, from a read-only
+    repeatable-read transaction so the export is a consistent snapshot.
+    """
+    # Take the connection and open the cursor before the 200 is sent, so a busy pool still
+    # answers with a 503
+    stack = AsyncExitStack()
+    try:
+        repo = await stack.enter_async_context(db.repository(read_only=True))
+        await stack.enter_async_context(repo.transaction(isolation="repeatable_read", readonly=True))
+        cursor = await repo.export_station_inventory()
+    except BaseException:
+        await stack.aclose()
+        raise
+    return StreamingResponse(
+        _stream_station_inventory(cursor, export_format, stack),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="station_inventory.{export_format}"'},
+        # Also release them if the client goes away before the first chunk is read
+        background=BackgroundTask(stack.aclose)
+    )
+
+
+@router.post("/transfers", response_model=TransferResult)
+async def transfer_inventory(transfer: InventoryTransfer):
+    """
+    Move inventory entries between any two stations or planets, choosing them by item_ids,
+    by the source's inventory_ids, or by item_type_id (everything of that type). Whole entries
+    move: each leaves the source, and its quantity is added to the target's entry for the same
+    item. Entries move in transactions of up to TRANSFER_CHUNK_SIZE; a 409 says how many moved
+    before a conflict, and a retry moves the rest. Listed items or entries the source does not
+    hold are skipped; the response lists, by item, what moved.
+    """
+    selections = [
+        name for name in ("item_ids", "inventory_ids", "item_type_id") if getattr(transfer, name) is not None
+    ]
+    if len(selections) != 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give exactly one of item_ids, inventory_ids or item_type_id"
+        )
+    source, target = transfer.source, transfer.target
+    if (source.kind, source.id) == (target.kind, target.id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Source and target are the same")
+    selection = selections[0]
+    try:
+        async with db.repository() as repo:
+            result = await repo.transfer_inventory(
+                (source.kind, source.id), (target.kind, target.id), selection, getattr(transfer, selection)
+            )
+    except TransferInterrupted as exc:
+        if isinstance(exc.__cause__, asyncpg.LockNotAvailableError):
+            detail = "Another transfer is using these locations"
+        elif isinstance(exc.__cause__, asyncpg.NumericValueOutOfRangeError):
+            detail = "A target quantity would exceed the largest quantity an entry can hold"
+        else:
+            raise
+        moved = exc.result["entries"]
+        if moved:
+            detail += f"; {moved} entries moved before the transfer stopped, retry to move the rest"
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail) from None
+    if not result["source_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Source {source.kind} not found")
+    if not result["target_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Target {target.kind} not found")
+    return result
@@ -1,80 +1,87 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from typing import List, Optional
 from models import ItemType, ItemTypeCreate
 from database import db
+from etags import check_etag
+from responses import rows_response
+from coalesce import coalesced_response
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, ids_page_size, paginate
 
 router = APIRouter(prefix="/item-types", tags=["item-types"])
 
 
 @router.get("", response_model=List[ItemType])
-async def get_item_types():
-    """Get all item types"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT id, name, description FROM galactic_item_types ORDER BY name")
+async def get_item_types(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    name_prefix: Optional[str] = Query(None, min_length=1, max_length=255),
+    ids: Optional[List[int]] = Query(None, max_length=MAX_PAGE_SIZE)
+):
+    """
+    Get a page of item types, ordered by name.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With ids (repeated, up to 1000), every listed item type that exists is returned in one page.
+    """
+    not_modified = await check_etag(request, response, "item_types")
+    if not_modified:
+        return not_modified
+    last = tuple(decode_cursor(after, (str, int))) if after is not None else None
+    limit = ids_page_size(ids, limit)
+    ids_key = tuple(sorted(set(ids))) if ids else None
+
+    async def load():
+        async with db.repository() as repo:
+            rows = await repo.list_item_types(limit, last, name_prefix, ids)
         return [dict(row) for row in rows]
 
+    async def load_page():
+        rows = await db.cached("item_types", ("list", limit, after, name_prefix, ids_key), load)
+        return paginate(response, rows, limit, key=("name", "id"))
+
+    return await coalesced_response(request, response, load_page)
+
 
 @router.get("/{item_type_id}", response_model=ItemType)
-async def get_item_type(item_type_id: int):
+async def get_item_type(item_type_id: int, request: Request, response: Response):
     """Get a specific item type by ID"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT id, name, description FROM galactic_item_types WHERE id = $1",
-            item_type_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
-        return dict(row)
+    not_modified = await check_etag(request, response, "item_types")
+    if not_modified:
+        return not_modified
+
+    async def load():
+        async with db.repository() as repo:
+            row = await repo.get("item_types", item_type_id)
+        return dict(row) if row else None
+
+    item_type = await db.cached("item_types", item_type_id, load)
+    if not item_type:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
+    return rows_response(response, item_type)
 
 
 @router.post("", response_model=ItemType, status_code=status.HTTP_201_CREATED)
 async def create_item_type(item_type: ItemTypeCreate):
     """Create a new item type"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_item_types (name, description)
-            VALUES ($1, $2)
-            RETURNING id, name, description
-            """,
-            item_type.name,
-            item_type.description
-        )
-        return dict(row)
+    async with db.repository() as repo:
+        return await repo.create("item_types", item_type.name, item_type.description)
 
 
 @router.put("/{item_type_id}", response_model=ItemType)
 async def update_item_type(item_type_id: int, item_type: ItemTypeCreate):
     """Update an existing item type"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            UPDATE galactic_item_types
-            SET name = $1, description = $2
-            WHERE id = $3
-            RETURNING id, name, description
-            """,
-            item_type.name,
-            item_type.description,
-            item_type_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
-        return dict(row)
+    async with db.repository() as repo:
+        row = await repo.update("item_types", item_type_id, item_type.name, item_type.description)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
+    return row
 
 
 @router.delete("/{item_type_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item_type(item_type_id: int):
     """Delete an item type"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM galactic_item_types WHERE id = $1",
-            item_type_id
-        )
-        if result == "DELETE 0":
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
+    async with db.repository() as repo:
+        deleted = await repo.delete("item_types", item_type_id)
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item type not found")
@@ -1,104 +1,175 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-from models import Item, ItemCreate, ItemWithType
+import asyncpg
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from typing import List, Optional
+from models import Item, ItemCreate, ItemWithType, ItemStations, Station, BulkImportResult
 from database import db
+from etags import check_etag
+from bulk import BULK_REQUEST_BODY, import_items, read_bulk_body
+from responses import rows_response
+from coalesce import coalesced_response
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, ids_page_size, paginate
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+DUPLICATE_NAME_DETAIL = "An item with this name already exists"
+UNKNOWN_TYPE_DETAIL = "Item type not found"
+
 
 @router.get("", response_model=List[ItemWithType])
-async def get_items():
-    """Get all items with their type information"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT
-                i.id,
-                i.name,
-                i.description,
-                i.item_type_id,
-                it.name as item_type_name
-            FROM galactic_items i
-            LEFT JOIN galactic_item_types it ON i.item_type_id = it.id
-            ORDER BY i.id
-            """
-        )
-        return [dict(row) for row in rows]
+async def get_items(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    item_type_id: Optional[int] = None,
+    name: Optional[str] = Query(None, min_length=1, max_length=255),
+    name_prefix: Optional[str] = Query(None, min_length=1, max_length=255),
+    ids: Optional[List[int]] = Query(None, max_length=MAX_PAGE_SIZE)
+):
+    """
+    Get a page of items with their type information, ordered by ID.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With name, only the item with that exact name (ignoring case) is returned.
+    With ids (repeated, up to 1000), every listed item that exists is returned in one page.
+    """
+    not_modified = await check_etag(request, response, "items", "item_types", read_only=True)
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+    limit = ids_page_size(ids, limit)
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_items(limit, last_id, item_type_id, name, name_prefix, ids)
+        return paginate(response, rows, limit)
+
+    return await coalesced_response(request, response, load)
+
+
+@router.get("/search", response_model=List[ItemWithType])
+async def search_items(
+    request: Request,
+    response: Response,
+    prefix: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(10, ge=1, le=50),
+    item_type_id: Optional[int] = None
+):
+    """
+    Typeahead search for items whose name starts with prefix (ignoring case).
+    An exact name match ranks first, then shorter names, then alphabetical order.
+    """
+    not_modified = await check_etag(request, response, "items", "item_types", read_only=True)
+    if not_modified:
+        return not_modified
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            return await repo.search_items(prefix, limit, item_type_id)
+
+    return await coalesced_response(request, response, load)
+
+
+@router.get("/stations", response_model=List[ItemStations])
+async def get_stations_for_items(request: Request, response: Response, item_ids: List[int] = Query(...)):
+    """Get the stations holding each of the given items"""
+    not_modified = await check_etag(request, response, "stations", "station_inventory", "items", read_only=True)
+    if not_modified:
+        return not_modified
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.stations_for_items(item_ids)
+        stations_by_item = {item_id: [] for item_id in item_ids}
+        for row in rows:
+            stations_by_item[row["item_id"]].append(
+                {"id": row["id"], "name": row["name"], "description": row["description"]}
+            )
+        return [{"item_id": item_id, "stations": stations} for item_id, stations in stations_by_item.items()]
+
+    return await coalesced_response(request, response, load)
 
 
 @router.get("/{item_id}", response_model=ItemWithType)
-async def get_item(item_id: int):
+async def get_item(item_id: int, request: Request, response: Response):
     """Get a specific item by ID with type information"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            SELECT
-                i.id,
-                i.name,
-                i.description,
-                i.item_type_id,
-                it.name as item_type_name
-            FROM galactic_items i
-            LEFT JOIN galactic_item_types it ON i.item_type_id = it.id
-            WHERE i.id = $1
-            """,
-            item_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
-        return dict(row)
+    not_modified = await check_etag(request, response, "items", "item_types")
+    if not_modified:
+        return not_modified
+
+    return rows_response(response, await _cached_item(item_id))
+
+
+async def _cached_item(item_id: int) -> dict:
+    """An item with its type, from the catalog cache; 404 if it does not exist"""
+    async def load():
+        async with db.repository() as repo:
+            row = await repo.get("items", item_id)
+        return dict(row) if row else None
+
+    item = await db.cached("items", item_id, load)
+    if not item:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    return item
+
+
+@router.get("/{item_id}/stations", response_model=List[Station])
+async def get_item_stations(item_id: int, request: Request, response: Response):
+    """Get all stations that hold a specific item in their inventory"""
+    not_modified = await check_etag(request, response, "stations", "station_inventory", "items", read_only=True)
+    if not_modified:
+        return not_modified
+    await _cached_item(item_id)
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            return await repo.item_stations(item_id)
+
+    return await coalesced_response(request, response, load)
 
 
 @router.post("", response_model=Item, status_code=status.HTTP_201_CREATED)
 async def create_item(item: ItemCreate):
-    """Create a new item"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_items (name, description, item_type_id)
-            VALUES ($1, $2, $3)
-            RETURNING id, name, description, item_type_id
-            """,
-            item.name,
-            item.description,
-            item.item_type_id
-        )
-        return dict(row)
+    """Create a new item (names are unique, ignoring case)"""
+    async with db.repository() as repo:
+        try:
+            return await repo.create("items", item.name, item.description, item.item_type_id)
+        except asyncpg.UniqueViolationError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=DUPLICATE_NAME_DETAIL)
+        except asyncpg.ForeignKeyViolationError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=UNKNOWN_TYPE_DETAIL)
+
+
+@router.post("/bulk", response_model=BulkImportResult, openapi_extra=BULK_REQUEST_BODY)
+async def bulk_create_items(request: Request, atomic: bool = False):
+    """
+    Create many items from an NDJSON or CSV body (chosen by Content-Type).
+    Each row is validated like POST /items; invalid rows are reported by row number and skipped,
+    or abort the whole import when atomic is true.
+    """
+    data, bulk_format = await read_bulk_body(request)
+    async with db.repository() as repo:
+        return await import_items(repo, data, bulk_format, atomic)
 
 
 @router.put("/{item_id}", response_model=Item)
 async def update_item(item_id: int, item: ItemCreate):
     """Update an existing item"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            UPDATE galactic_items
-            SET name = $1, description = $2, item_type_id = $3
-            WHERE id = $4
-            RETURNING id, name, description, item_type_id
-            """,
-            item.name,
-            item.description,
-            item.item_type_id,
-            item_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
-        return dict(row)
+    async with db.repository() as repo:
+        try:
+            row = await repo.update("items", item_id, item.name, item.description, item.item_type_id)
+        except asyncpg.UniqueViolationError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=DUPLICATE_NAME_DETAIL)
+        except asyncpg.ForeignKeyViolationError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=UNKNOWN_TYPE_DETAIL)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    return row
 
 
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(item_id: int):
     """Delete an item"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM galactic_items WHERE id = $1",
-            item_id
-        )
-        if result == "DELETE 0":
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    async with db.repository() as repo:
+        deleted = await repo.delete("items", item_id)
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
@@ -1,148 +1,166 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-from models import Planet, PlanetCreate, PlanetInventory, PlanetInventoryCreate
+import asyncpg
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from typing import List, Optional
+from models import MAX_QUANTITY, Planet, PlanetCreate, PlanetInventory, PlanetInventoryCreate, InventoryAdjustment
 from database import db
+from etags import check_etag
+from responses import rows_response
+from coalesce import coalesced_response
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, ids_page_size, paginate
+from routers.stations import INSUFFICIENT_QUANTITY_DETAIL, QUANTITY_OVERFLOW_DETAIL
 
 router = APIRouter(prefix="/planets", tags=["planets"])
 
 
 @router.get("", response_model=List[Planet])
-async def get_planets():
-    """Get all planets"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT id, name, description FROM galactic_planets ORDER BY id")
-        return [dict(row) for row in rows]
+async def get_planets(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    name_prefix: Optional[str] = Query(None, min_length=1, max_length=255),
+    ids: Optional[List[int]] = Query(None, max_length=MAX_PAGE_SIZE)
+):
+    """
+    Get a page of planets, ordered by ID.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With ids (repeated, up to 1000), every listed planet that exists is returned in one page.
+    """
+    not_modified = await check_etag(request, response, "planets", read_only=True)
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+    limit = ids_page_size(ids, limit)
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_planets(limit, last_id, name_prefix, ids)
+        return paginate(response, rows, limit)
+
+    return await coalesced_response(request, response, load)
 
 
 @router.get("/{planet_id}", response_model=Planet)
-async def get_planet(planet_id: int):
+async def get_planet(planet_id: int, request: Request, response: Response):
     """Get a specific planet by ID"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT id, name, description FROM galactic_planets WHERE id = $1",
-            planet_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
-        return dict(row)
+    not_modified = await check_etag(request, response, "planets")
+    if not_modified:
+        return not_modified
+
+    async def load():
+        async with db.repository() as repo:
+            row = await repo.get("planets", planet_id)
+        return dict(row) if row else None
+
+    planet = await db.cached("planets", planet_id, load)
+    if not planet:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
+    return rows_response(response, planet)
 
 
 @router.post("", response_model=Planet, status_code=status.HTTP_201_CREATED)
 async def create_planet(planet: PlanetCreate):
     """Create a new planet"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_planets (name, description)
-            VALUES ($1, $2)
-            RETURNING id, name, description
-            """,
-            planet.name,
-            planet.description
-        )
-        return dict(row)
+    async with db.repository() as repo:
+        return await repo.create("planets", planet.name, planet.description)
 
 
 @router.put("/{planet_id}", response_model=Planet)
 async def update_planet(planet_id: int, planet: PlanetCreate):
     """Update an existing planet"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            UPDATE galactic_planets
-            SET name = $1, description = $2
-            WHERE id = $3
-            RETURNING id, name, description
-            """,
-            planet.name,
-            planet.description,
-            planet_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
-        return dict(row)
+    async with db.repository() as repo:
+        row = await repo.update("planets", planet_id, planet.name, planet.description)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
+    return row
 
 
 @router.delete("/{planet_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_planet(planet_id: int):
     """Delete a planet"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM galactic_planets WHERE id = $1",
-            planet_id
-        )
-        if result == "DELETE 0":
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
+    async with db.repository() as repo:
+        deleted = await repo.delete("planets", planet_id)
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
 
 
 @router.get("/{planet_id}/inventory", response_model=List[PlanetInventory])
-async def get_planet_inventory(planet_id: int):
+async def get_planet_inventory(
+    planet_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None
+):
     """
-    Get all inventory entries for a specific planet.
-    Note: The galactic_planets_inventory table appears to be missing a galactic_item_id column.
-    This endpoint returns basic inventory records.
+    Get a page of inventory entries for a specific planet, ordered by ID.
+    The cursor for the next page is returned in the X-Next-Cursor header.
     """
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT id, galactic_planet_id
-            FROM galactic_planets_inventory
-            WHERE galactic_planet_id = $1
-            ORDER BY id
-            """,
-            planet_id
-        )
-        return [dict(row) for row in rows]
+    not_modified = await check_etag(
+        request, response, f"planet_inventory:{planet_id}", "planets", "items", read_only=True
+    )
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_planet_inventory(planet_id, limit, last_id)
+        return paginate(response, rows, limit)
+
+    return await coalesced_response(request, response, load)
 
 
 @router.post("/{planet_id}/inventory", response_model=PlanetInventory, status_code=status.HTTP_201_CREATED)
-async def add_to_planet_inventory(planet_id: int):
+async def add_to_planet_inventory(
+    planet_id: int,
+    item_id: Optional[int] = None,
+    quantity: int = Query(1, ge=1, le=MAX_QUANTITY)
+):
     """
-    Add an inventory entry for a planet.
-    Note: The galactic_planets_inventory table appears to be missing a galactic_item_id column.
-    This endpoint creates a basic inventory record.
+    Add quantity units of an item to a planet's inventory (creating the entry if needed).
+    Without item_id, a bare inventory record is created as before items were tracked.
     """
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        planet_exists = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM galactic_planets WHERE id = $1)",
-            planet_id
-        )
-        if not planet_exists:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
-
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_planets_inventory (galactic_planet_id)
-            VALUES ($1)
-            RETURNING id, galactic_planet_id
-            """,
-            planet_id
-        )
-        return dict(row)
+    if item_id is not None:
+        return await _adjust_planet_inventory(planet_id, item_id, quantity)
+    async with db.repository() as repo:
+        row = await repo.add_planet_inventory(planet_id)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
+    return row
+
+
+@router.patch("/{planet_id}/inventory/{item_id}", response_model=PlanetInventory)
+async def adjust_planet_inventory(planet_id: int, item_id: int, adjustment: InventoryAdjustment):
+    """
+    Atomically change the quantity of an item on a planet by delta.
+    A positive delta creates the entry if needed; a decrement below zero is refused with a 409.
+    """
+    return await _adjust_planet_inventory(planet_id, item_id, adjustment.delta)
+
+
+async def _adjust_planet_inventory(planet_id: int, item_id: int, delta: int):
+    try:
+        async with db.repository() as repo:
+            row = await repo.adjust_planet_inventory(planet_id, item_id, delta)
+    except asyncpg.NumericValueOutOfRangeError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=QUANTITY_OVERFLOW_DETAIL) from None
+    if not row["location_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planet not found")
+    if not row["item_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    if row["id"] is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=INSUFFICIENT_QUANTITY_DETAIL)
+    return row
 
 
 @router.delete("/{planet_id}/inventory/{inventory_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_from_planet_inventory(planet_id: int, inventory_id: int):
     """Remove an inventory entry from a planet"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            """
-            DELETE FROM galactic_planets_inventory
-            WHERE id = $1 AND galactic_planet_id = $2
-            """,
-            inventory_id,
-            planet_id
+    async with db.repository() as repo:
+        removed = await repo.remove_planet_inventory(planet_id, inventory_id)
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Inventory entry not found for this planet"
         )
-        if result == "DELETE 0":
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Inventory entry not found for this planet"
-            )
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from typing import List, Optional
+from models import ItemTotal, ItemTypeStationTotal, StationItemTypeTotal
+from database import db
+from etags import check_etag
+from responses import rows_response
+from coalesce import coalesced_response
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, ids_page_size, paginate
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+# Reports are read from totals kept by triggers; a rebuild records an inventory_totals change
+TOTALS_KEY = "inventory_totals"
+
+
+@router.get("/stations/{station_id}/item-types", response_model=List[StationItemTypeTotal])
+async def get_station_item_type_totals(station_id: int, request: Request, response: Response):
+    """
+    How many different items of each type a station holds, and their total quantity.
+    Untyped items are reported under a null item_type_id.
+    """
+    not_modified = await check_etag(
+        request, response, f"station_inventory:{station_id}", "stations", "items", "item_types", TOTALS_KEY,
+        read_only=True
+    )
+    if not_modified:
+        return not_modified
+    async with db.repository(read_only=True) as repo:
+        rows = await repo.station_item_type_totals(station_id)
+    if rows is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    return rows_response(response, rows)
+
+
+@router.get("/item-types/{item_type_id}/stations", response_model=List[ItemTypeStationTotal])
+async def get_item_type_station_totals(
+    item_type_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None
+):
+    """
+    Get a page of the stations holding items of a type, ordered by station ID, with how many
+    different items of the type each holds and their total quantity.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    not_modified = await check_etag(
+        request, response, "station_inventory", "stations", "items", TOTALS_KEY, read_only=True
+    )
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_item_type_station_totals(item_type_id, limit, last_id)
+        return paginate(response, rows, limit, key=("station_id",))
+
+    return await coalesced_response(request, response, load)
+
+
+@router.get("/items", response_model=List[ItemTotal])
+async def get_item_totals(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    item_type_id: Optional[int] = None,
+    ids: Optional[List[int]] = Query(None, max_length=MAX_PAGE_SIZE)
+):
+    """
+    Get a page of items, ordered by ID, with their total stock at stations and on planets.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With ids (repeated, up to 1000), every listed item that exists is returned in one page.
+    """
+    not_modified = await check_etag(
+        request, response, "items", "station_inventory", "planet_inventory", TOTALS_KEY, read_only=True
+    )
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+    limit = ids_page_size(ids, limit)
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_item_totals(limit, last_id, item_type_id, ids)
+        return paginate(response, rows, limit, key=("item_id",))
+
+    return await coalesced_response(request, response, load)
+
+
+@router.get("/items/{item_id}", response_model=ItemTotal)
+async def get_item_total(item_id: int, request: Request, response: Response):
+    """Total stock of an item across every station and planet"""
+    not_modified = await check_etag(
+        request, response, "items", "station_inventory", "planet_inventory", TOTALS_KEY, read_only=True
+    )
+    if not_modified:
+        return not_modified
+    async with db.repository(read_only=True) as repo:
+        row = await repo.item_totals(item_id)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    return rows_response(response, row)
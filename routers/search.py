@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Query, Request, Response
+from typing import List, Literal, Optional
+from models import SearchHit
+from database import db
+from etags import check_etag
+from coalesce import coalesced_response
+from pagination import decode_cursor, paginate
+
+router = APIRouter(tags=["search"])
+
+SearchKind = Literal["item", "item_type", "station", "planet"]
+
+
+@router.get("/search", response_model=List[SearchHit])
+async def search(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=255),
+    kind: Optional[List[SearchKind]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None
+):
+    """
+    Search items, item types, stations and planets by the words in their names and
+    descriptions, and by names similar to q (typos, partial words), best matches first.
+    q takes web search syntax: "quoted phrases", or, and -excluded words. kind (repeated)
+    limits the hits to those kinds. The cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
+    not_modified = await check_etag(request, response, "items", "item_types", "stations", "planets", read_only=True)
+    if not_modified:
+        return not_modified
+    last = tuple(decode_cursor(after, (float, str, int))) if after is not None else None
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.search(q, limit, kind, last)
+        return paginate(response, rows, limit, key=("rank", "kind", "id"))
+
+    return await coalesced_response(request, response, load)
@@ -1,155 +1,195 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-from models import Station, StationCreate, StationInventory, StationInventoryCreate, InventoryItemDetail
+import asyncpg
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from typing import List, Literal, Optional
+from models import (
+    MAX_QUANTITY, Station, StationCreate, StationInventory, StationInventoryCreate, InventoryItemDetail,
+    StationWithInventory, BulkImportResult, InventoryAdjustment
+)
 from database import db
+from etags import check_etag
+from bulk import BULK_REQUEST_BODY, import_station_inventory, read_bulk_body
+from responses import rows_response
+from coalesce import coalesced_response
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, ids_page_size, paginate
 
 router = APIRouter(prefix="/stations", tags=["stations"])
 
-
-@router.get("", response_model=List[Station])
-async def get_stations():
-    """Get all stations"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT id, name, description FROM galactic_stations ORDER BY id")
-        return [dict(row) for row in rows]
+INSUFFICIENT_QUANTITY_DETAIL = "Not enough of this item in inventory"
+QUANTITY_OVERFLOW_DETAIL = "The quantity would exceed the largest quantity an entry can hold"
+
+
+@router.get("", response_model=List[StationWithInventory], response_model_exclude_unset=True)
+async def get_stations(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    name_prefix: Optional[str] = Query(None, min_length=1, max_length=255),
+    include: Optional[Literal["inventory"]] = None,
+    item_type: Optional[List[str]] = Query(None),
+    include_untyped: bool = True,
+    inventory_limit: Optional[int] = Query(None, ge=1),
+    ids: Optional[List[int]] = Query(None, max_length=MAX_PAGE_SIZE)
+):
+    """
+    Get a page of stations, ordered by ID.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With include=inventory each station carries its inventory entries, fetched in the same query.
+    The embedded inventory can be narrowed to the given item type names (untyped items are kept
+    unless include_untyped is false) and capped at inventory_limit entries per station.
+    With ids (repeated, up to 1000), every listed station that exists is returned in one page.
+    """
+    etag_keys = ("stations", "station_inventory", "items", "item_types") if include == "inventory" else ("stations",)
+    not_modified = await check_etag(request, response, *etag_keys, read_only=True)
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+    limit = ids_page_size(ids, limit)
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            if include != "inventory":
+                rows = await repo.list_stations(limit, last_id, name_prefix, ids)
+            else:
+                rows = await repo.list_stations_with_inventory(
+                    limit, last_id, name_prefix, item_type, include_untyped, inventory_limit, ids
+                )
+        return paginate(response, rows, limit)
+
+    return await coalesced_response(request, response, load)
 
 
 @router.get("/{station_id}", response_model=Station)
-async def get_station(station_id: int):
+async def get_station(station_id: int, request: Request, response: Response):
     """Get a specific station by ID"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT id, name, description FROM galactic_stations WHERE id = $1",
-            station_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
-        return dict(row)
+    not_modified = await check_etag(request, response, "stations")
+    if not_modified:
+        return not_modified
+
+    async def load():
+        async with db.repository() as repo:
+            row = await repo.get("stations", station_id)
+        return dict(row) if row else None
+
+    station = await db.cached("stations", station_id, load)
+    if not station:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    return rows_response(response, station)
 
 
 @router.post("", response_model=Station, status_code=status.HTTP_201_CREATED)
 async def create_station(station: StationCreate):
     """Create a new station"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_stations (name, description)
-            VALUES ($1, $2)
-            RETURNING id, name, description
-            """,
-            station.name,
-            station.description
-        )
-        return dict(row)
+    async with db.repository() as repo:
+        return await repo.create("stations", station.name, station.description)
 
 
 @router.put("/{station_id}", response_model=Station)
 async def update_station(station_id: int, station: StationCreate):
     """Update an existing station"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            UPDATE galactic_stations
-            SET name = $1, description = $2
-            WHERE id = $3
-            RETURNING id, name, description
-            """,
-            station.name,
-            station.description,
-            station_id
-        )
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
-        return dict(row)
+    async with db.repository() as repo:
+        row = await repo.update("stations", station_id, station.name, station.description)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    return row
 
 
 @router.delete("/{station_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_station(station_id: int):
     """Delete a station"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM galactic_stations WHERE id = $1",
-            station_id
-        )
-        if result == "DELETE 0":
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    async with db.repository() as repo:
+        deleted = await repo.delete("stations", station_id)
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
 
 
 @router.get("/{station_id}/inventory", response_model=List[InventoryItemDetail])
-async def get_station_inventory(station_id: int):
-    """Get all inventory items for a specific station"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT
-                si.id as inventory_id,
-                i.id as item_id,
-                i.name as item_name,
-                i.description as item_description,
-                it.name as item_type_name
-            FROM galactic_stations_inventory si
-            JOIN galactic_items i ON si.galactic_item_id = i.id
-            LEFT JOIN galactic_item_types it ON i.item_type_id = it.id
-            WHERE si.galactic_station_id = $1
-            ORDER BY si.id
-            """,
-            station_id
-        )
-        return [dict(row) for row in rows]
+async def get_station_inventory(
+    station_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    item_id: Optional[int] = None
+):
+    """
+    Get a page of inventory items for a specific station, ordered by inventory ID.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With item_id, only the entries for that item are returned (an empty list if the station does not hold it).
+    """
+    not_modified = await check_etag(
+        request, response, f"station_inventory:{station_id}", "stations", "items", "item_types", read_only=True
+    )
+    if not_modified:
+        return not_modified
+    last_id = decode_cursor(after, (int,))[0] if after is not None else None
+
+    async def load():
+        async with db.repository(read_only=True) as repo:
+            rows = await repo.list_station_inventory(station_id, limit, last_id, item_id)
+        return paginate(response, rows, limit, key=("inventory_id",))
+
+    return await coalesced_response(request, response, load)
 
 
 @router.post("/{station_id}/inventory", response_model=StationInventory, status_code=status.HTTP_201_CREATED)
-async def add_item_to_station_inventory(station_id: int, item_id: int):
-    """Add an item to a station's inventory"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        station_exists = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM galactic_stations WHERE id = $1)",
-            station_id
-        )
-        if not station_exists:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
-
-        item_exists = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM galactic_items WHERE id = $1)",
-            item_id
-        )
-        if not item_exists:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
-
-        row = await conn.fetchrow(
-            """
-            INSERT INTO galactic_stations_inventory (galactic_station_id, galactic_item_id)
-            VALUES ($1, $2)
-            RETURNING id, galactic_station_id, galactic_item_id
-            """,
-            station_id,
-            item_id
-        )
-        return dict(row)
+async def add_item_to_station_inventory(station_id: int, item_id: int, quantity: int = Query(1, ge=1, le=MAX_QUANTITY)):
+    """Add quantity units of an item to a station's inventory (creating the entry if needed)"""
+    return await _adjust_station_inventory(station_id, item_id, quantity)
+
+
+@router.patch("/{station_id}/inventory/{item_id}", response_model=StationInventory)
+async def adjust_station_inventory(station_id: int, item_id: int, adjustment: InventoryAdjustment):
+    """
+    Atomically change the quantity of an item at a station by delta.
+    A positive delta creates the entry if needed; a decrement below zero is refused with a 409.
+    """
+    return await _adjust_station_inventory(station_id, item_id, adjustment.delta)
+
+
+async def _adjust_station_inventory(station_id: int, item_id: int, delta: int):
+    try:
+        async with db.repository() as repo:
+            row = await repo.adjust_station_inventory(station_id, item_id, delta)
+    except asyncpg.NumericValueOutOfRangeError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=QUANTITY_OVERFLOW_DETAIL) from None
+    if not row["location_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    if not row["item_found"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
+    if row["id"] is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=INSUFFICIENT_QUANTITY_DETAIL)
+    return row
+
+
+@router.post("/{station_id}/inventory/bulk", response_model=BulkImportResult, openapi_extra=BULK_REQUEST_BODY)
+async def bulk_add_items_to_station_inventory(station_id: int, request: Request, atomic: bool = False):
+    """
+    Add many items to a station's inventory from an NDJSON or CSV body (chosen by Content-Type).
+    Each row carries a galactic_item_id and an optional quantity (default 1) that is added to
+    the station's quantity of that item; rows naming unknown items, or pushing an item past
+    the largest quantity, are reported by row number and skipped, or abort the whole import
+    when atomic is true.
+    """
+    data, bulk_format = await read_bulk_body(request)
+    try:
+        async with db.repository() as repo:
+            result = await import_station_inventory(repo, station_id, data, bulk_format, atomic)
+    except asyncpg.NumericValueOutOfRangeError:
+        # A concurrent adjustment raised a quantity after the import checked it
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=QUANTITY_OVERFLOW_DETAIL) from None
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+    return result
 
 
 @router.delete("/{station_id}/inventory/{inventory_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_item_from_station_inventory(station_id: int, inventory_id: int):
     """Remove an item from a station's inventory"""
-    pool = db.get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            """
-            DELETE FROM galactic_stations_inventory
-            WHERE id = $1 AND galactic_station_id = $2
-            """,
-            inventory_id,
-            station_id
+    async with db.repository() as repo:
+        removed = await repo.remove_station_inventory(station_id, inventory_id)
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Inventory entry not found for this station"
         )
-        if result == "DELETE 0":
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Inventory entry not found for this station"
-            )
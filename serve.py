@@ -0,0 +1,107 @@
+"""
+Production entry point: python serve.py [--workers N] [--host HOST] [--port PORT]
+
+Applies pending migrations once, then runs N uvicorn worker processes on one listening socket.
+DB_CONNECTION_BUDGET is split evenly between the workers, and each worker opens its whole pool
+and warms up before it accepts connections. On SIGTERM or SIGINT every worker stops accepting,
+ends its live change streams and waits for in-flight requests before it exits.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import httpx
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from config import settings
+from feed import feed
+from migrate import migrate_database
+
+logger = logging.getLogger(__name__)
+
+# Hot list reads each worker runs once in-process before it accepts connections
+WARMUP_PATHS = ("/item-types", "/items", "/stations", "/planets", "/reports/items")
+
+# Connections a worker holds outside its pool: the change listener
+CONNECTIONS_OUTSIDE_POOL = 1
+
+
+async def warm_up(app) -> None:
+    """
+    Run the hot list reads through the app before the worker accepts connections, so the first
+    requests after a deploy find routes, statements, table and index pages, and the catalog
+    cache already warm. Failures are logged; the worker still starts.
+    """
+    start = time.perf_counter()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warmup") as client:
+        for path in WARMUP_PATHS:
+            response = await client.get(path)
+            if response.status_code != 200:
+                logger.warning("Warm-up read %s answered %d", path, response.status_code)
+    logger.info("Warmed up in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
+def pool_size(budget: int, workers: int) -> int:
+    """Pool size per worker when workers share a budget of connections to one database"""
+    return budget // workers - CONNECTIONS_OUTSIDE_POOL
+
+
+class GracefulServer(uvicorn.Server):
+    """uvicorn server that ends live change streams as soon as it starts draining"""
+
+    async def shutdown(self, sockets=None):
+        # Streams never finish on their own; their clients reconnect to a worker still serving
+        feed.stop()
+        await super().shutdown(sockets=sockets)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the Galactic Inventory API with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=settings.web_concurrency or os.cpu_count() or 1,
+        help="Worker processes (default: WEB_CONCURRENCY, or one per CPU)"
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    size = settings.db_pool_max_size
+    if settings.db_connection_budget:
+        size = pool_size(settings.db_connection_budget, args.workers)
+        if size < 1:
+            parser.error(
+                f"DB_CONNECTION_BUDGET={settings.db_connection_budget} leaves no pooled connection "
+                f"for each of {args.workers} workers"
+            )
+    if settings.migrate_on_startup:
+        asyncio.run(migrate_database(settings.database_url))
+
+    # Spawned workers read their settings from the environment when they start; a single worker
+    # runs in this process and shares the settings object already read
+    os.environ["DB_POOL_MAX_SIZE"] = os.environ["DB_POOL_MIN_SIZE"] = str(size)
+    os.environ["MIGRATE_ON_STARTUP"] = "false"
+    settings.db_pool_max_size = settings.db_pool_min_size = size
+    settings.migrate_on_startup = False
+
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout
+    )
+    server = GracefulServer(config)
+    if args.workers == 1:
+        server.run()
+    else:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Per-request timing and slow statement sampling. Each response carries a Server-Timing header
+splitting its time into pool acquisition, statement execution and JSON encoding. Statements
+slower than a threshold are logged with their parameters, and a sample of them is re-run
+under EXPLAIN (ANALYZE, BUFFERS) into a ring buffer served at /debug/slow-queries.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence
+import asyncpg
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Slow statements kept with their plans
+SLOW_QUERY_SAMPLES = 50
+
+# Longest repr of one statement parameter in logs and samples (ids lists can hold 1000 values)
+MAX_PARAMETER_LENGTH = 200
+
+# Seconds an EXPLAIN ANALYZE re-run may take
+EXPLAIN_TIMEOUT = 30.0
+
+
+class RequestTiming:
+    """Time one request spent waiting for connections, running statements and encoding rows"""
+
+    def __init__(self):
+        self.acquire = 0.0
+        self.db = 0.0
+        self.statements = 0
+        self.serialize = 0.0
+
+    def header(self, total: float) -> str:
+        """Server-Timing value, in milliseconds"""
+        return (
+            f"acquire;dur={self.acquire * 1000:.2f}, "
+            f'db;dur={self.db * 1000:.2f};desc="{self.statements} statement{"" if self.statements == 1 else "s"}", '
+            f"serialize;dur={self.serialize * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+_current: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "galactic_request_timing", default=None
+)
+
+
+def add_acquire(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.acquire += seconds
+
+
+def add_statement(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.db += seconds
+        timing.statements += 1
+
+
+def add_serialize(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.serialize += seconds
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware timing each request and adding its Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        timing = RequestTiming()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                value = timing.header(time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        reset = _current.set(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(reset)
+
+
+def _format_parameters(args: Sequence[Any]) -> List[str]:
+    formatted = []
+    for arg in args:
+        text = repr(arg)
+        if len(text) > MAX_PARAMETER_LENGTH:
+            text = text[:MAX_PARAMETER_LENGTH] + "..."
+        formatted.append(text)
+    return formatted
+
+
+class SlowQueryLog:
+    """
+    Logs statements slower than threshold seconds (0 disables) and re-runs a fraction of them,
+    one at a time, under EXPLAIN (ANALYZE, BUFFERS) in a read-only transaction on an idle
+    connection of the primary's pool, so writes are never re-executed and requests never wait.
+    """
+
+    def __init__(self, pool: Optional[asyncpg.Pool] = None, threshold: float = 0.5, explain_rate: float = 0.1):
+        self.pool = pool
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_SAMPLES)
+        self._explaining = False
+
+    def observe(self, name: str, sql: str, args: Sequence[Any], seconds: float, rows: Optional[int]):
+        if not self.threshold or seconds < self.threshold:
+            return
+        metrics.slow_statements.inc(name)
+        parameters = _format_parameters(args)
+        logger.warning("Slow statement %s took %.1f ms (%s rows), parameters: %s",
+                       name, seconds * 1000, "error" if rows is None else rows, ", ".join(parameters))
+        if (
+            self.pool is None
+            or self._explaining
+            or random.random() >= self.explain_rate
+            or self.pool.get_idle_size() == 0
+        ):
+            return
+        self._explaining = True
+        sample = {
+            "statement": name,
+            "duration_ms": round(seconds * 1000, 2),
+            "rows": rows,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "sql": " ".join(sql.split()),
+            "parameters": parameters,
+        }
+        asyncio.get_running_loop().create_task(self._explain(sample, sql, args))
+
+    async def _explain(self, sample: Dict[str, Any], sql: str, args: Sequence[Any]):
+        try:
+            # Straight from the pool, so the re-run counts towards no request's timing or metrics
+            async with self.pool.acquire(timeout=1.0) as conn:
+                async with conn.transaction(readonly=True):
+                    rows = await conn.fetch(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *args, timeout=EXPLAIN_TIMEOUT
+                    )
+            sample["plan"] = "\n".join(row[0] for row in rows)
+            self.samples.append(sample)
+        except asyncpg.ReadOnlySQLTransactionError:
+            pass  # A write: not re-run
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logger.info("Could not EXPLAIN slow statement %s: %s", sample["statement"], e)
+        finally:
+            self._explaining = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "threshold_seconds": self.threshold,
+            "explain_rate": self.explain_rate,
+            "samples": list(reversed(self.samples)),
+        }